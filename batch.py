@@ -0,0 +1,182 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+from multiprocessing import get_context
+
+import pandas as pd
+
+from config import CONFIG, customer_name, base_name
+from history_loader import FALLBACK_FILES
+
+
+# 工作进程内已读取的共享表：{内容摘要: DataFrame}，同一进程处理后续任务时直接复用
+_shared_frames = {}
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def resolve_job(job: dict) -> dict:
+    """
+    补全任务中的文件路径。
+
+    参数:
+    - job: {"customer": 客户前缀, "input_dir": 输入目录, "output": 输出路径（可选）,
+            "files": {不带前缀的文件名: 路径}（可选，如多个客户共用的新旧料号表）, "profile": 输出内容（可选）}
+
+    返回:
+    - 含 core（核心文件）与 additional（辅助文件）路径的任务；目录中不存在的文件不列出
+    """
+    customer = job["customer"]
+    input_dir = job.get("input_dir", "")
+    files = job.get("files", {})
+
+    def locate(base):
+        path = files.get(base) or os.path.join(input_dir, customer_name(base, customer))
+        return path if os.path.exists(path) else None
+
+    core = {customer_name(base, customer): locate(base) for base in CONFIG["pivot_config"]}
+    additional = {customer_name(base, customer): locate(base) for base in FALLBACK_FILES}
+    output = job.get("output") or os.path.join(
+        input_dir, f"{customer}-运营数据订单-在制-库存汇总报告_{time.strftime('%Y%m%d_%H%M%S')}.xlsx"
+    )
+    return {
+        "customer": customer,
+        "core": {name: path for name, path in core.items() if path},
+        "additional": {name: path for name, path in additional.items() if path},
+        "output": output,
+        "profile": job.get("profile"),
+    }
+
+
+def prepare_shared(jobs: list, shared_dir: str) -> dict:
+    """
+    多个任务共用的辅助文件（内容相同）只解析一次：在主进程读取后 pickle 到 shared_dir，
+    工作进程直接读取 pickle，不再重复解析 xlsx。
+
+    返回:
+    - {文件路径: (内容摘要, pickle 路径)}
+    """
+    digests, users = {}, {}
+    for job in jobs:
+        for name, path in job["additional"].items():
+            digest = digests.setdefault(path, _file_digest(path))
+            sheet_name = FALLBACK_FILES[base_name(name, job["customer"])]
+            users.setdefault((digest, sheet_name), []).append(path)
+
+    shared = {}
+    for (digest, sheet_name), paths in users.items():
+        if len(paths) < 2:
+            continue
+        pickle_path = os.path.join(shared_dir, f"{digest}-{sheet_name}.pkl")
+        df = pd.read_excel(paths[0], sheet_name=sheet_name)
+        with open(pickle_path, "wb") as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        for path in paths:
+            shared[path] = (f"{digest}-{sheet_name}", pickle_path)
+    return shared
+
+
+def _load_additional(path: str, sheet_name, shared: dict) -> pd.DataFrame:
+    """读取辅助文件：共享文件优先使用进程内缓存，其次读取主进程准备的 pickle"""
+    if path not in shared:
+        return pd.read_excel(path, sheet_name=sheet_name)
+    key, pickle_path = shared[path]
+    if key not in _shared_frames:
+        with open(pickle_path, "rb") as f:
+            _shared_frames[key] = pickle.load(f)
+    return _shared_frames[key]
+
+
+def run_job(job: dict, shared: dict = None) -> dict:
+    """
+    在工作进程中生成一个客户的报告。
+
+    返回:
+    - {"customer", "output", "seconds", "error"}，成功时 error 为 None
+    """
+    from pivot_processor import PivotProcessor
+
+    start = time.perf_counter()
+    customer = job["customer"]
+    try:
+        additional_sheets = {}
+        for name, path in job["additional"].items():
+            sheet_name = FALLBACK_FILES[base_name(name, customer)]
+            additional_sheets[name.replace(".xlsx", "")] = _load_additional(path, sheet_name, shared or {})
+
+        uploaded_files = {}
+        for name, path in job["core"].items():
+            with open(path, "rb") as f:
+                uploaded_files[name] = BytesIO(f.read())
+
+        buffer = BytesIO()
+        result = PivotProcessor(customer=customer, profile=job.get("profile")).process(uploaded_files, buffer, additional_sheets)
+        if result is None:
+            raise RuntimeError("报告生成失败（缺少核心数据或合并失败）")
+
+        os.makedirs(os.path.dirname(os.path.abspath(job["output"])), exist_ok=True)
+        with open(job["output"], "wb") as f:
+            f.write(result[0])
+        error = None
+    except Exception as e:
+        error = str(e)
+    return {"customer": customer, "output": job["output"], "seconds": time.perf_counter() - start, "error": error}
+
+
+def run_batch(jobs: list, max_workers: int = None) -> list:
+    """
+    多客户批量生成报告：每个客户一个任务，在进程池中并行执行。
+
+    参数:
+    - jobs: 任务列表，格式见 resolve_job
+    - max_workers: 进程数，默认为 CPU 核数
+
+    返回:
+    - 各任务的结果（顺序与 jobs 一致）
+
+    多个客户共用的辅助文件只解析一次；新旧料号表的编译结果按内容摘要缓存在磁盘上（见 mapping_store），
+    各进程之间共用。
+    """
+    jobs = [resolve_job(job) for job in jobs]
+    results = [None] * len(jobs)
+    with tempfile.TemporaryDirectory(prefix="semiexcel-batch-") as shared_dir:
+        shared = prepare_shared(jobs, shared_dir)
+        # spawn：工作进程不继承主进程的线程（上传队列、预取线程池等）
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as pool:
+            futures = {pool.submit(run_job, job, shared): idx for idx, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                status = "✅" if result["error"] is None else f"❌ {result['error']}"
+                print(f"{status} {result['customer']}：{result['output']}（{result['seconds']:.1f} 秒）")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多客户批量生成汇总报告")
+    parser.add_argument("jobs", help="任务列表 JSON 文件：[{\"customer\": ..., \"input_dir\": ..., \"output\": ...}, ...]")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为 CPU 核数")
+    args = parser.parse_args()
+
+    with open(args.jobs, "r", encoding="utf-8") as f:
+        jobs = json.load(f)
+    results = run_batch(jobs, args.workers)
+    failed = [result for result in results if result["error"] is not None]
+    print(f"完成 {len(results) - len(failed)} / {len(results)} 个客户")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,78 @@
 from datetime import datetime
 
+# 输出内容配置：是否写出原始辅助表（预测、安全库存、明细等），是否执行格式化（列宽、表头样式、标红）
+OUTPUT_PROFILES = {
+    "full": {"label": "完整报告", "source_sheets": True, "styling": True},
+    "summary": {"label": "仅汇总与透视表", "source_sheets": False, "styling": True},
+    "data": {"label": "仅汇总与透视表（无格式）", "source_sheets": False, "styling": False},
+}
+
+# 默认客户（文件名前缀）
+DEFAULT_CUSTOMER = "赛卓"
+
 CONFIG = {
     "input_dir": r"D:\运营数据\原始数据",
+    # 默认客户前缀：文件名与 sheet 名为 "<客户>-<表名>"，下方 pivot_config / detail_config 按不带前缀的表名配置；
+    # 各会话选择的客户保存在 st.session_state 中并作为参数传入，运行时不修改此项
+    "customer": DEFAULT_CUSTOMER,
+    "output_profile": "full",
+    # GitHub 历史文件的本地缓存：max_age 秒内直接使用缓存（None 表示每次用 ETag 校验），offline 时只读缓存
+    "github_cache": {"dir": ".github_cache", "max_age": None, "offline": False},
+    # 后台上传队列：失败后按 retry_interval 起步指数退避，最长 max_retry_interval 秒
+    "upload_queue": {"dir": ".upload_queue", "retry_interval": 30, "max_retry_interval": 600},
+    # 明细事实库：到货/销货/下单明细按期间增量入库（每次上传的明细覆盖其中出现的月份），月度汇总由各期间的预计算结果得到；
+    # 销货明细与下单明细没有可靠的行级业务键（单号可重复），在配置 detail_config 的 key 之前默认关闭
+    "fact_store": {"enabled": False, "path": ".fact_store/facts.sqlite"},
+    # 新旧料号表的编译结果（列命名、料号闭包、半成品与产品维度），按映射表内容摘要缓存
+    "mapping_cache": {"dir": ".mapping_cache"},
+    # 列宽估算：按表头 + 不超过 sample_rows 行的样本计算，相同结构的表复用缓存的列宽
+    "column_widths": {"cache": ".column_widths.json", "sample_rows": 1000, "cache_size": 256},
+    # 内存预算模式：数值列无损降为 float32 / int32，低基数文本列（不同取值占比不超过 max_category_ratio）转为 category
+    "memory_budget": {
+        "enabled": False,
+        "categorical_columns": ["仓库名称", "工作中心", "封装形式"],
+        "max_category_ratio": 0.5,
+    },
+    # 报告范围（草稿报告）：只保留指定 晶圆品名 / 规格 / 品名，或品名匹配 pattern 的产品，全部为空时不筛选；
+    # details 为 True 时明细表也先按范围筛选再直接汇总（草稿不写入明细事实库）
+    "scope": {"晶圆品名": [], "规格": [], "品名": [], "pattern": "", "details": True},
     "output_file": r"D:\运营数据\Report\运营数据订单-在制-库存汇总报告_{}.xlsx".format(datetime.now().strftime("%Y%m%d_%H%M%S")),
+    # 明细表字段（表名不带客户前缀）：日期列按月汇总，品名列为汇总键，values 为汇总的数值列；
+    # key 为业务键列（唯一标识一行明细，如 单号 + 序号），省略时以整行内容作为键
+    "detail_config": {
+        "到货明细": {"date": "到货日期", "name": "品名", "values": ["允收数量"], "key": ["到货单号", "序号"]},
+        "销货明细": {"date": "交易日期", "name": "品名", "values": ["数量", "原币金额"]},
+        "下单明细": {"date": "下单日期", "name": "回货明细_回货品名", "values": ["回货明细_回货数量"]},
+    },
     "pivot_config": {
-        "赛卓-未交订单.xlsx": {
+        "未交订单.xlsx": {
             "index": ["晶圆品名", "规格", "品名"],
             "columns": "预交货日",
             "values": ["订单数量", "未交订单数量"],
             "aggfunc": "sum",
             "date_format": "%Y-%m"
         },
-        "赛卓-成品在制.xlsx": {
+        "成品在制.xlsx": {
             "index": ["工作中心", "封装形式", "晶圆型号", "产品规格", "产品品名"],
             "columns": "预计完工日期",
             "values": ["未交"],
             "aggfunc": "sum",
             "date_format": "%Y-%m"
         },
-        "赛卓-CP在制.xlsx": {
+        "CP在制.xlsx": {
             "index": ["晶圆型号", "产品品名"],
             "columns": "预计完工日期",
             "values": ["未交"],
             "aggfunc": "sum",
             "date_format": "%Y-%m"
         },
-        "赛卓-成品库存.xlsx": {
+        "成品库存.xlsx": {
             "index": ["WAFER品名", "规格", "品名"],
             "columns": "仓库名称",
             "values": ["数量"],
             "aggfunc": "sum"
         },
-        "赛卓-晶圆库存.xlsx": {
+        "晶圆库存.xlsx": {
             "index": ["WAFER品名", "规格"],
             "columns": "仓库名称",
             "values": ["数量"],
@@ -39,3 +80,14 @@ CONFIG = {
         }
     }
 }
+
+
+def customer_name(base: str, customer: str = None) -> str:
+    """加上客户前缀的文件名 / sheet 名，如 customer_name("未交订单.xlsx") -> "赛卓-未交订单.xlsx" """
+    return f"{customer or CONFIG['customer']}-{base}"
+
+
+def base_name(name: str, customer: str = None) -> str:
+    """去掉客户前缀，得到配置中使用的表名；不带该客户前缀时原样返回"""
+    prefix = f"{customer or CONFIG['customer']}-"
+    return name[len(prefix):] if name.startswith(prefix) else name
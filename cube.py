@@ -0,0 +1,152 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+def resolve_months(months, start_year: int) -> list:
+    """按出现顺序解析一串不带年份的月份：月份回落时进入下一年（如 11, 12, 1, 2）"""
+    periods, year, prev = [], start_year, None
+    for month in months:
+        if prev is not None and month < prev:
+            year += 1
+        periods.append(pd.Period(year=year, month=month, freq="M"))
+        prev = month
+    return periods
+
+
+def period_columns(columns, pattern: str) -> dict:
+    """
+    按正则从列名中找出月度列，返回 {月份或 Period: 列名}，保持列的原有顺序。
+
+    pattern 含命名组 month，可选命名组 year；含 year 时键为 Period，否则为月份数字。
+    """
+    regex = re.compile(pattern)
+    found = {}
+    for col in columns:
+        match = regex.fullmatch(str(col))
+        if not match:
+            continue
+        groups = match.groupdict()
+        month = int(groups["month"])
+        key = pd.Period(year=int(groups["year"]), month=month, freq="M") if groups.get("year") else month
+        found.setdefault(key, col)
+    return found
+
+
+def _widen(dtype) -> np.dtype:
+    """汇总结果按 64 位输出：降精度的 float32 / int32 明细求和后恢复为 float64 / int64"""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return np.dtype("float64")
+    if dtype.kind in "iu":
+        return np.dtype("int64")
+    return dtype
+
+
+class MonthlyCube:
+    """
+    品名 × 月份（Period） × 指标 的三维数值立方体，底层为 float64 的 NumPy 数组。
+
+    - products: 品名（pd.Index），periods: 月份（pd.PeriodIndex），measures: 指标名列表
+    - 各指标记录原始数值类型，展开为表格时还原（整数数量不变成浮点）
+    - 缺失的品名 / 月份读取为 0，月份按真实年份区分，跨年不会混淆
+    """
+
+    def __init__(self, products, periods, measures, values: np.ndarray = None, dtypes: dict = None):
+        self.products = pd.Index(products)
+        self.periods = pd.PeriodIndex(periods, freq="M")
+        self.measures = list(measures)
+        shape = (len(self.products), len(self.periods), len(self.measures))
+        self.values = np.zeros(shape) if values is None else np.asarray(values, dtype=float).reshape(shape)
+        self.dtypes = {measure: np.dtype("float64") for measure in self.measures}
+        self.dtypes.update({measure: _widen(dtype) for measure, dtype in (dtypes or {}).items()})
+
+    @classmethod
+    def from_records(cls, names, periods, values: dict, dtypes: dict = None):
+        """
+        由明细记录汇总（相同 品名 × 月份 求和）。
+
+        参数:
+        - names: 品名序列
+        - periods: 与 names 等长的 Period 序列，缺失的记录被忽略
+        - values: {指标名: 与 names 等长的数值序列}
+        - dtypes: 各指标的原始数值类型，默认取 values 的类型
+        """
+        names = pd.Series(names).astype(str).reset_index(drop=True)
+        periods = pd.Series(pd.PeriodIndex(periods, freq="M"))
+        valid = periods.notna().to_numpy()
+
+        product_codes, products = pd.factorize(names[valid], sort=True)
+        period_codes, uniques = pd.factorize(periods[valid], sort=True)
+        measures = list(values)
+        cube = cls(products, pd.PeriodIndex(uniques, freq="M"), measures, dtypes={
+            measure: (dtypes or {}).get(measure, pd.Series(values[measure]).dtype) for measure in measures
+        })
+        for k, measure in enumerate(measures):
+            data = pd.to_numeric(pd.Series(values[measure]).reset_index(drop=True)[valid], errors="coerce")
+            np.add.at(cube.values[:, :, k], (product_codes, period_codes), data.fillna(0).to_numpy(dtype=float))
+        return cube
+
+    @classmethod
+    def from_columns(cls, df: pd.DataFrame, name_col: str, columns: dict):
+        """
+        从宽表读取：columns 为 {指标名: {Period: 列名}}，品名轴与 df 的行一一对应。
+        非数值内容按 0 处理。
+        """
+        periods = sorted({period for mapping in columns.values() for period in mapping})
+        cube = cls(df[name_col].astype(str), periods, list(columns))
+        for measure, mapping in columns.items():
+            for period, col in mapping.items():
+                cube.set(measure, period, pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype=float))
+        return cube
+
+    def _measure_index(self, measure):
+        return self.measures.index(measure)
+
+    def get(self, measure, period) -> np.ndarray:
+        """某指标某月各品名的数值；月份或指标不存在时为 0"""
+        if measure not in self.measures or period not in self.periods:
+            return np.zeros(len(self.products))
+        return self.values[:, self.periods.get_loc(period), self._measure_index(measure)]
+
+    def set(self, measure, period, values):
+        """写入某指标某月的数值，必要时扩展月份轴与指标轴"""
+        if measure not in self.measures:
+            self.measures.append(measure)
+            self.dtypes[measure] = np.dtype("float64")
+            self.values = np.concatenate([self.values, np.zeros(self.values.shape[:2] + (1,))], axis=2)
+        if period not in self.periods:
+            periods = self.periods.append(pd.PeriodIndex([period], freq="M")).sort_values()
+            self.values = self._take(self.values, self.periods, periods, axis=1)
+            self.periods = periods
+        self.values[:, self.periods.get_loc(period), self._measure_index(measure)] = values
+
+    @staticmethod
+    def _take(values, source, target, axis):
+        """按 target 重新排列 source 轴，不存在的位置补 0"""
+        indexer = pd.Index(source).get_indexer(target)
+        taken = np.take(values, np.maximum(indexer, 0), axis=axis) if len(source) else \
+            np.zeros(values.shape[:axis] + (len(target),) + values.shape[axis + 1:])
+        mask_shape = [1] * values.ndim
+        mask_shape[axis] = len(target)
+        return np.where((indexer >= 0).reshape(mask_shape), taken, 0.0)
+
+    def align(self, products) -> "MonthlyCube":
+        """按给定品名顺序（可重复）重排品名轴，不存在的品名为 0"""
+        products = pd.Index(pd.Series(products).astype(str))
+        values = self._take(self.values, self.products, products, axis=0)
+        return MonthlyCube(products, self.periods, self.measures, values, self.dtypes)
+
+    def column(self, measure, period) -> np.ndarray:
+        """与 get 相同，但按指标的原始数值类型返回，用于写出到表格"""
+        values = self.get(measure, period)
+        dtype = self.dtypes.get(measure, np.dtype("float64"))
+        return values.astype(dtype) if dtype.kind in "iuf" else values
+
+    def to_frame(self, measure, label=lambda period: str(period)) -> pd.DataFrame:
+        """展开为宽表：行为品名，列为 label(月份)"""
+        return pd.DataFrame(
+            {label(period): self.column(measure, period) for period in self.periods},
+            index=self.products
+        )
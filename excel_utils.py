@@ -1,12 +1,19 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
 import pandas as pd
 import streamlit as st
-import re
 from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment, Font
 from openpyxl.styles import PatternFill
 from openpyxl.worksheet.table import Table, TableStyleInfo
-from openpyxl.cell.cell import MergedCell
+
+from config import CONFIG
 
 
 def standardize(val):
@@ -42,19 +49,6 @@ def clean_df(df):
     return df
 
 
-def clear_nan_cells(ws):
-    """
-    遍历指定工作表，将 'nan'、'NaN'、None 和空字符串统一清空。
-    """
-    for row in ws.iter_rows():
-        for cell in row:
-            if isinstance(cell, MergedCell):
-                continue
-            val = cell.value
-            if val is None or (isinstance(val, float) and pd.isna(val)) or str(val).strip().lower() == "nan":
-                cell.value = ""
-
-
 def clean_key_fields(df, field_map):
     for col in [field_map["规格"], field_map["品名"], field_map["晶圆品名"]]:
         df[col] = (
@@ -85,41 +79,140 @@ def adjust_column_width(writer, sheet_name, df):
     - df: 对应写入工作表的 DataFrame 数据
     """
     worksheet = writer.sheets[sheet_name]
-    for idx, col in enumerate(df.columns, 1):
-        # 获取该列中所有字符串长度的最大值
-        max_content_len = df[col].astype(str).str.len().max()
-        header_len = len(str(col))
-        column_width = max(max_content_len, header_len) * 1.2 + 8
-        worksheet.column_dimensions[get_column_letter(idx)].width = min(column_width, 50)
+    for idx, width in enumerate(column_widths(df), 1):
+        worksheet.column_dimensions[get_column_letter(idx)].width = width
 
-def adjust_column_width_ws(ws):
-    """
-    根据每个单元格内容长度，自动调整 openpyxl Worksheet 的列宽。
-    """
-    column_widths = {}
-    for row in ws.iter_rows(values_only=True):
-        for i, cell in enumerate(row):
-            if cell is not None:
-                width = len(str(cell))
-                if i in column_widths:
-                    column_widths[i] = max(column_widths[i], width)
-                else:
-                    column_widths[i] = width
 
-    for i, width in column_widths.items():
-        col_letter = get_column_letter(i + 1)
-        ws.column_dimensions[col_letter].width = width + 12  # 可调节 +2 缓冲
+# 宽字符（中日韩文字、全角符号）在 Excel 中约占两个字符宽
+WIDE_CHARS = re.compile(
+    "[\u1100-\u115f\u2e80-\u303e\u3041-\u33ff\u3400-\u4dbf\u4e00-\u9fff"
+    "\ua000-\ua4cf\uac00-\ud7a3\uf900-\ufaff\ufe30-\ufe4f\uff00-\uff60\uffe0-\uffe6]"
+)
 
+_width_cache = None
+_width_cache_lock = threading.Lock()
 
 
+def display_width(text) -> int:
+    """字符串的显示宽度：宽字符按 2 计，其余按 1 计"""
+    text = str(text)
+    return len(text) + len(WIDE_CHARS.findall(text))
 
 
+def sample_positions(n: int, size: int) -> np.ndarray:
+    """
+    在 n 行中取不超过 size 行的样本位置：首尾各四分之一，其余在中间等距选取。
+    行数不超过 size 时返回全部行。
+    """
+    if n <= size:
+        return np.arange(n)
+    edge = size // 4
+    middle = np.linspace(edge, n - edge - 1, size - 2 * edge).astype(int)
+    return np.unique(np.concatenate([np.arange(edge), middle, np.arange(n - edge, n)]))
+
+
+def _schema_key(df) -> str:
+    """DataFrame 结构（列名 + 类型）的摘要，作为列宽缓存的键"""
+    schema = json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()], ensure_ascii=False)
+    return hashlib.sha1(schema.encode("utf-8")).hexdigest()
+
+
+def _load_width_cache() -> dict:
+    global _width_cache
+    if _width_cache is None:
+        path = CONFIG.get("column_widths", {}).get("cache")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                _width_cache = json.load(f)
+        except (TypeError, OSError, ValueError):
+            _width_cache = {}
+    return _width_cache
+
+
+def _save_width_cache():
+    path = CONFIG.get("column_widths", {}).get("cache")
+    if not path:
+        return
+    try:
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_width_cache, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"⚠️ 列宽缓存写入失败：{e}")
+
+
+def column_widths(df, sample_rows: int = None, use_cache: bool = True):
+    """
+    按内容长度计算 DataFrame 各列在 Excel 中的列宽（上限 50）。
+
+    - 只取表头与不超过 sample_rows 行的样本估算，计算量不随数据量增长
+    - 中日韩文字等宽字符按两个字符宽计算
+    - 相同结构（列名 + 类型）的表复用缓存的列宽，缓存保存在 CONFIG["column_widths"]["cache"]
 
+    参数:
+    - df: 要写出的 DataFrame
+    - sample_rows: 样本行数，默认取 CONFIG["column_widths"]["sample_rows"]
+    - use_cache: 是否读写列宽缓存
+    """
+    width_config = CONFIG.get("column_widths", {})
+    key = _schema_key(df) if use_cache else None
+    if key:
+        with _width_cache_lock:
+            cached = _load_width_cache().get(key)
+        if cached is not None:
+            return list(cached)
+
+    sample = df.iloc[sample_positions(len(df), sample_rows or width_config.get("sample_rows", 1000))]
+    widths = []
+    for i, col in enumerate(df.columns):
+        # 获取样本中字符串显示宽度的最大值
+        values = sample.iloc[:, i].astype(str)
+        max_content_len = (values.str.len() + values.str.count(WIDE_CHARS.pattern)).max() if len(values) else 0
+        header_len = display_width(col)
+        column_width = max(max_content_len, header_len) * 1.2 + 8
+        widths.append(float(min(column_width, 50)))
+
+    if key:
+        with _width_cache_lock:
+            cache = _load_width_cache()
+            cache[key] = widths
+            # 只保留最近的若干种结构，旧条目按写入顺序淘汰
+            for stale in list(cache)[:-width_config.get("cache_size", 256)]:
+                del cache[stale]
+            _save_width_cache()
+    return widths
+
+def adjust_column_width_ws(ws, sample_rows: int = None):
+    """
+    根据单元格内容的显示宽度，自动调整 openpyxl Worksheet 的列宽。
+    只检查表头所在的前两行与不超过 sample_rows 行的样本。
+    """
+    sample_rows = sample_rows or CONFIG.get("column_widths", {}).get("sample_rows", 1000)
+    header_rows = min(ws.max_row, 2)
+    rows = [1, 2][:header_rows] + [header_rows + 1 + int(pos) for pos in
+                                   sample_positions(ws.max_row - header_rows, sample_rows)]
+
+    column_widths = {}
+    for row_idx in rows:
+        for row in ws.iter_rows(min_row=row_idx, max_row=row_idx, values_only=True):
+            for i, cell in enumerate(row):
+                if cell is not None:
+                    width = display_width(cell)
+                    if i in column_widths:
+                        column_widths[i] = max(column_widths[i], width)
+                    else:
+                        column_widths[i] = width
+
+    for i, width in column_widths.items():
+        col_letter = get_column_letter(i + 1)
+        ws.column_dimensions[col_letter].width = width + 12  # 可调节 +2 缓冲
 
 
 def merge_header_for_summary(ws, df, label_ranges):
     """
-    给指定汇总列添加顶部合并行标题（如“安全库存”“未交订单”）
+    给指定汇总列添加顶部合并行标题（如“安全库存”“未交订单”）。
+    第 1 行需在写入数据时预留（表头从第 2 行开始），这里直接写入合并标题，不再整体下移单元格。
 
     参数:
     - ws: openpyxl worksheet
@@ -131,8 +224,6 @@ def merge_header_for_summary(ws, df, label_ranges):
         }
     """
 
-    # 插入一行作为新表头（原表头往下挪）
-    ws.insert_rows(1)
     header_row = list(df.columns)
 
     for label, (start_col_name, end_col_name) in label_ranges.items():
@@ -0,0 +1,248 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from config import CONFIG
+from cube import MonthlyCube
+from memory_utils import widen_numeric
+from pipeline import hash_bytes, hash_frame
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    measure TEXT NOT NULL,
+    period TEXT,
+    name TEXT,
+    value NUMERIC,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (kind, key, measure)
+);
+CREATE INDEX IF NOT EXISTS facts_partition ON facts (kind, period);
+
+CREATE TABLE IF NOT EXISTS partition_sums (
+    kind TEXT NOT NULL,
+    period TEXT NOT NULL,
+    name TEXT NOT NULL,
+    measure TEXT NOT NULL,
+    value NUMERIC,
+    PRIMARY KEY (kind, name, period, measure)
+);
+
+CREATE TABLE IF NOT EXISTS merges (
+    kind TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    rows INTEGER,
+    PRIMARY KEY (kind, digest)
+);
+
+CREATE TABLE IF NOT EXISTS measures (
+    kind TEXT NOT NULL,
+    measure TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    PRIMARY KEY (kind, measure)
+);
+
+CREATE TABLE IF NOT EXISTS versions (
+    kind TEXT PRIMARY KEY,
+    version TEXT NOT NULL
+);
+"""
+
+
+def _natural_keys(df: pd.DataFrame, key_cols=None) -> pd.Series:
+    """
+    明细行的自然键：键列（默认整行）的哈希 + 相同行中的出现序号。
+    同一份导出重复入库得到相同的键；导出中本就重复的行仍各自保留。
+    以整行为键时，非数值字段（如审核码）变化后键也随之变化，旧行由 merge 的按期间替换清除。
+    """
+    subset = df[key_cols] if key_cols else df
+    # 内存预算模式下的 float32 / int32 / category 列按原始类型计算哈希，与未压缩时的键一致
+    subset = widen_numeric(subset).astype({
+        col: object for col, dtype in subset.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)
+    })
+    hashes = pd.util.hash_pandas_object(subset, index=False)
+    occurrence = hashes.groupby(hashes).cumcount()
+    return pd.Series([f"{h:016x}-{n}" for h, n in zip(hashes, occurrence)], index=df.index)
+
+
+def _sql_values(values) -> list:
+    """转为 sqlite 可接受的 Python 值，NaN 写为 NULL"""
+    return [None if pd.isna(val) else val for val in values.tolist()]
+
+
+class FactStore:
+    """
+    到货 / 销货 / 下单明细的本地增量事实库（SQLite）。
+
+    - facts: 每行明细按 (kind, 自然键, 数值列) 保存，期间为 YYYY-MM
+    - partition_sums: 每个期间 × 品名 的汇总，索引 (品名, 期间)
+    - merge: 新数据中出现的期间整体替换（源表中删除的行随之删除），其余期间保留；
+      配置了业务键时，键已存在于其他期间的行（日期被修改）从旧期间移除。
+      只重算涉及的期间；与最近一次合并相同的内容直接跳过
+    - cube: 由各期间汇总得到 品名 × 月份 × 数值列 的 MonthlyCube
+
+    kind 为明细表名（如 "赛卓-到货明细"），字段配置见 CONFIG["detail_config"]。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """打开连接并在一个事务中执行，结束后关闭连接"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _version(conn, kind: str) -> str:
+        row = conn.execute("SELECT version FROM versions WHERE kind = ?", (kind,)).fetchone()
+        return row[0] if row else ""
+
+    def version(self, kind: str) -> str:
+        """kind 当前数据的版本号，每次有效合并后变化"""
+        with self._connect() as conn:
+            return self._version(conn, kind)
+
+    def merge(self, kind: str, df: pd.DataFrame, spec: dict, digest: str = None) -> str:
+        """
+        将明细 DataFrame 合并入库。
+
+        参数:
+        - kind: 明细表名
+        - df: 明细数据
+        - spec: {"date": 日期列, "name": 品名列, "values": [数值列], "key": 业务键列（可选，默认整行）}
+        - digest: df 的内容摘要，与最近一次合并的内容相同时直接跳过
+
+        df 视为其中各期间（含日期无法解析的行）的完整数据：这些期间原有的行先全部删除再写入。
+
+        返回:
+        - 合并后的版本号
+        """
+        digest = digest or hash_frame(df)
+        value_cols = spec["values"]
+
+        with self._lock, self._connect() as conn:
+            # 只有与最近一次合并的内容相同时才跳过：A → B → A 时第三次合并需要重新覆盖 B 的期间
+            last = conn.execute(
+                "SELECT digest FROM merges WHERE kind = ? ORDER BY rowid DESC LIMIT 1", (kind,)
+            ).fetchone()
+            if last and last[0] == digest:
+                return self._version(conn, kind)
+
+            periods = pd.to_datetime(df[spec["date"]], errors="coerce").dt.strftime("%Y-%m")
+            names = df[spec["name"]].astype(str)
+            keys = _natural_keys(df, spec.get("key"))
+            numeric = {col: pd.to_numeric(df[col], errors="coerce") for col in value_cols}
+
+            # 本次数据覆盖的期间整体替换
+            replaced = sorted(set(periods.dropna()))
+            conn.executemany("DELETE FROM facts WHERE kind = ? AND period = ?", ((kind, period) for period in replaced))
+            if periods.isna().any():
+                conn.execute("DELETE FROM facts WHERE kind = ? AND period IS NULL", (kind,))
+
+            # 键已存在于其他期间（日期被修改）的行，旧期间也需要重算
+            conn.execute("CREATE TEMP TABLE incoming (key TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO incoming VALUES (?)", ((key,) for key in keys))
+            touched = set(replaced)
+            touched.update(row[0] for row in conn.execute(
+                "SELECT DISTINCT f.period FROM facts f JOIN incoming i ON f.key = i.key "
+                "WHERE f.kind = ? AND f.period IS NOT NULL", (kind,)
+            ))
+            conn.execute("DROP TABLE incoming")
+
+            start = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM facts WHERE kind = ?", (kind,)).fetchone()[0]
+            seq = range(start + 1, start + 1 + len(df))
+            period_values = _sql_values(periods)
+            name_values = names.tolist()
+            for col in value_cols:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO facts (kind, key, measure, period, name, value, seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    zip([kind] * len(df), keys.tolist(), [col] * len(df), period_values, name_values,
+                        _sql_values(numeric[col]), seq)
+                )
+
+            self._rebuild_partitions(conn, kind, sorted(touched))
+            self._record_dtypes(conn, kind, {col: numeric[col].dtype for col in value_cols})
+
+            version = hash_bytes(f"{self._version(conn, kind)}|{digest}".encode("utf-8"))
+            conn.execute("INSERT OR REPLACE INTO versions (kind, version) VALUES (?, ?)", (kind, version))
+            # INSERT OR REPLACE 重新插入，rowid 最大的即最近一次合并
+            conn.execute("INSERT OR REPLACE INTO merges (kind, digest, rows) VALUES (?, ?, ?)", (kind, digest, len(df)))
+        return version
+
+    @staticmethod
+    def _rebuild_partitions(conn, kind, periods):
+        """按入库顺序重新汇总指定期间（与 pandas groupby 求和方式一致）"""
+        for period in periods:
+            facts = pd.read_sql_query(
+                "SELECT name, measure, value FROM facts WHERE kind = ? AND period = ? ORDER BY seq",
+                conn, params=(kind, period)
+            )
+            conn.execute("DELETE FROM partition_sums WHERE kind = ? AND period = ?", (kind, period))
+            if facts.empty:
+                continue
+            facts["value"] = pd.to_numeric(facts["value"], errors="coerce")
+            sums = facts.groupby(["name", "measure"], sort=False)["value"].sum().reset_index()
+            conn.executemany(
+                "INSERT INTO partition_sums (kind, period, name, measure, value) VALUES (?, ?, ?, ?, ?)",
+                ((kind, period, name, measure, val) for name, measure, val in
+                 zip(sums["name"], sums["measure"], _sql_values(sums["value"])))
+            )
+
+    @staticmethod
+    def _record_dtypes(conn, kind, dtypes: dict):
+        """记录数值列类型：任一批次为浮点则按浮点输出，保证与直接汇总的结果类型一致"""
+        for col, dtype in dtypes.items():
+            row = conn.execute("SELECT dtype FROM measures WHERE kind = ? AND measure = ?", (kind, col)).fetchone()
+            merged = str(dtype) if row is None else str(np.result_type(np.dtype(row[0]), dtype))
+            conn.execute("INSERT OR REPLACE INTO measures (kind, measure, dtype) VALUES (?, ?, ?)", (kind, col, merged))
+
+    def cube(self, kind: str, value_cols) -> MonthlyCube:
+        """由各期间汇总组成 品名 × 月份 × 数值列 的立方体，数值类型与入库数据一致"""
+        with self._connect() as conn:
+            sums = pd.read_sql_query(
+                "SELECT period, name, measure, value FROM partition_sums WHERE kind = ?", conn, params=(kind,)
+            )
+            dtypes = dict(conn.execute("SELECT measure, dtype FROM measures WHERE kind = ?", (kind,)).fetchall())
+
+        wide = sums.pivot_table(index=["name", "period"], columns="measure", values="value", aggfunc="sum").reset_index()
+        return MonthlyCube.from_records(
+            wide["name"] if len(wide) else [],
+            pd.PeriodIndex(wide["period"], freq="M") if len(wide) else [],
+            {col: wide[col] if col in wide else np.zeros(len(wide)) for col in value_cols},
+            dtypes={col: dtypes.get(col, "float64") for col in value_cols}
+        )
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_fact_store():
+    """返回进程内共享的 FactStore；CONFIG["fact_store"]["enabled"] 为 False 时返回 None"""
+    global _default_store
+    store_config = CONFIG.get("fact_store", {})
+    if not store_config.get("enabled", False):
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = FactStore(store_config["path"])
+        return _default_store
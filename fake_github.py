@@ -0,0 +1,209 @@
+import base64
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+import github_utils
+from github_utils import git_blob_sha
+
+
+class FakeGitHub:
+    """
+    本地模拟的 GitHub API，只实现 GitHubClient 用到的接口：
+    Contents API（base64 / raw、ETag、目录列表）、PUT 上传，以及 sync_files 使用的 Git Data API。
+    loadtest 与 tests/ 共用；calls / statuses / downloads 按请求方法 / 响应状态码 / Contents API 读取的路径计数。
+
+    参数:
+    - files: 初始文件 {仓库中的路径: bytes}
+    """
+
+    def __init__(self, files: dict = None):
+        self.files = dict(files or {})
+        self.blobs = {git_blob_sha(data): data for data in self.files.values()}
+        self.trees = {}
+        self.commits = {}
+        self.head = None
+        self.calls = Counter()
+        self.statuses = Counter()
+        self.downloads = Counter()
+        # raw 下载时少发最后一个字节的路径（模拟截断的下载）
+        self.truncated = set()
+        self._failures = Counter()
+        self._lock = threading.RLock()  # _send 在持有锁时也会计数
+        self._commit(dict(self.files))
+        self._server = None
+
+    def _commit(self, tree: dict) -> str:
+        """记录一次提交（tree 为 {路径: bytes}），返回提交 SHA"""
+        tree_sha = f"tree{len(self.trees)}"
+        self.trees[tree_sha] = {path: git_blob_sha(data) for path, data in tree.items()}
+        commit_sha = f"commit{len(self.commits)}"
+        self.commits[commit_sha] = tree_sha
+        self.head = commit_sha
+        return commit_sha
+
+    def fail_next(self, method: str, count: int = 1, status: int = 502):
+        """接下来 count 个 method 请求直接返回 status（模拟服务端临时故障）"""
+        with self._lock:
+            self._failures[(method, status)] += count
+
+    def _take_failure(self, method: str):
+        with self._lock:
+            for (failed_method, status), count in self._failures.items():
+                if failed_method == method and count:
+                    self._failures[(failed_method, status)] -= 1
+                    return status
+        return None
+
+    def start(self) -> str:
+        """在后台线程启动服务，返回 API 地址"""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        threading.Thread(target=self._server.serve_forever, name="fake-github", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _make_handler(fake: FakeGitHub):
+    contents = re.compile(r"/repos/[^/]+/[^/]+/contents(?:/(?P<path>.*))?$")
+    git = re.compile(r"/repos/[^/]+/[^/]+/git/(?P<kind>ref|refs|commits|trees|blobs)(?:/(?P<rest>.+))?$")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload=None, raw=None, headers=None):
+            with fake._lock:
+                fake.statuses[status] += 1
+            body = raw if raw is not None else (json.dumps(payload).encode("utf-8") if payload is not None else b"")
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _route(self, method):
+            path = urlparse(self.path).path
+            with fake._lock:
+                fake.calls[method] += 1
+            return path, contents.match(path), git.match(path)
+
+        def _failed(self, method):
+            """按 fail_next 的设置返回故障响应（先读完请求体，连接可继续复用）"""
+            status = fake._take_failure(method)
+            if status is None:
+                return False
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self._send(status, {"message": "Injected failure"})
+            return True
+
+        def do_GET(self):
+            path, content_match, git_match = self._route("GET")
+            if self._failed("GET"):
+                return
+            if content_match:
+                name = unquote(content_match.group("path") or "").rstrip("/")
+                with fake._lock:
+                    fake.downloads[name] += 1
+                    data = fake.files.get(name)
+                    prefix = f"{name}/" if name else ""
+                    listing = [
+                        {"name": p[len(prefix):], "path": p, "sha": git_blob_sha(d), "size": len(d), "type": "file"}
+                        for p, d in sorted(fake.files.items())
+                        if p.startswith(prefix) and "/" not in p[len(prefix):]
+                    ]
+                if data is None and listing:
+                    return self._send(200, listing)
+                if data is None:
+                    return self._send(404, {"message": "Not Found"})
+                sha = git_blob_sha(data)
+                etag = f'"{sha}"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, headers={"ETag": etag})
+                if "raw" in self.headers.get("Accept", ""):
+                    body = data[:-1] if name in fake.truncated else data
+                    return self._send(200, raw=body, headers={"ETag": etag})
+                inline = len(data) <= github_utils.LARGE_FILE_SIZE
+                return self._send(200, {
+                    "sha": sha, "size": len(data),
+                    "content": base64.b64encode(data).decode("utf-8") if inline else "",
+                    "encoding": "base64" if inline else "none",
+                }, headers={"ETag": etag})
+
+            if git_match:
+                kind, rest = git_match.group("kind"), git_match.group("rest") or ""
+                with fake._lock:
+                    if kind == "ref":
+                        return self._send(200, {"object": {"sha": fake.head}})
+                    if kind == "commits" and rest in fake.commits:
+                        return self._send(200, {"sha": rest, "tree": {"sha": fake.commits[rest]}})
+                    if kind == "trees" and rest in fake.trees:
+                        tree = [{"path": p, "sha": s, "type": "blob"} for p, s in fake.trees[rest].items()]
+                        return self._send(200, {"sha": rest, "tree": tree})
+            self._send(404, {"message": "Not Found"})
+
+        def do_POST(self):
+            _, _, git_match = self._route("POST")
+            if self._failed("POST"):
+                return
+            body = self._json()
+            kind = git_match.group("kind") if git_match else None
+            with fake._lock:
+                if kind == "blobs":
+                    data = base64.b64decode(body["content"])
+                    sha = git_blob_sha(data)
+                    fake.blobs[sha] = data
+                    return self._send(201, {"sha": sha})
+                if kind == "trees":
+                    tree = dict(fake.trees.get(body.get("base_tree"), {}))
+                    tree.update({item["path"]: item["sha"] for item in body["tree"]})
+                    tree_sha = f"tree{len(fake.trees)}"
+                    fake.trees[tree_sha] = tree
+                    return self._send(201, {"sha": tree_sha})
+                if kind == "commits":
+                    commit_sha = f"commit{len(fake.commits)}"
+                    fake.commits[commit_sha] = body["tree"]
+                    return self._send(201, {"sha": commit_sha})
+            self._send(404, {"message": "Not Found"})
+
+        def do_PATCH(self):
+            _, _, git_match = self._route("PATCH")
+            if self._failed("PATCH"):
+                return
+            body = self._json()
+            with fake._lock:
+                if git_match and git_match.group("kind") == "refs" and body.get("sha") in fake.commits:
+                    fake.head = body["sha"]
+                    tree = fake.trees[fake.commits[fake.head]]
+                    fake.files = {path: fake.blobs[sha] for path, sha in tree.items()}
+                    return self._send(200, {"object": {"sha": fake.head}})
+            self._send(422, {"message": "Unprocessable"})
+
+        def do_PUT(self):
+            _, content_match, _ = self._route("PUT")
+            if self._failed("PUT"):
+                return
+            body = self._json()
+            if not content_match:
+                return self._send(404, {"message": "Not Found"})
+            with fake._lock:
+                data = base64.b64decode(body["content"])
+                fake.blobs[git_blob_sha(data)] = data
+                fake.files[unquote(content_match.group("path") or "")] = data
+                fake._commit(dict(fake.files))
+            self._send(201, {})
+
+    return Handler
@@ -1,14 +1,27 @@
 from io import BytesIO
 import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import requests
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 from urllib.parse import quote
 
+from config import CONFIG
+
 # GitHub 配置
 GITHUB_TOKEN_KEY = "GITHUB_TOKEN"  # secrets.toml 中的密钥名
 REPO_NAME = "TTTriste06/semiexcel"
 BRANCH = "main"
+GITHUB_API_URL = "https://api.github.com"  # 可改为本地测试服务器地址
 
 FILE_RENAME_MAPPING = {
     "赛卓-新旧料号.xlsx": "mapping_file.xlsx",
@@ -16,68 +29,413 @@ FILE_RENAME_MAPPING = {
     "赛卓-预测.xlsx": "pred_file.xlsx"
 }
 
-def upload_to_github(file_obj, filename):
-    """
-    将 file_obj 文件上传至 GitHub 指定仓库
-    - file_obj: BytesIO 或类文件对象
-    - filename: 仓库中要保存的文件名（含扩展名）
-    """
-    token = st.secrets[GITHUB_TOKEN_KEY]
-    safe_filename = quote(filename)  # 编码支持中文
+# 自动重试的请求方法：只包含幂等请求
+RETRY_METHODS = frozenset(["GET", "HEAD", "PUT"])
+
+UPLOADED = "uploaded"
+UNCHANGED = "unchanged"
 
-    url = f"https://api.github.com/repos/{REPO_NAME}/contents/{safe_filename}"
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
+# 大文件下载：Contents API 只对 1 MB 以内的文件返回 base64 内容，超过阈值的文件改用 raw 媒体类型分块下载
+LARGE_FILE_SIZE = 1_000_000
+RAW_MEDIA_TYPE = "application/vnd.github.raw"
+CHUNK_SIZE = 1 << 20
+SPOOL_MAX_SIZE = 8 << 20  # 超过该大小的下载内容写入磁盘临时文件
 
-    # 将文件读取并转为 base64
+
+def git_blob_sha(content: bytes) -> str:
+    """按 git 规则计算 blob SHA：sha1(b"blob <字节数>\\0" + 内容)，与 GitHub 返回的 sha 一致"""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def file_blob_sha(file_obj) -> str:
+    """分块计算文件对象的 git blob SHA，读取后回到开头"""
+    file_obj.seek(0, os.SEEK_END)
+    h = hashlib.sha1(b"blob %d\0" % file_obj.tell())
     file_obj.seek(0)
-    content = base64.b64encode(file_obj.read()).decode("utf-8")
+    for chunk in iter(lambda: file_obj.read(CHUNK_SIZE), b""):
+        h.update(chunk)
     file_obj.seek(0)
+    return h.hexdigest()
 
-    # 检查是否已存在（需要获取 SHA）
-    sha = None
-    get_resp = requests.get(url, headers=headers)
-    if get_resp.status_code == 200:
-        sha = get_resp.json().get("sha")
-
-    payload = {
-        "message": f"upload {filename}",
-        "content": content,
-        "branch": BRANCH
-    }
-    if sha:
-        payload["sha"] = sha
-
-    put_resp = requests.put(url, headers=headers, json=payload)
-    if put_resp.status_code not in [200, 201]:
-        raise Exception(f"❌ 上传失败：{put_resp.status_code} - {put_resp.text}")
-    else:
-        print(f"✅ 成功上传文件至 GitHub：{filename}")
 
-def download_from_github(filename):
+class GitHubError(Exception):
+    """GitHub 返回非成功状态码；status_code 供调用方区分临时故障（429 / 5xx）与不会自行恢复的错误"""
+
+    def __init__(self, message, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _check_response(resp, action):
+    if resp.status_code not in [200, 201]:
+        raise GitHubError(f"❌ {action}失败：{resp.status_code} - {resp.text}", resp.status_code)
+    return resp.json()
+
+
+class FileCache:
     """
-    从 GitHub 仓库下载指定文件内容（以二进制返回）
-    - filename: 仓库中保存的文件名
-    - 返回: bytes 内容（可用于 pd.read_excel(BytesIO(...))）
+    GitHub 文件的本地磁盘缓存：每个文件保存内容（.bin）与元数据（.json：ETag、blob SHA、获取时间）。
+    写入先落临时文件再替换，中途失败不会留下不完整的缓存。
     """
-    token = st.secrets[GITHUB_TOKEN_KEY]
-    safe_filename = quote(filename)
-
-    url = f"https://api.github.com/repos/{REPO_NAME}/contents/{safe_filename}?ref={BRANCH}"
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        json_resp = response.json()
-        return base64.b64decode(json_resp["content"])
-    else:
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+    def _paths(self, key: str):
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name + ".bin"), os.path.join(self.cache_dir, name + ".json")
+
+    def load(self, key: str):
+        """返回 (内容文件路径, meta)；无缓存或内容与记录的 SHA 不符时返回 (None, None)"""
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(data_path, "rb") as f:
+                sha = file_blob_sha(f)
+        except (OSError, ValueError):
+            return None, None
+        if sha != meta.get("sha"):
+            return None, None
+        return data_path, meta
+
+    def store(self, key: str, file_obj, **meta):
+        """分块复制 file_obj 的内容写入缓存，meta 中记录 ETag 等信息"""
+        data_path, meta_path = self._paths(key)
+        meta = dict(meta, key=key, sha=file_blob_sha(file_obj), fetched_at=time.time())
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{data_path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                shutil.copyfileobj(file_obj, f, CHUNK_SIZE)
+            os.replace(tmp, data_path)
+            self._write_meta(meta_path, meta)
+        file_obj.seek(0)
+
+    def touch(self, key: str, meta: dict):
+        """304 后刷新获取时间"""
+        _, meta_path = self._paths(key)
+        with self._lock:
+            self._write_meta(meta_path, dict(meta, fetched_at=time.time()))
+
+    def remove(self, key: str):
+        with self._lock:
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    @staticmethod
+    def _write_meta(meta_path, meta):
+        tmp = f"{meta_path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, meta_path)
+
+
+class GitHubClient:
+    """
+    GitHub API 客户端：复用同一个 requests.Session（连接池 + keep-alive），
+    对连接错误和 429/5xx 响应按指数退避自动重试。
+    只有幂等请求（GET / HEAD / PUT）会在收到响应后重试；创建提交、更新分支等 POST / PATCH 请求
+    重试可能产生重复提交，失败时直接报错。
+
+    - token: 默认读取 secrets 中的 GITHUB_TOKEN
+    - api_url: 默认 GITHUB_API_URL，可指向本地测试服务器
+    - cache_dir / max_age / offline: 下载缓存设置，默认取 CONFIG["github_cache"]；
+      cache_dir 为 None 时不使用缓存
+    - large_file_size: 超过该字节数的文件改用 raw 分块下载
+    """
+
+    def __init__(self, token: str = None, api_url: str = None, repo: str = REPO_NAME, branch: str = BRANCH,
+                 max_retries: int = 3, backoff_factor: float = 0.5, pool_size: int = 8,
+                 cache_dir: str = "", max_age: float = None, offline: bool = None,
+                 large_file_size: int = LARGE_FILE_SIZE):
+        self.api_url = api_url or GITHUB_API_URL
+        self.large_file_size = large_file_size
+        self.repo = repo
+        self.branch = branch
+        self.pool_size = pool_size
+
+        cache_config = CONFIG.get("github_cache", {})
+        cache_dir = cache_config.get("dir") if cache_dir == "" else cache_dir
+        self.cache = FileCache(cache_dir) if cache_dir else None
+        self.max_age = max_age if max_age is not None else cache_config.get("max_age")
+        self.offline = offline if offline is not None else cache_config.get("offline", False)
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"token {token or st.secrets[GITHUB_TOKEN_KEY]}",
+            "Accept": "application/vnd.github.v3+json"
+        })
+
+    def _contents_url(self, filename):
+        return f"{self.api_url}/repos/{self.repo}/contents/{quote(filename)}"
+
+    def _cache_key(self, filename):
+        return f"{self.api_url}/{self.repo}@{self.branch}/{filename}"
+
+    def open(self, filename):
+        """
+        从 GitHub 仓库下载指定文件，返回可读的二进制文件对象（调用方负责关闭）
+        - filename: 仓库中保存的文件名
+        - 返回: 文件对象，可直接传给 pd.read_excel
+
+        小文件通过 Contents API 的 base64 内容获取；超过 large_file_size 的文件
+        （Contents API 不再内联内容）改用 raw 媒体类型分块写入 SpooledTemporaryFile，内存占用有上限。
+
+        启用缓存时：
+        - offline，或缓存未超过 max_age 秒：直接返回缓存，不发请求
+        - 否则带 If-None-Match 请求，304 时返回缓存
+        - GitHub 不可用时退回到缓存
+        """
+        key = self._cache_key(filename)
+        cached, meta = self.cache.load(key) if self.cache else (None, None)
+
+        if cached is not None:
+            fresh = self.max_age is not None and time.time() - meta.get("fetched_at", 0) < self.max_age
+            if self.offline or fresh:
+                return open(cached, "rb")
+        elif self.offline:
+            raise FileNotFoundError(f"❌ 离线模式下本地没有缓存：{filename}")
+
+        # 已知是大文件时直接走 raw 下载，省去一次元数据请求
+        raw = cached is not None and meta.get("raw", False)
+        headers = {"Accept": RAW_MEDIA_TYPE} if raw else {}
+        if cached is not None and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        try:
+            response = self.session.get(self._contents_url(filename), params={"ref": self.branch},
+                                        headers=headers, stream=raw)
+        except requests.RequestException as e:
+            if cached is None:
+                raise
+            print(f"⚠️ GitHub 请求失败，使用本地缓存：{filename} - {e}")
+            return open(cached, "rb")
+
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            self.cache.touch(key, meta)
+            return open(cached, "rb")
+        if response.status_code == 200:
+            if raw:
+                return self._receive_raw(key, filename, response)
+            json_resp = response.json()
+            if json_resp.get("encoding") != "base64" or json_resp.get("size", 0) > self.large_file_size:
+                return self._download_raw(key, filename, json_resp.get("sha"))
+            file_obj = BytesIO(base64.b64decode(json_resp["content"]))
+            if self.cache:
+                self.cache.store(key, file_obj, etag=response.headers.get("ETag"))
+            return file_obj
+
+        response.close()
+        if response.status_code == 404:
+            if self.cache:
+                self.cache.remove(key)
+        elif cached is not None:
+            print(f"⚠️ GitHub 返回 {response.status_code}，使用本地缓存：{filename}")
+            return open(cached, "rb")
         raise FileNotFoundError(f"❌ GitHub 上找不到文件：{filename} (HTTP {response.status_code})")
 
+    def _download_raw(self, key, filename, expected_sha=None):
+        response = self.session.get(self._contents_url(filename), params={"ref": self.branch},
+                                    headers={"Accept": RAW_MEDIA_TYPE}, stream=True)
+        if response.status_code != 200:
+            response.close()
+            raise FileNotFoundError(f"❌ GitHub 上找不到文件：{filename} (HTTP {response.status_code})")
+        return self._receive_raw(key, filename, response, expected_sha)
+
+    def _receive_raw(self, key, filename, response, expected_sha=None):
+        """分块读取 raw 响应，写入 SpooledTemporaryFile 并校验 blob SHA"""
+        file_obj = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        with response:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                file_obj.write(chunk)
+        file_obj.seek(0)
+
+        if expected_sha and file_blob_sha(file_obj) != expected_sha:
+            file_obj.close()
+            raise GitHubError(f"❌ 下载内容校验失败：{filename}")
+        if self.cache:
+            self.cache.store(key, file_obj, etag=response.headers.get("ETag"), raw=True)
+        return file_obj
+
+    def download(self, filename) -> bytes:
+        """
+        从 GitHub 仓库下载指定文件内容（以二进制返回）
+        - filename: 仓库中保存的文件名
+        - 返回: bytes 内容（可用于 pd.read_excel(BytesIO(...))）
+        """
+        with self.open(filename) as file_obj:
+            return file_obj.read()
+
+    def open_many(self, filenames, max_workers: int = None) -> dict:
+        """
+        并发下载多个文件，共享连接池。
+        - 返回: {filename: 文件对象}，GitHub 上不存在或下载内容校验失败的文件为 None，不影响其他文件
+        """
+        def fetch(filename):
+            try:
+                return self.open(filename)
+            except FileNotFoundError:
+                return None
+            except GitHubError as e:
+                print(f"⚠️ {e}")
+                return None
+
+        filenames = list(filenames)
+        if not filenames:
+            return {}
+        with ThreadPoolExecutor(max_workers=max_workers or self.pool_size) as pool:
+            return dict(zip(filenames, pool.map(fetch, filenames)))
+
+    def file_shas(self, directory: str = "") -> dict:
+        """
+        列出目录（默认仓库根目录）中文件的 blob SHA，不下载文件内容。
+        - 返回: {仓库中的路径: blob SHA}；目录不存在时为空 dict
+        """
+        url = f"{self.api_url}/repos/{self.repo}/contents/{quote(directory)}"
+        response = self.session.get(url, params={"ref": self.branch})
+        if response.status_code == 404:
+            return {}
+        entries = _check_response(response, "读取文件列表")
+        return {entry["path"]: entry["sha"] for entry in entries if entry.get("type") == "file"}
+
+    def upload(self, file_obj, filename):
+        """
+        将 file_obj 文件上传至 GitHub 指定仓库；内容与仓库中一致时跳过上传
+        - file_obj: BytesIO 或类文件对象
+        - filename: 仓库中要保存的文件名（含扩展名）
+        - 返回: UPLOADED 或 UNCHANGED
+        """
+        url = self._contents_url(filename)
+
+        # 读取文件内容
+        file_obj.seek(0)
+        raw = file_obj.read()
+        file_obj.seek(0)
+
+        # 检查是否已存在（需要获取 SHA）
+        sha = None
+        get_resp = self.session.get(url)
+        if get_resp.status_code == 200:
+            sha = get_resp.json().get("sha")
+
+        if sha and sha == git_blob_sha(raw):
+            print(f"⏭️ 内容未变化，跳过上传：{filename}")
+            return UNCHANGED
+
+        payload = {
+            "message": f"upload {filename}",
+            "content": base64.b64encode(raw).decode("utf-8"),
+            "branch": self.branch
+        }
+        if sha:
+            payload["sha"] = sha
+
+        put_resp = self.session.put(url, json=payload)
+        if put_resp.status_code not in [200, 201]:
+            raise GitHubError(f"❌ 上传失败：{put_resp.status_code} - {put_resp.text}", put_resp.status_code)
+        else:
+            print(f"✅ 成功上传文件至 GitHub：{filename}")
+            return UPLOADED
+
+    def sync_files(self, files: dict, message: str = None) -> dict:
+        """
+        通过 Git Data API 将多个文件一次性提交到 GitHub（blobs → tree → commit → 更新分支）。
+        与当前分支中 blob SHA 相同的文件不会上传；全部未变化时不产生提交。
+        - files: {仓库中的路径: bytes 内容}
+        - message: 提交说明，默认列出所有变化的文件名
+        - 返回: {路径: UPLOADED / UNCHANGED}
+        """
+        if not files:
+            return {}
+
+        base = f"{self.api_url}/repos/{self.repo}/git"
+
+        # 当前分支的最新提交及其 tree
+        ref = _check_response(self.session.get(f"{base}/ref/heads/{self.branch}"), "读取分支")
+        parent_sha = ref["object"]["sha"]
+        parent = _check_response(self.session.get(f"{base}/commits/{parent_sha}"), "读取提交")
+        remote_tree = _check_response(
+            self.session.get(f"{base}/trees/{parent['tree']['sha']}", params={"recursive": 1}), "读取文件列表"
+        )
+        remote_shas = {item["path"]: item["sha"] for item in remote_tree.get("tree", []) if item.get("type") == "blob"}
+
+        decisions = {
+            path: UNCHANGED if remote_shas.get(path) == git_blob_sha(content) else UPLOADED
+            for path, content in files.items()
+        }
+        changed = {path: content for path, content in files.items() if decisions[path] == UPLOADED}
+        if not changed:
+            print("⏭️ 所有文件内容未变化，跳过提交")
+            return decisions
+
+        # 每个变化的文件创建一个 blob
+        tree = []
+        for path, content in changed.items():
+            blob = _check_response(self.session.post(f"{base}/blobs", json={
+                "content": base64.b64encode(content).decode("utf-8"),
+                "encoding": "base64"
+            }), f"上传 {path} ")
+            tree.append({"path": path, "mode": "100644", "type": "blob", "sha": blob["sha"]})
+
+        new_tree = _check_response(self.session.post(f"{base}/trees", json={
+            "base_tree": parent["tree"]["sha"],
+            "tree": tree
+        }), "创建 tree ")
+        commit = _check_response(self.session.post(f"{base}/commits", json={
+            "message": message or "upload " + ", ".join(changed),
+            "tree": new_tree["sha"],
+            "parents": [parent_sha]
+        }), "创建提交")
+        _check_response(self.session.patch(f"{base}/refs/heads/{self.branch}", json={
+            "sha": commit["sha"]
+        }), "更新分支")
+
+        print(f"✅ 成功提交 {len(changed)} 个文件至 GitHub：{commit['sha']}")
+        return decisions
+
+
+_default_client = None
+
+
+def get_github_client() -> GitHubClient:
+    """返回进程内共享的 GitHubClient，连接在 Streamlit 多次重跑之间复用"""
+    global _default_client
+    if _default_client is None:
+        _default_client = GitHubClient()
+    return _default_client
+
+
+def upload_to_github(file_obj, filename):
+    """将 file_obj 文件上传至 GitHub 指定仓库，见 GitHubClient.upload"""
+    return get_github_client().upload(file_obj, filename)
+
+
+def sync_files_to_github(files: dict, message: str = None, api_url: str = None, token: str = None):
+    """
+    将多个文件合并为一次提交，见 GitHubClient.sync_files。
+    - api_url / token: 指定时使用独立的客户端（如本地测试服务器）
+    """
+    client = GitHubClient(token=token, api_url=api_url) if api_url or token else get_github_client()
+    return client.sync_files(files, message)
+
+
+def download_from_github(filename):
+    """从 GitHub 仓库下载指定文件内容（以二进制返回），见 GitHubClient.download"""
+    return get_github_client().download(filename)
+
 def load_or_fallback_from_github(label: str, key: str, filename: str, additional_sheets: dict):
     """优先加载上传文件，否则从 GitHub 加载 fallback 文件"""
     uploaded_file = st.file_uploader(f"📎 上传 {label} 文件", type=["xlsx"], key=key)
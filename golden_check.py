@@ -0,0 +1,272 @@
+import argparse
+import fnmatch
+import hashlib
+import json
+import math
+import os
+import sys
+from datetime import datetime
+from io import BytesIO
+from itertools import zip_longest
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from config import CONFIG, customer_name
+from history_loader import FALLBACK_FILES
+from pipeline import StageCache
+
+
+# 随仓库提交的小规模输入与基准（tests/test_golden.py 使用同一份数据）
+INPUT_DIR = os.path.join("tests", "data", "inputs")
+GOLDEN_DIR = os.path.join("tests", "data", "golden")
+META_FILE = "meta.json"
+BUDGETS_FILE = "budgets.json"
+# 数值比较的容差：|实际 - 基准| <= max(REL_TOL × 较大值, ABS_TOL)
+REL_TOL = 1e-9
+ABS_TOL = 1e-6
+# 记录基准时，各阶段预算 = 实测耗时 × BUDGET_FACTOR，且不低于 MIN_BUDGET 秒
+BUDGET_FACTOR = 3.0
+MIN_BUDGET = 0.5
+MAX_DIFFS = 20
+
+
+def golden_report_path(golden_dir: str, customer: str) -> str:
+    return os.path.join(golden_dir, f"{customer}-汇总报告.xlsx")
+
+
+def read_inputs(input_dir: str, customer: str = None):
+    """
+    读取 input_dir 中带客户前缀的输入文件。
+
+    返回:
+    - (core, aux)：core 为 {带前缀的核心文件名: bytes}，aux 为 {不带前缀的辅助文件名: bytes}，缺失的文件不列出
+    """
+    def read(base):
+        path = os.path.join(input_dir, customer_name(base, customer))
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    core = {customer_name(base, customer): read(base) for base in CONFIG["pivot_config"]}
+    aux = {base: read(base) for base in FALLBACK_FILES}
+    return ({name: data for name, data in core.items() if data is not None},
+            {base: data for base, data in aux.items() if data is not None})
+
+
+def input_digests(core: dict, aux: dict) -> dict:
+    """输入文件的内容摘要，基准与本次输入不一致时对比没有意义"""
+    files = dict(core)
+    files.update(aux)
+    return {name: hashlib.sha1(data).hexdigest() for name, data in sorted(files.items())}
+
+
+def generate(core: dict, aux: dict, customer: str, today: datetime, repeat: int = 1):
+    """
+    用全新的阶段缓存、不使用明细事实库生成报告，重复 repeat 次。
+
+    参数:
+    - core: {带前缀的核心文件名: bytes}
+    - aux: {不带前缀的辅助文件名: bytes}
+    - today: 报告基准日期，固定后输出不随生成日期变化
+
+    返回:
+    - (最后一次的报告 bytes, {阶段名: 各次中最短的耗时})
+    """
+    from pivot_processor import PivotProcessor
+
+    additional_sheets = {
+        customer_name(base, customer).replace(".xlsx", ""): pd.read_excel(BytesIO(data), sheet_name=FALLBACK_FILES[base])
+        for base, data in aux.items()
+    }
+
+    report, timings = None, {}
+    for _ in range(repeat):
+        processor = PivotProcessor(cache=StageCache(), fact_store=None, customer=customer, today=today, profile="full")
+        uploaded_files = {name: BytesIO(data) for name, data in core.items()}
+        result = processor.process(uploaded_files, BytesIO(), additional_sheets)
+        if result is None:
+            raise RuntimeError("报告生成失败（缺少核心数据或合并失败）")
+        report = result[0]
+        for stage, seconds in processor.stage_timings.items():
+            timings[stage] = min(seconds, timings.get(stage, seconds))
+    return report, timings
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def cells_equal(expected, actual, rel_tol: float = REL_TOL, abs_tol: float = ABS_TOL) -> bool:
+    """单元格比较：数值按容差，公式与文本按字符串；空单元格与空字符串视为相同"""
+    if expected in (None, "") and actual in (None, ""):
+        return True
+    if _is_number(expected) and _is_number(actual):
+        if math.isnan(expected) or math.isnan(actual):
+            return math.isnan(expected) and math.isnan(actual)
+        return math.isclose(expected, actual, rel_tol=rel_tol, abs_tol=abs_tol)
+    return expected == actual
+
+
+def compare_workbooks(expected, actual, rel_tol: float = REL_TOL, abs_tol: float = ABS_TOL,
+                      max_diffs: int = MAX_DIFFS) -> list:
+    """
+    逐个 sheet、逐个单元格比较两个工作簿（公式按公式文本比较，不比较格式）。
+
+    参数:
+    - expected / actual: 文件路径或 bytes
+    - max_diffs: 每个 sheet 最多列出的差异数
+
+    返回:
+    - 差异说明列表，完全一致时为空
+    """
+    def open_book(source):
+        return load_workbook(BytesIO(source) if isinstance(source, bytes) else source, read_only=True, data_only=False)
+
+    expected_book, actual_book = open_book(expected), open_book(actual)
+    diffs = []
+    try:
+        if expected_book.sheetnames != actual_book.sheetnames:
+            diffs.append(f"sheet 不一致：基准 {expected_book.sheetnames}，实际 {actual_book.sheetnames}")
+
+        for sheet_name in expected_book.sheetnames:
+            if sheet_name not in actual_book.sheetnames:
+                continue
+            count = 0
+            rows = zip_longest(expected_book[sheet_name].iter_rows(values_only=True),
+                               actual_book[sheet_name].iter_rows(values_only=True), fillvalue=())
+            for row_idx, (expected_row, actual_row) in enumerate(rows, start=1):
+                for col_idx, (exp, act) in enumerate(zip_longest(expected_row, actual_row), start=1):
+                    if cells_equal(exp, act, rel_tol, abs_tol):
+                        continue
+                    count += 1
+                    if count <= max_diffs:
+                        cell = f"{get_column_letter(col_idx)}{row_idx}"
+                        diffs.append(f"{sheet_name}!{cell}：基准 {exp!r}，实际 {act!r}")
+            if count > max_diffs:
+                diffs.append(f"{sheet_name}：另有 {count - max_diffs} 处差异未列出")
+    finally:
+        expected_book.close()
+        actual_book.close()
+    return diffs
+
+
+def stage_budget(stage: str, budgets: dict):
+    """阶段的时间预算：先按阶段名精确匹配，再按通配符（如 "pivot:*"）匹配；没有预算时返回 None"""
+    if stage in budgets:
+        return budgets[stage]
+    for pattern, seconds in budgets.items():
+        if fnmatch.fnmatchcase(stage, pattern):
+            return seconds
+    return None
+
+
+def check_budgets(timings: dict, budgets: dict) -> pd.DataFrame:
+    """
+    各阶段耗时与预算对照。
+
+    返回:
+    - 阶段 / 耗时(秒) / 预算(秒) / 超出 的 DataFrame，按耗时降序
+    """
+    rows = []
+    for stage, seconds in timings.items():
+        budget = stage_budget(stage, budgets)
+        rows.append({
+            "阶段": stage,
+            "耗时(秒)": round(seconds, 3),
+            "预算(秒)": budget,
+            "超出": budget is not None and seconds > budget,
+        })
+    table = pd.DataFrame(rows, columns=["阶段", "耗时(秒)", "预算(秒)", "超出"])
+    return table.sort_values("耗时(秒)", ascending=False).reset_index(drop=True)
+
+
+def load_budgets(golden_dir: str = GOLDEN_DIR) -> dict:
+    """基准目录中的阶段预算，没有时为空"""
+    budgets_path = os.path.join(golden_dir, BUDGETS_FILE)
+    if not os.path.exists(budgets_path):
+        return {}
+    with open(budgets_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_meta(golden_dir: str = GOLDEN_DIR) -> dict:
+    """基准的客户、基准日期与输入摘要"""
+    with open(os.path.join(golden_dir, META_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record(input_dir: str = INPUT_DIR, golden_dir: str = GOLDEN_DIR, customer: str = None, today: datetime = None,
+           repeat: int = 1, keep_budgets: bool = False):
+    """生成并保存基准报告、输入摘要与基准日期；keep_budgets 为 False 时按本次耗时重写阶段预算"""
+    customer = customer or CONFIG["customer"]
+    today = today or datetime.today()
+    core, aux = read_inputs(input_dir, customer)
+    report, timings = generate(core, aux, customer, today, repeat)
+
+    os.makedirs(golden_dir, exist_ok=True)
+    with open(golden_report_path(golden_dir, customer), "wb") as f:
+        f.write(report)
+    meta = {"customer": customer, "today": today.strftime("%Y-%m-%d"), "inputs": input_digests(core, aux)}
+    with open(os.path.join(golden_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    budgets_path = os.path.join(golden_dir, BUDGETS_FILE)
+    if not (keep_budgets and os.path.exists(budgets_path)):
+        budgets = {stage: round(max(seconds * BUDGET_FACTOR, MIN_BUDGET), 2) for stage, seconds in timings.items()}
+        with open(budgets_path, "w", encoding="utf-8") as f:
+            json.dump(budgets, f, ensure_ascii=False, indent=2)
+    print(f"✅ 已记录基准：{golden_report_path(golden_dir, customer)}（基准日期 {meta['today']}）")
+
+
+def check(input_dir: str = INPUT_DIR, golden_dir: str = GOLDEN_DIR, repeat: int = 1,
+          rel_tol: float = REL_TOL, abs_tol: float = ABS_TOL) -> bool:
+    """按基准日期重新生成报告，与基准逐格比较并检查阶段预算；全部通过时返回 True"""
+    meta = load_meta(golden_dir)
+    customer = meta["customer"]
+    core, aux = read_inputs(input_dir, customer)
+    if input_digests(core, aux) != meta["inputs"]:
+        print("❌ 输入文件与记录基准时不一致，请确认 --input-dir 或重新记录基准")
+        return False
+
+    report, timings = generate(core, aux, customer, datetime.strptime(meta["today"], "%Y-%m-%d"), repeat)
+    diffs = compare_workbooks(golden_report_path(golden_dir, customer), report, rel_tol, abs_tol)
+    for diff in diffs:
+        print(f"❌ {diff}")
+    if not diffs:
+        print("✅ 输出与基准一致")
+
+    table = check_budgets(timings, load_budgets(golden_dir))
+    print(table.to_string(index=False))
+    over = table[table["超出"]]
+    for _, row in over.iterrows():
+        print(f"❌ 阶段 {row['阶段']} 耗时 {row['耗时(秒)']} 秒，超出预算 {row['预算(秒)']} 秒")
+    if over.empty:
+        print("✅ 各阶段耗时均在预算内")
+    return not diffs and over.empty
+
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总报告基准核对：逐格比较输出并检查各阶段耗时预算")
+    parser.add_argument("command", choices=["record", "check"], help="record 记录基准，check 与基准核对")
+    parser.add_argument("--input-dir", default=INPUT_DIR, help=f"带客户前缀的核心与辅助文件所在目录，默认 {INPUT_DIR}")
+    parser.add_argument("--golden-dir", default=GOLDEN_DIR, help=f"基准目录，默认 {GOLDEN_DIR}")
+    parser.add_argument("--customer", default=None, help="客户前缀（record 时使用，默认取配置）")
+    parser.add_argument("--today", default=None, help="基准日期 YYYY-MM-DD（record 时使用，默认今天）")
+    parser.add_argument("--repeat", type=int, default=1, help="重复生成次数，阶段耗时取最短的一次")
+    parser.add_argument("--keep-budgets", action="store_true", help="record 时保留已有的阶段预算")
+    parser.add_argument("--rel-tol", type=float, default=REL_TOL, help="数值相对容差")
+    parser.add_argument("--abs-tol", type=float, default=ABS_TOL, help="数值绝对容差")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        today = datetime.strptime(args.today, "%Y-%m-%d") if args.today else None
+        record(args.input_dir, args.golden_dir, args.customer, today, args.repeat, args.keep_budgets)
+        return
+    sys.exit(0 if check(args.input_dir, args.golden_dir, args.repeat, args.rel_tol, args.abs_tol) else 1)
+
+
+if __name__ == "__main__":
+    main()
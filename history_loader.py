@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import pandas as pd
+
+from config import customer_name, base_name
+
+from github_utils import get_github_client, file_blob_sha
+from history_store import MANIFEST_PATH, parquet_available, parquet_to_frame, verified_manifest
+
+
+# 可从 GitHub 加载历史版本的辅助文件（不带客户前缀）及其读取的 sheet
+FALLBACK_FILES = {
+    "预测.xlsx": "Sheet1",
+    "安全库存.xlsx": 0,
+    "新旧料号.xlsx": 0,
+    "到货明细.xlsx": 0,
+    "下单明细.xlsx": 0,
+    "销货明细.xlsx": 0,
+}
+# 已完成的预取结果在该时间（秒）内直接复用，超过后下一次 prefetch 重新向 GitHub 校验
+RESULT_MAX_AGE = 60
+
+
+def fallback_sheet(name: str, customer: str = None):
+    """带客户前缀的文件名对应读取的 sheet"""
+    return FALLBACK_FILES[base_name(name, customer)]
+
+
+class HistoryLoader:
+    """
+    GitHub 历史文件加载器：在后台并发下载并解析为 DataFrame。
+
+    - prefetch: 会话开始时调用，立即返回，下载与解析在线程池中进行
+    - load: 取结果；预取未完成时等待，未预取时提交后等待
+    - 预取任务按文件名保留（取用后不移除），进行中或 max_age 秒内完成的任务不重复提交，
+      各会话共用同一个结果
+    - 解析结果按文件内容（blob SHA）缓存，重新校验后内容未变化时不再重复解析
+    - manifest 中有 Parquet 副本的文件优先读取副本，副本缺失时退回 xlsx
+
+    返回的 DataFrame 在多个会话间共享，调用方不得修改。
+    """
+
+    def __init__(self, client=None, max_workers: int = None, max_age: float = RESULT_MAX_AGE):
+        self.client = client
+        self.max_age = max_age
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(FALLBACK_FILES),
+                                        thread_name_prefix="history-prefetch")
+        # {文件名: (future, 提交时间)}
+        self._futures = {}
+        self._manifest_future = None
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _client(self):
+        return self.client or get_github_client()
+
+    def _fetch_manifest(self) -> dict:
+        """
+        读取 GitHub 上的 history/manifest.json，只保留与当前 xlsx 原件一致的条目（见 verified_manifest）；
+        不存在或未安装 pyarrow 时返回空 dict
+        """
+        if not parquet_available():
+            return {}
+        client = self._client()
+        try:
+            manifest = json.loads(client.download(MANIFEST_PATH))
+        except FileNotFoundError:
+            return {}
+        return verified_manifest(manifest, client.file_shas())
+
+    def manifest(self, future=None) -> dict:
+        """当前的 manifest，预取进行中时复用预取结果"""
+        if future is None:
+            with self._lock:
+                future = self._manifest_future
+        if future is not None:
+            try:
+                return future.result()
+            except Exception as e:
+                print(f"⚠️ 读取 manifest 失败：{e}")
+        return self._fetch_manifest()
+
+    def _parse(self, name: str, file_obj, reader, sha: str = None):
+        """按内容 SHA 复用已解析的 DataFrame；sha 为已算出的内容 SHA"""
+        with file_obj:
+            sha = sha or file_blob_sha(file_obj)
+            with self._lock:
+                cached = self._frames.get(name)
+            if cached and cached[0] == sha:
+                return cached[1]
+            df = reader(file_obj)
+
+        with self._lock:
+            self._frames[name] = (sha, df)
+        return df
+
+    def _fetch(self, name: str, sheet_name, manifest_future=None):
+        """下载并解析一个文件，优先使用 Parquet 副本；GitHub 上不存在时返回 None"""
+        client = self._client()
+        entry = self.manifest(manifest_future).get("files", {}).get(name)
+        if entry and entry.get("sheet") == sheet_name:
+            try:
+                file_obj = client.open(entry["parquet"])
+                sha = file_blob_sha(file_obj)
+                if sha != entry.get("sha"):
+                    file_obj.close()
+                    raise ValueError("内容与 manifest 记录不符")
+                return self._parse(name, file_obj, parquet_to_frame, sha)
+            except FileNotFoundError:
+                print(f"⚠️ 未找到 Parquet 副本，改用 xlsx：{name}")
+            except ValueError as e:
+                print(f"⚠️ Parquet 副本无法使用，改用 xlsx：{name} - {e}")
+
+        try:
+            file_obj = client.open(quote(name))
+        except FileNotFoundError:
+            return None
+        return self._parse(name, file_obj, lambda f: pd.read_excel(f, sheet_name=sheet_name))
+
+    def _reusable(self, entry) -> bool:
+        """任务进行中，或已成功完成且未超过 max_age"""
+        if entry is None:
+            return False
+        future, submitted = entry
+        if not future.done():
+            return True
+        return future.exception() is None and time.time() - submitted < self.max_age
+
+    def prefetch(self, names=None, customer: str = None):
+        """
+        在后台开始下载并解析文件；进行中或已有可复用结果的文件不重复提交。
+
+        参数:
+        - names: 带客户前缀的文件名列表，默认为该客户的全部 FALLBACK_FILES
+        - customer: 客户前缀，默认取 CONFIG["customer"]
+        """
+        if names is None:
+            names = [customer_name(name, customer) for name in FALLBACK_FILES]
+        with self._lock:
+            names = [name for name in names if not self._reusable(self._futures.get(name))]
+            if not names:
+                return
+            # 每轮预取重新读取一次 manifest，本轮的文件任务共用；
+            # manifest 任务先于文件任务提交，文件任务等待它时不会占满线程池
+            manifest_future = self._pool.submit(self._fetch_manifest)
+            self._manifest_future = manifest_future
+            for name in names:
+                future = self._pool.submit(self._fetch, name, fallback_sheet(name, customer), manifest_future)
+                self._futures[name] = (future, time.time())
+
+    def load(self, name: str, customer: str = None):
+        """
+        返回文件解析后的 DataFrame；GitHub 上不存在时返回 None。
+        复用进行中或已完成的预取，预取失败（如网络错误）时同步重试一次。
+        """
+        self.prefetch([name], customer)
+        with self._lock:
+            entry = self._futures.get(name)
+        try:
+            return entry[0].result()
+        except Exception as e:
+            print(f"⚠️ 预取失败，重新加载：{name} - {e}")
+        with self._lock:
+            # 失败的任务不再复用；其他会话已重新提交的任务保留
+            if self._futures.get(name) is entry:
+                del self._futures[name]
+        return self._fetch(name, fallback_sheet(name, customer))
+
+
+_default_loader = None
+_default_loader_lock = threading.Lock()
+
+
+def get_history_loader() -> HistoryLoader:
+    """返回进程内共享的 HistoryLoader，解析缓存在各会话与重跑之间复用"""
+    global _default_loader
+    with _default_loader_lock:
+        if _default_loader is None:
+            _default_loader = HistoryLoader()
+        return _default_loader
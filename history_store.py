@@ -0,0 +1,197 @@
+import json
+from datetime import date, datetime, time, timedelta
+from io import BytesIO
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from github_utils import git_blob_sha
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装 pyarrow 时只使用 xlsx
+    pa = pq = None
+
+
+# GitHub 仓库中的列式历史副本：history/<文件名>.parquet + history/manifest.json
+HISTORY_DIR = "history"
+MANIFEST_PATH = f"{HISTORY_DIR}/manifest.json"
+# 版本 1 的副本用 pickle 保存列名与混合类型单元格，不再读取
+MANIFEST_VERSION = 2
+PARQUET_COMPRESSION = "zstd"
+
+# 列名可能是日期或重复，Parquet 中按位置命名，原列名按 [类型标记, 文本] 以 JSON 存于文件元数据；
+# 混合类型的 object 列（如数字与文本混排、含空值的文本列）拆为文本列 "<i>" 与类型标记列 "<i>:type"，读取时还原。
+# 读取时只解析这两种文本，副本内容不会被当作代码执行
+COLUMNS_KEY = b"semiexcel:columns"
+TAGGED_COLUMNS_KEY = b"semiexcel:tagged_columns"
+TYPE_SUFFIX = ":type"
+
+_DECODERS = {
+    "none": lambda text: None,
+    "na": lambda text: pd.NA,
+    "nat": lambda text: pd.NaT,
+    "bool": lambda text: text == "1",
+    "int": int,
+    "float": float,
+    "str": str,
+    "timestamp": pd.Timestamp,
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "time": time.fromisoformat,
+    "timedelta": lambda text: pd.Timedelta(int(text)),
+}
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+def parquet_path(name: str) -> str:
+    """xlsx 文件名对应的 Parquet 路径，文件名与 xlsx 一样做 URL 编码"""
+    return f"{HISTORY_DIR}/{quote(name.replace('.xlsx', ''))}.parquet"
+
+
+def _is_plain_text(col: pd.Series) -> bool:
+    return all(isinstance(val, str) for val in col)
+
+
+def encode_value(val):
+    """单元格或列名 → (类型标记, 文本)；无法无损表示的类型抛出 TypeError"""
+    if val is None:
+        return "none", None
+    if val is pd.NA:
+        return "na", None
+    if val is pd.NaT:
+        return "nat", None
+    if isinstance(val, (bool, np.bool_)):
+        return "bool", "1" if val else "0"
+    if isinstance(val, (int, np.integer)):
+        return "int", str(int(val))
+    if isinstance(val, (float, np.floating)):
+        return "float", repr(float(val))
+    if isinstance(val, str):
+        return "str", val
+    if isinstance(val, pd.Timestamp):
+        return "timestamp", val.isoformat()
+    if isinstance(val, datetime):
+        return "datetime", val.isoformat()
+    if isinstance(val, date):
+        return "date", val.isoformat()
+    if isinstance(val, time):
+        return "time", val.isoformat()
+    if isinstance(val, timedelta):
+        return "timedelta", str(pd.Timedelta(val).value)
+    raise TypeError(f"不支持写入 Parquet 副本的类型：{type(val).__name__}")
+
+
+def decode_value(tag: str, text):
+    """encode_value 的逆操作；未知的类型标记抛出 ValueError"""
+    try:
+        decoder = _DECODERS[tag]
+    except KeyError:
+        raise ValueError(f"未知的类型标记：{tag}")
+    return decoder(text)
+
+
+def frame_to_parquet(df: pd.DataFrame) -> bytes:
+    """将 DataFrame（不含索引）无损写为 Parquet 字节；含无法表示的单元格类型时抛出 TypeError"""
+    encoded, tagged = {}, []
+    for i in range(df.shape[1]):
+        key, col = str(i), df.iloc[:, i].reset_index(drop=True)
+        if col.dtype == object and not _is_plain_text(col):
+            pairs = [encode_value(val) for val in col]
+            encoded[key] = pd.Series([text for _, text in pairs], dtype=object)
+            encoded[key + TYPE_SUFFIX] = pd.Series([tag for tag, _ in pairs], dtype=object)
+            tagged.append(key)
+        else:
+            encoded[key] = col
+    encoded = pd.DataFrame(encoded, index=pd.RangeIndex(len(df)))
+
+    table = pa.Table.from_pandas(encoded, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[COLUMNS_KEY] = json.dumps([encode_value(col) for col in df.columns], ensure_ascii=False).encode("utf-8")
+    metadata[TAGGED_COLUMNS_KEY] = json.dumps(tagged).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+
+    buffer = BytesIO()
+    pq.write_table(table, buffer, compression=PARQUET_COMPRESSION)
+    return buffer.getvalue()
+
+
+def parquet_to_frame(file_obj) -> pd.DataFrame:
+    """读取 frame_to_parquet 写出的内容，还原为与原 DataFrame 一致的结果；不是该格式时抛出 ValueError"""
+    table = pq.read_table(file_obj)
+    metadata = table.schema.metadata or {}
+    if COLUMNS_KEY not in metadata:
+        raise ValueError("Parquet 文件缺少列名元数据")
+    df = table.to_pandas()
+    for key in json.loads(metadata.get(TAGGED_COLUMNS_KEY, b"[]")):
+        tags = df.pop(key + TYPE_SUFFIX)
+        df[key] = pd.Series([decode_value(tag, text) for tag, text in zip(tags, df[key])], index=df.index, dtype=object)
+    df.columns = [decode_value(tag, text) for tag, text in json.loads(metadata[COLUMNS_KEY])]
+    return df
+
+
+def verified_manifest(manifest: dict, source_shas: dict) -> dict:
+    """
+    只保留仍与 xlsx 原件对应的条目：manifest 版本一致，且记录的 source_sha 与仓库中 xlsx 当前的 blob SHA 相同。
+    xlsx 在应用之外被更新或删除后，旧的 Parquet 副本不再使用。
+
+    参数:
+    - source_shas: {仓库中的路径: blob SHA}，见 GitHubClient.file_shas
+    """
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    entries = {}
+    for name, entry in manifest.get("files", {}).items():
+        if entry.get("source_sha") and source_shas.get(entry.get("source")) == entry["source_sha"]:
+            entries[name] = entry
+        else:
+            print(f"⚠️ Parquet 副本与 xlsx 原件不一致，改用 xlsx：{name}")
+    return dict(manifest, files=entries)
+
+
+def build_history_files(frames: dict, manifest: dict = None):
+    """
+    为本次上传的 xlsx 生成 Parquet 副本并更新 manifest。
+
+    参数:
+    - frames: {xlsx 文件名: (DataFrame, 原始 xlsx 字节, 读取的 sheet)}
+    - manifest: GitHub 上现有的 manifest，未上传的文件条目原样保留
+
+    返回:
+    - {仓库中的路径: bytes}，包含各 Parquet 文件与 manifest.json；未安装 pyarrow 时返回空 dict
+    """
+    if pq is None or not frames:
+        return {}
+
+    manifest = dict(manifest or {})
+    entries = dict(manifest.get("files", {}))
+    files = {}
+    for name, (df, source, sheet_name) in frames.items():
+        try:
+            content = frame_to_parquet(df)
+        except TypeError as e:
+            # 只上传 xlsx，旧副本的条目一并移除
+            print(f"⚠️ 未生成 Parquet 副本：{name} - {e}")
+            entries.pop(name, None)
+            continue
+        path = parquet_path(name)
+        files[path] = content
+        entries[name] = {
+            "source": quote(name),
+            "source_sha": git_blob_sha(source),
+            "parquet": path,
+            "sha": git_blob_sha(content),
+            "sheet": sheet_name,
+            "rows": len(df),
+            "columns": [{"name": str(col), "dtype": str(dtype)} for col, dtype in df.dtypes.items()],
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    manifest.update(version=MANIFEST_VERSION, files=entries)
+    files[MANIFEST_PATH] = json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+    return files
@@ -0,0 +1,253 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+import github_utils
+from config import CONFIG, customer_name
+from fake_github import FakeGitHub
+from github_utils import GitHubClient
+from history_loader import FALLBACK_FILES
+from pipeline import STAGE_CACHE
+
+
+# 以脚本运行时，AppTest 会话中的 import loadtest 应取到同一个模块（共享 _inputs）
+sys.modules.setdefault("loadtest", sys.modules[__name__])
+
+# 随仓库提供的示例辅助文件（仓库根目录，文件名为 URL 编码后的 "<客户>-<表名>.xlsx"）
+SAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+PERCENTILES = [50, 90, 95, 99]
+# main.get_uploaded_files 返回的辅助文件顺序
+UPLOAD_ORDER = ["预测.xlsx", "安全库存.xlsx", "新旧料号.xlsx", "到货明细.xlsx", "下单明细.xlsx", "销货明细.xlsx"]
+SUCCESS_MESSAGE = "汇总完成"
+
+# 各会话的客户前缀与上传的文件：{"customer": 客户前缀, "core": {文件名: bytes}, "aux": {不带前缀的文件名: bytes}}，
+# run_load_test 中设置
+_inputs = {"customer": None, "core": {}, "aux": {}}
+
+
+def sample_workbooks(customer: str = None, sample_dir: str = SAMPLE_DIR) -> dict:
+    """随仓库提供的示例辅助文件：{不带前缀的文件名: bytes}，缺失的文件不列出"""
+    samples = {}
+    for base in FALLBACK_FILES:
+        path = os.path.join(sample_dir, quote(customer_name(base, customer)))
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                samples[base] = f.read()
+    return samples
+
+
+def core_workbooks(input_dir: str, customer: str = None) -> dict:
+    """input_dir 中的核心文件：{带前缀的文件名: bytes}"""
+    files = {}
+    for base in CONFIG["pivot_config"]:
+        name = customer_name(base, customer)
+        path = os.path.join(input_dir, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                files[name] = f.read()
+    return files
+
+
+class _Upload(BytesIO):
+    """模拟 st.file_uploader 返回的 UploadedFile（BytesIO + name）"""
+
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+
+
+def fake_uploads():
+    """
+    替换 main.get_uploaded_files：返回与上传控件相同结构的结果，并直接点击“生成”。
+    每次调用都生成新的文件对象，各会话互不影响。
+    """
+    customer = _inputs["customer"]
+    uploaded = {name: _Upload(name, data) for name, data in _inputs["core"].items()}
+    aux = [
+        _Upload(customer_name(base, customer), _inputs["aux"][base]) if base in _inputs["aux"] else None
+        for base in UPLOAD_ORDER
+    ]
+    return (uploaded, *aux, True)
+
+
+def _app():
+    import streamlit as st
+    import main
+    import loadtest
+
+    # 与客户前缀输入框相同：客户保存在本会话的 session_state 中
+    st.session_state.setdefault("customer", loadtest._inputs["customer"])
+    main.get_uploaded_files = loadtest.fake_uploads
+    main.main()
+
+
+def current_rss() -> int:
+    """当前进程的常驻内存（字节）；无 /proc 时退回到进程启动以来的峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemorySampler:
+    """后台定期采样常驻内存，记录峰值"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.start_rss = self.peak_rss = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+
+def run_session(timeout: float) -> dict:
+    """
+    用 AppTest 运行一个会话：上传文件并生成报告。
+
+    返回:
+    - {"seconds": 耗时, "error": 失败原因，成功时为 None}
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_function(_app, default_timeout=timeout)
+    start = time.perf_counter()
+    try:
+        at.run()
+    except Exception as e:
+        return {"seconds": time.perf_counter() - start, "error": f"{type(e).__name__}: {e}"}
+    seconds = time.perf_counter() - start
+
+    if at.exception:
+        return {"seconds": seconds, "error": at.exception[0].message}
+    if not any(SUCCESS_MESSAGE in element.value for element in at.success):
+        errors = [element.value for element in at.error]
+        return {"seconds": seconds, "error": errors[0] if errors else "未生成报告"}
+    return {"seconds": seconds, "error": None}
+
+
+def run_level(concurrency: int, rounds: int = 1, timeout: float = 600, warm: bool = False) -> dict:
+    """
+    以 concurrency 个并发会话运行 concurrency × rounds 次报告生成。
+
+    参数:
+    - warm: 为 False 时先清空流水线阶段缓存，每个并发级别都从解析开始计算
+
+    返回:
+    - 该并发级别的延迟分位数、吞吐量与峰值内存
+    """
+    if not warm:
+        STAGE_CACHE.clear()
+    sessions = concurrency * rounds
+    with MemorySampler() as memory, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda _: run_session(timeout), range(sessions)))
+        elapsed = time.perf_counter() - start
+
+    latencies = np.array([result["seconds"] for result in results])
+    errors = [result["error"] for result in results if result["error"] is not None]
+    row = {"并发数": concurrency, "会话数": sessions, "失败数": len(errors)}
+    for p in PERCENTILES:
+        row[f"P{p}(秒)"] = round(float(np.percentile(latencies, p)), 2)
+    row["最大(秒)"] = round(float(latencies.max()), 2)
+    row["吞吐(次/分钟)"] = round((sessions - len(errors)) / elapsed * 60, 2)
+    row["峰值内存(MB)"] = round(memory.peak_rss / 2 ** 20, 1)
+    row["内存增量(MB)"] = round((memory.peak_rss - memory.start_rss) / 2 ** 20, 1)
+    for error in Counter(errors):
+        print(f"❌ 并发 {concurrency}：{error}")
+    return row
+
+
+def prepare_environment(workdir: str, api_url: str):
+    """将 GitHub 请求指向本地模拟服务，并把上传队列、事实库等本地状态放到 workdir 中"""
+    CONFIG["upload_queue"] = dict(CONFIG["upload_queue"], dir=os.path.join(workdir, ".upload_queue"))
+    CONFIG["fact_store"] = dict(CONFIG["fact_store"], path=os.path.join(workdir, ".fact_store", "facts.sqlite"))
+    CONFIG["mapping_cache"] = dict(CONFIG["mapping_cache"], dir=os.path.join(workdir, ".mapping_cache"))
+    CONFIG["column_widths"] = dict(CONFIG["column_widths"], cache=os.path.join(workdir, ".column_widths.json"))
+    github_utils._default_client = GitHubClient(token="loadtest", api_url=api_url, cache_dir=None)
+
+
+def run_load_test(input_dir: str, levels, rounds: int = 1, timeout: float = 600, warm: bool = False,
+                  from_history: bool = False, customer: str = None) -> pd.DataFrame:
+    """
+    在本进程内对 main.main 做并发压测。
+
+    参数:
+    - input_dir: 核心文件所在目录（文件名为 "<客户>-<表名>.xlsx"）
+    - levels: 并发级别列表，如 [1, 2, 4, 8]
+    - rounds: 每个并发级别运行的轮数
+    - from_history: 为 True 时会话不上传辅助文件，改为从模拟 GitHub 读取历史版本
+    - customer: 客户前缀，默认取 CONFIG["customer"]
+
+    返回:
+    - 每个并发级别一行的结果表
+    """
+    customer = customer or CONFIG["customer"]
+    _inputs["customer"] = customer
+    samples = sample_workbooks(customer)
+    _inputs["core"] = core_workbooks(input_dir, customer)
+    _inputs["aux"] = {} if from_history else samples
+    if len(_inputs["core"]) < len(CONFIG["pivot_config"]):
+        raise FileNotFoundError(f"❌ {input_dir} 中的核心文件不全：{sorted(_inputs['core'])}")
+
+    fake = FakeGitHub({quote(customer_name(base, customer)): data for base, data in samples.items()})
+    api_url = fake.start()
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="semiexcel-loadtest-") as workdir:
+            prepare_environment(workdir, api_url)
+            for concurrency in levels:
+                row = run_level(concurrency, rounds, timeout, warm)
+                print(f"✅ 并发 {concurrency}：P50 {row['P50(秒)']} 秒，P95 {row['P95(秒)']} 秒，"
+                      f"吞吐 {row['吞吐(次/分钟)']} 次/分钟，峰值内存 {row['峰值内存(MB)']} MB")
+                rows.append(row)
+    finally:
+        fake.stop()
+    print(f"☁️ 模拟 GitHub 请求数：{dict(fake.calls)}")
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="报告生成并发压测（AppTest 驱动 main.main，GitHub 使用本地模拟服务）")
+    parser.add_argument("--input-dir", required=True, help="核心文件所在目录")
+    parser.add_argument("--levels", default="1,2,4", help="并发级别，逗号分隔，默认 1,2,4")
+    parser.add_argument("--rounds", type=int, default=1, help="每个并发级别运行的轮数")
+    parser.add_argument("--timeout", type=float, default=600, help="单个会话的超时时间（秒）")
+    parser.add_argument("--warm", action="store_true", help="不清空阶段缓存（相同输入直接复用上一轮结果）")
+    parser.add_argument("--history", action="store_true", help="辅助文件不上传，从模拟 GitHub 读取历史版本")
+    parser.add_argument("--customer", default=None, help="客户前缀，默认取配置")
+    parser.add_argument("--output", default=None, help="结果另存为 CSV")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    result = run_load_test(args.input_dir, levels, args.rounds, args.timeout, args.warm, args.history, args.customer)
+    print(result.to_string(index=False))
+    if args.output:
+        result.to_csv(args.output, index=False, encoding="utf-8-sig")
+
+
+if __name__ == "__main__":
+    main()
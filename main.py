@@ -3,90 +3,128 @@ from io import BytesIO
 from datetime import datetime
 import pandas as pd
 from pivot_processor import PivotProcessor
-from ui import setup_sidebar, get_uploaded_files
-from github_utils import upload_to_github, download_from_github
+from ui import setup_sidebar, get_uploaded_files, report_options, render_report_preview, render_upload_status, render_scenario
+from history_loader import get_history_loader, fallback_sheet
+from config import customer_name
+from upload_queue import get_upload_queue
+from history_store import build_history_files
 from urllib.parse import quote
+from scenario import PlanScenario
+from scope import ProductScope
 
 
 def main():
     st.set_page_config(page_title="Excel数据透视汇总工具", layout="wide")
     setup_sidebar()
 
+    # ☁️ 后台上传队列：启动时恢复上次未完成的上传，侧边栏显示进度
+    upload_queue = get_upload_queue()
+    render_upload_status(upload_queue)
+
+    # 📂 会话开始时在后台预取 GitHub 上的历史文件，用户上传核心文件期间完成下载与解析
+    history_loader = get_history_loader()
+    if not st.session_state.get("history_prefetched"):
+        history_loader.prefetch(customer=report_options()["customer"])
+        st.session_state["history_prefetched"] = True
+
     # 获取上传文件（包括新增的 3 个明细文件）
     uploaded_files, forecast_file, safety_file, mapping_file, arrival_file, order_file, sales_file, start = get_uploaded_files()
 
     if start:
+        options = report_options()
         if len(uploaded_files) < 5:
             st.error("❌ 请上传所有 5 个主要文件后再点击生成！")
             return
+        # 🔎 报告范围：本次生成与文件名使用同一个对象
+        try:
+            scope = ProductScope.from_config(options["scope"])
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
 
+        customer = options["customer"]
         github_files = {
-            "赛卓-预测.xlsx": forecast_file,
-            "赛卓-安全库存.xlsx": safety_file,
-            "赛卓-新旧料号.xlsx": mapping_file,
-            "赛卓-到货明细.xlsx": arrival_file,
-            "赛卓-下单明细.xlsx": order_file,
-            "赛卓-销货明细.xlsx": sales_file
+            customer_name("预测.xlsx", customer): forecast_file,
+            customer_name("安全库存.xlsx", customer): safety_file,
+            customer_name("新旧料号.xlsx", customer): mapping_file,
+            customer_name("到货明细.xlsx", customer): arrival_file,
+            customer_name("下单明细.xlsx", customer): order_file,
+            customer_name("销货明细.xlsx", customer): sales_file
         }
 
         additional_sheets = {}
+        pending_uploads = {}
+        uploaded_frames = {}
+
+        # 📂 未上传的文件使用 GitHub 历史版本（复用会话开始时的预取；未预取或结果已过期的重新并发加载）
+        history_loader.prefetch([name for name, file in github_files.items() if not file], customer)
 
         for name, file in github_files.items():
-            sheet_name = 0
-            if name == "赛卓-预测.xlsx":
-                sheet_name = "Sheet1"
+            sheet_name = fallback_sheet(name, customer)
             if file:
                 file_bytes = file.read()
                 file_io = BytesIO(file_bytes)
-                safe_name = quote(name)
-                upload_to_github(BytesIO(file_bytes), safe_name)
+                pending_uploads[quote(name)] = file_bytes
                 df = pd.read_excel(file_io, sheet_name=sheet_name)
                 additional_sheets[name.replace(".xlsx", "")] = df
+                uploaded_frames[name] = (df, file_bytes, sheet_name)
             else:
-                try:
-                    safe_name = quote(name)
-                    content = download_from_github(safe_name)
-                    df = pd.read_excel(BytesIO(content), sheet_name=sheet_name)
-                    additional_sheets[name.replace(".xlsx", "")] = df
-                    st.info(f"📂 使用了 GitHub 上存储的历史版本：{name}")
-                except FileNotFoundError:
+                df = history_loader.load(name, customer)
+                if df is None:
                     st.warning(f"⚠️ 未提供且未在 GitHub 找到历史文件：{name}")
+                    continue
+                additional_sheets[name.replace(".xlsx", "")] = df
+                st.info(f"📂 使用了 GitHub 上存储的历史版本：{name}")
+
+        # 🗃️ 同时提交 Parquet 副本与 manifest，之后的历史加载优先读取副本（xlsx 原件保留备查）
+        if uploaded_frames:
+            pending_uploads.update(build_history_files(uploaded_frames, history_loader.manifest()))
+
+        # ☁️ 上传的文件交给后台队列合并为一次提交，与报告生成同时进行
+        if upload_queue.enqueue(pending_uploads):
+            st.info("☁️ 上传文件已加入后台队列，进度见侧边栏")
 
         # 🔄 调试显示额外数据名
         # st.write("📘 额外数据已准备：", list(additional_sheets.keys()))
 
         # 生成 Excel 汇总
         buffer = BytesIO()
-        processor = PivotProcessor()
-        processor.process(uploaded_files, buffer, additional_sheets)
+        processor = PivotProcessor(
+            customer=customer,
+            selected_month=options["selected_month"],
+            profile=options["profile"],
+            memory_budget=options["memory_budget"],
+        )
+        result = processor.process(uploaded_files, buffer, additional_sheets, scope=scope)
+        if result is None:
+            return
 
-        file_name = f"运营数据订单-在制-库存汇总报告_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        report_bytes, frames = result
+        # 🔎 按范围生成的草稿报告在文件名中标明
+        draft = "范围草稿-" if scope.active else ""
+        file_name = f"{draft}运营数据订单-在制-库存汇总报告_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        # 保存到 session_state，切换预览 sheet / 翻页触发重跑时无需重新生成
+        st.session_state["report"] = {
+            "data": report_bytes, "file_name": file_name, "frames": frames,
+            # 🧪 保留投单计划的计算输入，模拟时只重算计划
+            "scenario": PlanScenario(**processor.plan_inputs),
+        }
+        st.session_state.pop("scenario_result", None)
+
+    report = st.session_state.get("report")
+    if report:
         st.success("✅ 汇总完成！你可以下载结果文件：")
         st.download_button(
             label="📥 下载 Excel 汇总报告",
-            data=buffer.getvalue(),
-            file_name=file_name,
+            data=report["data"],
+            file_name=report["file_name"],
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
 
-        # 🧾 预览生成的每个 sheet
-        try:
-            buffer.seek(0)
-            with pd.ExcelFile(buffer, engine="openpyxl") as xls:
-                sheet_names = xls.sheet_names
-                tabs = st.tabs(sheet_names)
-
-                for i, sheet_name in enumerate(sheet_names):
-                    try:
-                        df = pd.read_excel(xls, sheet_name=sheet_name)
-                        with tabs[i]:
-                            st.subheader(f"📄 {sheet_name}")
-                            st.dataframe(df, use_container_width=True)
-                    except Exception as e:
-                        with tabs[i]:
-                            st.error(f"无法读取工作表 `{sheet_name}`: {e}")
-        except Exception as e:
-            st.warning(f"⚠️ 预览 Excel 报告失败：{e}")
+        # 🧾 直接用内存中的 DataFrame 预览，不再回读生成的 Excel
+        render_report_preview(report["frames"])
+
+        render_scenario(report["scenario"])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+import os
+import pickle
+import threading
+
+from config import CONFIG
+from mapping_utils import CompiledMapping
+
+
+# 编译结果的格式版本，CompiledMapping 的内容变化时递增，旧版本的文件会被重新编译
+ARTIFACT_VERSION = 1
+
+
+class MappingStore:
+    """
+    新旧料号表编译结果的磁盘缓存：cache_dir/<映射表内容摘要>.pkl。
+
+    映射表内容不变时直接读取编译结果（毫秒级），不再重新命名列、清洗与计算传递闭包；
+    文件中记录格式版本，与 ARTIFACT_VERSION 不一致时视为不存在。
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 8):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.pkl")
+
+    def load(self, digest: str):
+        """读取编译结果，不存在、版本不符或文件损坏时返回 None"""
+        try:
+            with open(self._path(digest), "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if data.get("version") != ARTIFACT_VERSION or data.get("digest") != digest:
+            return None
+        return CompiledMapping.from_dict(data["mapping"])
+
+    def save(self, digest: str, compiled: CompiledMapping):
+        """写入编译结果（先写临时文件再替换），只保留最近的 max_entries 份"""
+        path = self._path(digest)
+        data = {"version": ARTIFACT_VERSION, "digest": digest, "mapping": compiled.to_dict()}
+        with self._lock:
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+            self._prune()
+
+    def _prune(self):
+        entries = sorted(
+            (os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".pkl")),
+            key=os.path.getmtime
+        )
+        for stale in entries[:-self.max_entries]:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    def get(self, digest: str, mapping_df):
+        """
+        返回映射表的编译结果，缓存中没有时编译并保存。
+
+        参数:
+        - digest: 原始映射表的内容摘要
+        - mapping_df: 原始映射表，仅在需要重新编译时使用
+
+        返回:
+        - (CompiledMapping, 是否来自缓存)
+        """
+        compiled = self.load(digest)
+        if compiled is not None:
+            return compiled, True
+        compiled = CompiledMapping.from_mapping_df(mapping_df)
+        try:
+            self.save(digest, compiled)
+        except OSError as e:
+            print(f"⚠️ 新旧料号编译结果写入失败：{e}")
+        return compiled, False
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_mapping_store():
+    """返回进程内共享的 MappingStore；未配置 CONFIG["mapping_cache"]["dir"] 时返回 None"""
+    global _default_store
+    cache_dir = CONFIG.get("mapping_cache", {}).get("dir")
+    if not cache_dir:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = MappingStore(cache_dir)
+        return _default_store
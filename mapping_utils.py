@@ -75,3 +75,199 @@ def apply_extended_substitute_mapping(df, mapping_df, field_map, verbose=True):
     
 
 
+
+
+# 新旧料号表按位置命名的 22 列
+MAPPING_COLUMNS = [
+    "旧规格", "旧品名", "旧晶圆品名",
+    "新规格", "新品名", "新晶圆品名",
+    "封装厂", "PC", "半成品", "备注",
+    "替代规格1", "替代品名1", "替代晶圆1",
+    "替代规格2", "替代品名2", "替代晶圆2",
+    "替代规格3", "替代品名3", "替代晶圆3",
+    "替代规格4", "替代品名4", "替代晶圆4"
+]
+
+SUBSTITUTE_COLUMNS = [f"替代品名{i}" for i in range(1, 5)]
+
+# 映射表中视为空白的品名（含 NaN 经 astype(str) 后的 'nan'）
+EMPTY_PARTS = {"", "nan", "None"}
+
+
+def clean_part_names(series: pd.Series) -> pd.Series:
+    """品名统一清洗：转字符串、去首尾空格与换行"""
+    return series.astype(str).str.strip().str.replace("\n", "").str.replace("\r", "")
+
+
+def _first_edges(sources: pd.Series, targets: pd.Series, edges: dict, conflicts: dict):
+    """
+    按行顺序登记 source → target 的边，同一 source 以第一条为准；
+    后续指向不同 target 的行记入 conflicts。
+    """
+    for source, target in zip(sources, targets):
+        if source in EMPTY_PARTS or target in EMPTY_PARTS or source == target:
+            continue
+        if source not in edges:
+            edges[source] = target
+        elif edges[source] != target:
+            conflicts.setdefault(source, [edges[source]]).append(target)
+
+
+def _closure(edges: dict):
+    """
+    沿 source → target 一直走到终点，得到每个品名的最终品名。
+
+    环路（如替代品名互指 A→B→A）上的品名归并为同一个品名：取环上最早登记的一条边的 target；
+    指向环路的链同样归并到该品名。
+
+    返回:
+    - ({品名: 最终品名}，只含发生变化的品名, [环路品名列表])
+    """
+    order = {source: i for i, source in enumerate(edges)}
+    resolved, cycles = {}, []
+    for start in edges:
+        path, on_path = [], {}
+        node = start
+        while node in edges and node not in resolved and node not in on_path:
+            on_path[node] = len(path)
+            path.append(node)
+            node = edges[node]
+
+        if node in on_path:
+            cycle = path[on_path[node]:]
+            cycles.append(cycle)
+            final = edges[min(cycle, key=order.get)]
+        else:
+            final = resolved.get(node, node)
+
+        for part in path:
+            resolved[part] = final
+
+    return {part: final for part, final in resolved.items() if part != final}, cycles
+
+
+class PartMapping:
+    """
+    由新旧料号表预先计算的料号对照（传递闭包），每行只需一次字典查找。
+
+    - renames: 旧品名 → 新品名 的闭包，A→B→C 直接得到 C
+    - canonical: 旧品名与替代品名合并后的闭包；同一品名既是旧品名又是替代品名时以新旧料号为准
+    - 同一旧品名对应多个新品名时以表中第一行为准，记入 conflicts
+    - 环路上的品名归并为同一品名，记入 cycles
+
+    只依赖映射表内容，可按映射表版本缓存。
+    """
+
+    def __init__(self, renames: dict, canonical: dict, conflicts: dict = None, cycles: list = None):
+        self.renames = renames
+        self.canonical = canonical
+        self.conflicts = conflicts or {}
+        self.cycles = cycles or []
+
+    @classmethod
+    def from_mapping_df(cls, mapping_df: pd.DataFrame) -> "PartMapping":
+        """
+        参数:
+        - mapping_df: 已按 MAPPING_COLUMNS 命名列的新旧料号表
+        """
+        if mapping_df.empty:
+            return cls({}, {})
+
+        rename_edges, conflicts = {}, {}
+        _first_edges(clean_part_names(mapping_df["旧品名"]), clean_part_names(mapping_df["新品名"]),
+                     rename_edges, conflicts)
+        renames, _ = _closure(rename_edges)
+
+        substitute_edges = {}
+        new_names = clean_part_names(mapping_df["新品名"])
+        for col in SUBSTITUTE_COLUMNS:
+            if col in mapping_df.columns:
+                _first_edges(clean_part_names(mapping_df[col]), new_names, substitute_edges, conflicts)
+        # 新旧料号的环路必然也出现在合并后的图中
+        canonical, cycles = _closure({**substitute_edges, **rename_edges})
+        return cls(renames, canonical, conflicts, cycles)
+
+    def resolve(self, names: pd.Series, substitutes: bool = True) -> pd.Series:
+        """
+        将品名替换为最终品名。
+
+        参数:
+        - names: 品名列
+        - substitutes: 是否同时替换替代品名；False 时只做新旧料号替换
+
+        返回:
+        - 清洗并替换后的品名列
+        """
+        names = clean_part_names(names)
+        table = self.canonical if substitutes else self.renames
+        return names.map(table).fillna(names) if table else names
+
+    def apply(self, df: pd.DataFrame, field_map: dict, substitutes: bool = True):
+        """
+        替换 df 中的品名字段。
+
+        返回:
+        - (替换后的 DataFrame, 被替换成的品名集合)
+        """
+        name_col = field_map["品名"]
+        df = df.copy()
+        original = clean_part_names(df[name_col])
+        table = self.canonical if substitutes else self.renames
+        df[name_col] = original.map(table).fillna(original) if table else original
+        changed = original != df[name_col]
+        return df, set(df.loc[changed, name_col])
+
+
+class CompiledMapping:
+    """
+    新旧料号表的编译结果，只依赖映射表内容，可序列化后按内容摘要缓存到磁盘。
+
+    - mapping_df: 按 MAPPING_COLUMNS 命名列后的映射表
+    - parts: 料号替换表（PartMapping）
+    - semi_finished: 含半成品的行（新品名、旧品名、半成品），用于计算半成品在制
+    - products: 去重后的新产品维度（新规格、新品名、新晶圆品名）
+    """
+
+    def __init__(self, mapping_df: pd.DataFrame, parts: PartMapping,
+                 semi_finished: pd.DataFrame, products: pd.DataFrame):
+        self.mapping_df = mapping_df
+        self.parts = parts
+        self.semi_finished = semi_finished
+        self.products = products
+
+    @classmethod
+    def from_mapping_df(cls, mapping_df: pd.DataFrame) -> "CompiledMapping":
+        """
+        参数:
+        - mapping_df: 读取的原始新旧料号表（前 22 列按位置命名）
+        """
+        mapping_df = mapping_df.copy()
+        if mapping_df.empty:
+            return cls(mapping_df, PartMapping({}, {}),
+                       pd.DataFrame(columns=["新品名", "旧品名", "半成品"]),
+                       pd.DataFrame(columns=["新规格", "新品名", "新晶圆品名"]))
+
+        mapping_df.columns = MAPPING_COLUMNS + list(mapping_df.columns[22:])
+        semi_rows = mapping_df[mapping_df["半成品"].notna() & (mapping_df["半成品"] != "")]
+        return cls(
+            mapping_df,
+            PartMapping.from_mapping_df(mapping_df),
+            semi_rows[["新品名", "旧品名", "半成品"]].copy(),
+            mapping_df[["新规格", "新品名", "新晶圆品名"]].drop_duplicates().reset_index(drop=True),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "mapping_df": self.mapping_df,
+            "renames": self.parts.renames,
+            "canonical": self.parts.canonical,
+            "conflicts": self.parts.conflicts,
+            "cycles": self.parts.cycles,
+            "semi_finished": self.semi_finished,
+            "products": self.products,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CompiledMapping":
+        parts = PartMapping(data["renames"], data["canonical"], data["conflicts"], data["cycles"])
+        return cls(data["mapping_df"], parts, data["semi_finished"], data["products"])
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from config import CONFIG
+
+
+INT32 = np.iinfo(np.int32)
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """DataFrame 占用的内存（字节，含 object 列中字符串本身）"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def downcast_numeric(col: pd.Series) -> pd.Series:
+    """
+    无损降低数值列的精度：整数在 int32 范围内时转为 int32，浮点数转 float32 后数值不变时转为 float32。
+    无法无损转换时原样返回；object 列（数字与文本混排）不做转换。
+    """
+    if pd.api.types.is_bool_dtype(col) or not pd.api.types.is_numeric_dtype(col):
+        return col
+
+    values = col.to_numpy()
+    if col.dtype.kind in "iu" and col.dtype.itemsize > 4:
+        if values.size == 0 or (values.min() >= INT32.min and values.max() <= INT32.max):
+            return col.astype(np.int32)
+    elif col.dtype.kind == "f" and col.dtype.itemsize > 4:
+        narrowed = values.astype(np.float32)
+        if np.array_equal(narrowed.astype(values.dtype), values, equal_nan=True):
+            return pd.Series(narrowed, index=col.index, name=col.name)
+    return col
+
+
+def optimize_frame(df: pd.DataFrame, categorical_columns=None, max_category_ratio: float = None):
+    """
+    内存预算模式下压缩 DataFrame：数值列无损降精度，低基数文本列转为 category。
+
+    参数:
+    - df: 原始数据（不修改）
+    - categorical_columns: 允许转为 category 的列名，默认取 CONFIG["memory_budget"]["categorical_columns"]
+    - max_category_ratio: 不同取值数 / 行数 不超过该比例时才转为 category
+
+    返回:
+    - (压缩后的 DataFrame, 压缩前字节数, 压缩后字节数)；没有可压缩的列时返回原 DataFrame
+    """
+    budget = CONFIG.get("memory_budget", {})
+    if categorical_columns is None:
+        categorical_columns = budget.get("categorical_columns", [])
+    if max_category_ratio is None:
+        max_category_ratio = budget.get("max_category_ratio", 0.5)
+
+    before = frame_memory(df)
+    changed = {}
+    for i, col in enumerate(df.columns):
+        series = df.iloc[:, i]
+        if col in categorical_columns and series.dtype == object and len(series):
+            if series.nunique(dropna=False) <= max_category_ratio * len(series):
+                changed[i] = series.astype("category")
+            continue
+        narrowed = downcast_numeric(series)
+        if narrowed.dtype != series.dtype:
+            changed[i] = narrowed
+
+    if not changed:
+        return df, before, before
+
+    # 按位置替换，列名重复时也不会错位
+    optimized = pd.concat(
+        [changed.get(i, df.iloc[:, i]) for i in range(df.shape[1])], axis=1, keys=range(df.shape[1])
+    )
+    optimized.columns = df.columns
+    optimized.index = df.index
+    return optimized, before, frame_memory(optimized)
+
+
+def widen_numeric(df: pd.DataFrame, columns=None) -> pd.DataFrame:
+    """将（降精度后的）数值列恢复为 64 位，求和等聚合前使用，避免 float32 / int32 累加丢失精度"""
+    dtypes = {}
+    for col, dtype in df.dtypes.items():
+        if columns is not None and col not in columns:
+            continue
+        if pd.api.types.is_bool_dtype(dtype) or not pd.api.types.is_numeric_dtype(dtype):
+            continue
+        if dtype.kind == "f" and dtype.itemsize < 8:
+            dtypes[col] = np.float64
+        elif dtype.kind in "iu" and dtype.itemsize < 8:
+            dtypes[col] = np.int64
+    return df.astype(dtypes) if dtypes else df
+
+
+def memory_report(stats: dict) -> pd.DataFrame:
+    """
+    汇总各表的内存压缩结果。
+
+    参数:
+    - stats: {表名: (压缩前字节数, 压缩后字节数)}
+
+    返回:
+    - 表名 / 压缩前(MB) / 压缩后(MB) / 节省比例 的 DataFrame
+    """
+    rows = []
+    for name, (before, after) in stats.items():
+        rows.append({
+            "表名": name,
+            "压缩前(MB)": round(before / 2 ** 20, 2),
+            "压缩后(MB)": round(after / 2 ** 20, 2),
+            "节省比例": f"{(1 - after / before):.0%}" if before else "0%",
+        })
+    return pd.DataFrame(rows, columns=["表名", "压缩前(MB)", "压缩后(MB)", "节省比例"])
@@ -0,0 +1,264 @@
+import os
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+
+def hash_bytes(data: bytes) -> str:
+    """计算二进制内容的 sha1 摘要"""
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_frame(df: pd.DataFrame) -> str:
+    """
+    计算 DataFrame 的内容摘要（列名 + 单元格值 + 索引）。
+    混合类型列无法直接哈希时退回到 pickle。
+    """
+    h = hashlib.sha1()
+    h.update(repr([str(col) for col in df.columns]).encode("utf-8"))
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    except TypeError:
+        h.update(pickle.dumps(df))
+    return h.hexdigest()
+
+
+def hash_value(value) -> str:
+    """计算任意输入的摘要：bytes / DataFrame / 其他可 repr 的值"""
+    if isinstance(value, (bytes, bytearray)):
+        return hash_bytes(bytes(value))
+    if isinstance(value, pd.DataFrame):
+        return hash_frame(value)
+    return hash_bytes(repr(value).encode("utf-8"))
+
+
+class StageCache:
+    """
+    阶段结果缓存：键为阶段名 + 输入摘要，按 LRU 淘汰。
+    模块级实例在 Streamlit 的多次重跑之间保留。
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+STAGE_CACHE = StageCache()
+
+# 当前线程正在执行的阶段的 StageLog
+_local = threading.local()
+
+
+class StageLog:
+    """
+    阶段执行期间产生的提示消息与统计数据，与阶段结果一同缓存。
+    命中缓存时原样取回，由 StageGraph.replay 在会话线程中输出，不会因复用结果而丢失。
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.stats = {}
+
+
+def notify(level: str, message):
+    """
+    阶段内的提示消息，level 为 st 的输出方法名（success / info / warning / error / write）。
+    在阶段内调用时记入当前阶段的 StageLog，不在阶段内时直接输出。
+    """
+    log = getattr(_local, "log", None)
+    if log is None:
+        getattr(st, level)(message)
+    else:
+        log.messages.append((level, message))
+
+
+def record_stat(kind: str, name: str, value):
+    """记录阶段内的统计数据（如内存预算模式下各表压缩前后的字节数），由 StageGraph.stats 汇总"""
+    log = getattr(_local, "log", None)
+    if log is not None:
+        log.stats.setdefault(kind, {})[name] = value
+
+
+class StageGraph:
+    """
+    由命名阶段组成的有向无环图。
+
+    - add_input: 注册外部输入（上传文件、辅助表、配置项），按内容计算摘要
+    - add_stage: 注册阶段，deps 为 {参数名: 上游节点名}，params 为固定参数
+    - run: 按拓扑顺序执行；阶段键由上游键链式计算，键未变化时直接复用缓存结果
+
+    上游均已完成的阶段会提交到线程池并发执行（max_workers=1 时顺序执行）；
+    结果按阶段名保存，输出顺序与执行先后无关；timings 记录本次实际计算的阶段耗时（秒）。
+
+    阶段函数不得修改传入的对象（缓存结果会被多次复用）；返回 None 的阶段不缓存。
+    阶段读取的配置项须作为输入或参数登记，否则配置变化后仍会命中旧的缓存；
+    阶段内的提示通过 notify 记录（不直接调用 st.*），与结果一同缓存，由 replay 统一输出。
+    """
+
+    def __init__(self, cache: StageCache = None, max_workers: int = None):
+        self.cache = cache if cache is not None else STAGE_CACHE
+        self.max_workers = max_workers if max_workers is not None else min(8, os.cpu_count() or 1)
+        self.inputs = {}
+        self.stages = OrderedDict()
+        self.keys = {}
+        self.results = {}
+        self.recomputed = []
+        self.reused = []
+        self.timings = {}
+        self.logs = {}
+        self._replayed = set()
+
+    def add_input(self, name: str, value, digest: str = None):
+        self.inputs[name] = value
+        self.keys[name] = digest if digest is not None else hash_value(value)
+
+    def add_stage(self, name: str, func, deps: dict = None, params: dict = None):
+        self.stages[name] = (func, dict(deps or {}), dict(params or {}))
+
+    def _stage_key(self, name: str, deps: dict, params: dict) -> str:
+        parts = [name] + [f"{param}={self.keys[node]}" for param, node in deps.items()]
+        parts += [f"{param}={hash_value(value)}" for param, value in params.items()]
+        return hash_bytes("|".join(parts).encode("utf-8"))
+
+    def _order(self, targets=None):
+        """拓扑排序，保持注册顺序；存在环或缺失节点时报错"""
+        order, state = [], {}
+
+        def visit(name):
+            if name in self.inputs:
+                return
+            if name not in self.stages:
+                raise KeyError(f"未知的阶段或输入：{name}")
+            if state.get(name) == "visiting":
+                raise ValueError(f"阶段依赖存在环：{name}")
+            if state.get(name) == "done":
+                return
+            state[name] = "visiting"
+            for node in self.stages[name][1].values():
+                visit(node)
+            state[name] = "done"
+            order.append(name)
+
+        for name in (targets if targets is not None else self.stages):
+            visit(name)
+        return order
+
+    def _lookup(self, name: str) -> bool:
+        """计算阶段键并查询缓存，命中时直接写入结果"""
+        func, deps, params = self.stages[name]
+        key = self._stage_key(name, deps, params)
+        self.keys[name] = key
+
+        cached = self.cache.get(key)
+        if cached is None:
+            return False
+        self.results[name], self.logs[name] = cached
+        self.reused.append(name)
+        return True
+
+    def _compute(self, name: str, ctx=None):
+        if ctx is not None:
+            # 让工作线程中的 st.* 调用输出到当前会话
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+        func, deps, params = self.stages[name]
+        kwargs = {param: self._value(node) for param, node in deps.items()}
+        log = StageLog()
+        _local.log = log
+        start = time.perf_counter()
+        try:
+            value = func(**params, **kwargs)
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            self.logs[name] = log
+            _local.log = None
+        if value is not None:
+            self.cache.put(self.keys[name], (value, log))
+        self.results[name] = value
+        self.recomputed.append(name)
+
+    def _value(self, node: str):
+        return self.inputs[node] if node in self.inputs else self.results[node]
+
+    def _ready(self, name: str) -> bool:
+        return all(node in self.inputs or node in self.results for node in self.stages[name][1].values())
+
+    def run(self, targets=None) -> dict:
+        """执行全部阶段，或只执行 targets 及其上游；已执行的阶段不会重复执行"""
+        order = self._order(targets)
+        pending = [name for name in order if name not in self.results]
+
+        if self.max_workers <= 1:
+            for name in pending:
+                if not self._lookup(name):
+                    self._compute(name)
+        else:
+            ctx = get_script_run_ctx()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                running = {}
+                while pending or running:
+                    ready = [name for name in pending if self._ready(name)]
+                    while ready:
+                        # 缓存命中的阶段立即完成，可能使更多下游阶段就绪
+                        for name in ready:
+                            pending.remove(name)
+                            if not self._lookup(name):
+                                running[pool.submit(self._compute, name, ctx)] = name
+                        ready = [name for name in pending if self._ready(name)]
+
+                    if not running:
+                        if pending:
+                            raise RuntimeError(f"阶段无法调度：{pending}")
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        running.pop(future)
+                        future.result()
+
+        # 按注册顺序整理执行记录，与线程完成先后无关
+        rank = {name: i for i, name in enumerate(self.stages)}
+        self.recomputed.sort(key=rank.get)
+        self.reused.sort(key=rank.get)
+        return self.results
+
+    def replay(self):
+        """按注册顺序输出尚未输出过的阶段消息（包括复用缓存的阶段），在会话线程中调用"""
+        for name in self.stages:
+            if name in self.logs and name not in self._replayed:
+                self._replayed.add(name)
+                for level, message in self.logs[name].messages:
+                    getattr(st, level)(message)
+
+    def stats(self, kind: str) -> dict:
+        """按注册顺序合并各阶段记录的某类统计数据"""
+        merged = {}
+        for name in self.stages:
+            if name in self.logs:
+                merged.update(self.logs[name].stats.get(kind, {}))
+        return merged
@@ -1,33 +1,20 @@
-import os
 import io
-import re
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timedelta
 from openpyxl.utils import get_column_letter
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.styles import Alignment, Font, PatternFill
-from openpyxl import load_workbook
-from dateutil.relativedelta import relativedelta
-from config import CONFIG
+from config import CONFIG, OUTPUT_PROFILES, customer_name, base_name
 from excel_utils import (
-    adjust_column_width,
     clean_df,
     merge_header_for_summary, 
-    mark_unmatched_keys_on_sheet,
-    mark_keys_on_sheet,
     delete_duplicate_product_names,
     merge_duplicate_rows_by_key,
     clean_key_fields,
     mark_unmatched_keys_on_name,
     reorder_summary_columns,
-    clear_nan_cells,
-    get_column_index_by_name
-)
-from mapping_utils import (
-    apply_mapping_and_merge,
-    apply_extended_substitute_mapping
 )
+from mapping_utils import CompiledMapping
+from mapping_store import get_mapping_store
 from month_selector import process_history_columns
 from summary import (
     merge_safety_inventory,
@@ -37,653 +24,746 @@ from summary import (
     append_product_in_progress
 )
 from append_summary import append_forecast_unmatched_to_summary_by_keys
-from production_plan import insert_repeated_headers
+from production_plan import finished_goods_plan, semi_finished_plan
+from pipeline import StageGraph, hash_bytes, hash_value, notify, record_stat
+from cube import MonthlyCube, period_columns, resolve_months
+from fact_store import get_fact_store
+from memory_utils import optimize_frame, widen_numeric, memory_report
+from report_writer import ReportWriter, OPENPYXL, STREAM
+from scope import ProductScope, SCOPE_FIELDS
 
 
 FIELD_MAPPINGS = {
-    "赛卓-未交订单": {"规格": "规格", "品名": "品名", "晶圆品名": "晶圆品名"},
-    "赛卓-成品在制": {"规格": "产品规格", "品名": "产品品名", "晶圆品名": "晶圆型号"},
-    "赛卓-成品库存": {"规格": "规格", "品名": "品名", "晶圆品名": "WAFER品名"},
-    "赛卓-安全库存": {"规格": "OrderInformation", "品名": "ProductionNO.", "晶圆品名": "WaferID"},
-    "赛卓-预测": {"品名": "生产料号"},
-    "赛卓-到货明细.xlsx": {"品名": "品名"},
-    "赛卓-下单明细.xlsx": {"品名": "回货明细_回货品名"},
-    "赛卓-销货明细.xlsx": {"品名": "品名"}
+    "未交订单": {"规格": "规格", "品名": "品名", "晶圆品名": "晶圆品名"},
+    "成品在制": {"规格": "产品规格", "品名": "产品品名", "晶圆品名": "晶圆型号"},
+    "成品库存": {"规格": "规格", "品名": "品名", "晶圆品名": "WAFER品名"},
+    "安全库存": {"规格": "OrderInformation", "品名": "ProductionNO.", "晶圆品名": "WaferID"},
+    "预测": {"品名": "生产料号"},
+    "到货明细.xlsx": {"品名": "品名"},
+    "下单明细.xlsx": {"品名": "回货明细_回货品名"},
+    "销货明细.xlsx": {"品名": "品名"}
+}
+
+# 报告范围筛选使用的键列：在 FIELD_MAPPINGS 的基础上补充不做料号替换的核心表
+SCOPE_FIELD_MAPPINGS = {
+    **{name: fields for name, fields in FIELD_MAPPINGS.items() if not name.endswith(".xlsx")},
+    "CP在制": {"品名": "产品品名", "晶圆品名": "晶圆型号"},
+    "晶圆库存": {"晶圆品名": "WAFER品名"},
+}
+
+
+HEADER_TEMPLATE = [
+    "销售数量", "销售金额", "成品投单计划", "半成品投单计划", "投单计划调整",
+    "成品可行投单", "半成品可行投单", "成品实际投单", "半成品实际投单",
+    "回货计划", "回货计划调整", "PC回货计划", "回货实际"
+]
+
+
+# 汇总表表头行数：第 1 行分组标题（安全库存、未交订单……），第 2 行字段名
+SUMMARY_HEADER_ROWS = 2
+
+# 汇总表中的月度列：未交订单带年份，预测只有月份
+UNFULFILLED_COLUMN = r"未交订单数量_(?P<year>\d{4})-(?P<month>\d{1,2})"
+FORECAST_COLUMN = r"(?P<month>\d{1,2})月预测"
+
+# assemble 阶段由明细立方体写入的月度字段：(字段名, 明细阶段参数名, 立方体指标)
+DETAIL_FIELDS = [
+    ("回货实际", "arrival", "允收数量"),
+    ("销售数量", "sales", "数量"),
+    ("销售金额", "sales", "原币金额"),
+    ("成品实际投单", "order", "回货明细_回货数量"),
+]
+
+
+def horizon_column(period, header):
+    """计划区间内的月度列名，如 10_销售数量（区间不超过 12 个月，列名只含月份）"""
+    return f"{period.month}_{header}"
+
+
+# 以下表名均不带客户前缀，前缀在读入时去掉、写出时加回（见 config.customer_name）
+
+# 写出前需要清洗 nan 字符串的辅助表
+CLEANED_SHEETS = ["预测", "安全库存", "新旧料号"]
+
+# 每个 sheet 中用于标记未匹配行的字段名（表头位于第 1 行）
+UNMATCHED_MARK_FIELDS = {
+    "安全库存": "ProductionNO.",
+    "未交订单": "品名",
+    "预测": "生产料号",
+    "成品库存": "品名",
+    "成品在制": "产品品名",
 }
 
 
+def safe_col(df, col):
+    # 返回确保是 float 的 Series，字符串将被转为 NaN，再用 0 替代
+    return pd.to_numeric(df[col], errors="coerce").fillna(0) if col in df.columns else pd.Series(0, index=df.index)
+
+
+def _collect(**frames):
+    return dict(frames)
+
+
 class PivotProcessor:
-    def process(self, uploaded_files: dict, output_buffer, additional_sheets: dict = None):
-        df_finished = pd.DataFrame()
-        product_in_progress = pd.DataFrame()
-        df_unfulfilled = pd.DataFrame()
-
-        unmatched_safety = []
-        unmatched_unfulfilled = []
-        unmatched_forecast = []
-        unmatched_finished = []
-        unmatched_in_progress = []
-
-        key_unfulfilled = []
-        key_finished = []
-        key_in_progress = []
-
-        mapping_df = additional_sheets.get("赛卓-新旧料号", pd.DataFrame())
-        
-        
-        all_mapped_keys = set()
+    """
+    汇总流程按阶段拆分为 DAG（见 pipeline.StageGraph）：
+    ingest → map → pivot → summary → plan → assemble → export
+    预测/安全库存的映射、三个核心透视与三个明细聚合互不依赖，并发执行后在 assemble 汇合。
+
+    每个阶段的结果按输入摘要缓存，重跑时只重新计算变化文件下游的阶段。
+    """
+
+    CORE_SHEETS = ["未交订单", "成品库存", "成品在制"]
+    DETAIL_STAGES = {
+        "detail:到货": "到货明细",
+        "detail:销货": "销货明细",
+        "detail:下单": "下单明细",
+    }
+
+    def __init__(self, cache=None, max_workers: int = None, fact_store="default", customer: str = None,
+                 today: datetime = None, selected_month: str = None,
+                 profile: str = None, memory_budget: bool = None):
+        self.cache = cache
+        # 客户前缀，默认取 CONFIG["customer"]
+        self.customer = customer or CONFIG["customer"]
+        self.max_workers = max_workers
+        # 明细事实库，传入 None 时直接汇总本次的明细表
+        self.fact_store = get_fact_store() if fact_store == "default" else fact_store
+        # 内存预算模式设置（CONFIG["memory_budget"]），memory_budget 为是否开启，默认取配置
+        self.memory_budget = dict(CONFIG["memory_budget"])
+        if memory_budget is not None:
+            self.memory_budget["enabled"] = bool(memory_budget)
+        # 内存预算模式下各表压缩前后的字节数，供生成后展示
+        self.memory_stats = {}
+        # 投单计划的计算输入（汇总结果 + 下单明细），供 scenario.PlanScenario 只重算计划
+        self.plan_inputs = None
+        # 报告基准日期（决定投单计划的起始月份），默认为生成当天；核对固定输出时传入
+        self.today = today
+        # 最近一次生成中各阶段的耗时（秒），复用缓存的阶段不计入
+        self.stage_timings = {}
+        # 历史数据截止月份（YYYY-MM），为 None 时不合并历史未交订单
+        self.selected_month = selected_month
+        # 输出内容（OUTPUT_PROFILES 的键），默认取 CONFIG["output_profile"]
+        self.profile = profile or CONFIG.get("output_profile") or "full"
+        if self.profile not in OUTPUT_PROFILES:
+            raise ValueError(f"未知的输出内容：{self.profile}")
+
+    def process(self, uploaded_files: dict, output_buffer, additional_sheets: dict = None, scope: ProductScope = None):
+        """
+        生成汇总报告并写入 output_buffer。
+
+        参数:
+        - scope: 报告范围，非空时只生成范围内产品的草稿报告；为 None 时不筛选
+
+        返回:
+        - (报告 bytes, {sheet 名: DataFrame})，sheet 顺序与工作簿一致，可直接用于预览；
+          失败时返回 None
+        """
+        # 文件名 / sheet 名去掉客户前缀，流程内部统一使用不带前缀的表名
+        uploaded_files = {base_name(name, self.customer): file for name, file in uploaded_files.items()}
+        additional_sheets = {base_name(name, self.customer): df for name, df in (additional_sheets or {}).items()}
+        self.memory_stats = {}
+        scope = scope if scope is not None else ProductScope()
+        if scope.active:
+            st.info(f"🔎 只生成范围内产品的草稿报告：{scope.describe()}")
+        graph = self._build_graph(uploaded_files, additional_sheets, scope)
+
+        core_stages = [f"map:{name}" for name in self.CORE_SHEETS] + [f"pivot:{name}" for name in self.CORE_SHEETS]
+        graph.run([name for name in core_stages if name in graph.stages])
+        graph.replay()
+        if graph.results.get(f"map:{self.CORE_SHEETS[0]}") is None or graph.results.get(f"pivot:{self.CORE_SHEETS[0]}") is None:
+            st.error("❌ 缺少未交订单数据，无法构建汇总")
+            return
+        if scope.active and graph.results[f"scope:{self.CORE_SHEETS[0]}"].empty:
+            st.error(f"❌ 范围内没有未交订单数据：{scope.describe()}")
+            return
 
-        # 清洗 additional_sheets 中的所有 nan 字符串
-        for name in ["赛卓-预测", "赛卓-安全库存", "赛卓-新旧料号"]:
-            if name in additional_sheets:
-                df = additional_sheets[name]
-                df = df.fillna("")  # 替换真正的 NaN
-                df = df.applymap(lambda x: "" if str(x).strip().lower() == "nan" else str(x).strip() if isinstance(x, str) else x)
-                additional_sheets[name] = df  # 更新为清洗后的 df
-
-        # 在 PivotProcessor.process 内部，写 Excel 之前：
-        # 检查是否有表含有字符串 "nan"
+        try:
+            graph.run()
+        except Exception as e:
+            graph.replay()
+            st.error(f"❌ 汇总数据合并失败: {e}")
+            return
+        graph.replay()
+        self.stage_timings = dict(graph.timings)
+        self.memory_stats = graph.stats("memory")
+
+        if graph.reused:
+            st.info(f"♻️ 输入未变化，复用了 {len(graph.reused)} 个阶段的缓存结果")
+        if self.memory_stats:
+            before = sum(stats[0] for stats in self.memory_stats.values())
+            after = sum(stats[1] for stats in self.memory_stats.values())
+            st.info(f"🧮 内存预算模式：{before / 2 ** 20:.1f} MB → {after / 2 ** 20:.1f} MB")
+            st.dataframe(memory_report(self.memory_stats), hide_index=True)
+
+        self.plan_inputs = {"summary": graph.results["summary"], "order": graph.results["detail:下单"]}
+
+        output_buffer.write(graph.results["export"])
+        output_buffer.seek(0)
+
+        frames = {self._sheet(name): df for name, df in graph.results["collect:pivots"].items() if df is not None}
+        frames["汇总"] = graph.results["assemble"]
+        frames.update({self._sheet(name): df for name, df in graph.results["collect:sheets"].items()})
+        return graph.results["export"], frames
+
+    def _today(self) -> datetime:
+        return self.today or datetime.today()
+
+    def _sheet(self, name: str) -> str:
+        """加上客户前缀的 sheet 名"""
+        return customer_name(name, self.customer)
+
+    def _build_graph(self, uploaded_files: dict, additional_sheets: dict, scope: ProductScope) -> StageGraph:
+        graph = StageGraph(self.cache, self.max_workers)
+        graph.add_input("config:selected_month", self.selected_month)
+        if scope.active:
+            graph.add_input("config:scope", scope, hash_value(scope.to_dict()))
+        # 基准年月：决定计划区间的起始月份与预测列的默认年份
+        graph.add_input("config:today", pd.Period(self._today(), "M"))
+        profile = OUTPUT_PROFILES[self.profile]
+
+        # 辅助表：清洗 + 'nan' 检查；不输出原始表时只清洗参与计算的表
+        written_sheets = list(additional_sheets) if profile["source_sheets"] else []
+        sheet_nodes = {}
         for name, df in additional_sheets.items():
-            if (df.astype(str).applymap(lambda x: x.lower() == "nan")).any().any():
-                st.warning(f"⚠️ 表 `{name}` 中含有字符串 'nan'，请确认是否清洗干净")
-
-
-
-        with pd.ExcelWriter(output_buffer, engine="openpyxl") as writer:
-            for filename, file_obj in uploaded_files.items():
-                try:
-                    df = pd.read_excel(file_obj)
-                    df = clean_df(df)
-                    config = CONFIG["pivot_config"].get(filename)
-                    if not config:
-                        st.warning(f"⚠️ 跳过未配置的文件：{filename}")
-                        continue
-
-                    sheet_name = filename.replace(".xlsx", "")
-
-                    if sheet_name in FIELD_MAPPINGS and not mapping_df.empty:
-                        mapping_df.columns = [
-                            "旧规格", "旧品名", "旧晶圆品名",
-                            "新规格", "新品名", "新晶圆品名",
-                            "封装厂", "PC", "半成品", "备注",
-                            "替代规格1", "替代品名1", "替代晶圆1", 
-                            "替代规格2", "替代品名2", "替代晶圆2", 
-                            "替代规格3", "替代品名3", "替代晶圆3",
-                            "替代规格4", "替代品名4", "替代晶圆4"
-                        ] + list(mapping_df.columns[22:])
-                        st.success(f"✅ `{sheet_name}` 正在进行新旧料号替换...")
-
-                        df, mapped_keys = apply_mapping_and_merge(df, mapping_df, FIELD_MAPPINGS[sheet_name])
-                        df, keys_sub = apply_extended_substitute_mapping(df, mapping_df, FIELD_MAPPINGS[sheet_name], None)
-                        df = clean_key_fields(df, FIELD_MAPPINGS[sheet_name])
-                        #df = merge_duplicate_rows_by_key(df, FIELD_MAPPINGS[sheet_name])
-                        all_mapped_keys.update(mapped_keys)
-
-                        if sheet_name == "赛卓-未交订单":
-                            key_unfulfilled = mapped_keys
-                        elif sheet_name == "赛卓-成品库存":
-                            key_finished = mapped_keys
-                        elif sheet_name == "赛卓-成品在制":
-                            key_in_progress = mapped_keys
-
-                    if "date_format" in config:
-                        df = self._process_date_column(df, config["columns"], config["date_format"])
-
-                    pivoted = self._create_pivot(df, config)
-                    pivoted.to_excel(writer, sheet_name=sheet_name, index=False)
-                    adjust_column_width(writer, sheet_name, pivoted)
-
-                    if sheet_name == "赛卓-未交订单":
-                        df_unfulfilled = df
-                        pivot_unfulfilled = pivoted
-                    elif sheet_name == "赛卓-成品库存":
-                        df_finished = pivoted
-                    elif sheet_name == "赛卓-成品在制":
-                        product_in_progress = pivoted
-
-                except Exception as e:
-                    st.error(f"❌ 文件 `{filename}` 处理失败: {e}")
-
-            if df_unfulfilled.empty:
-                st.error("❌ 缺少未交订单数据，无法构建汇总")
-                return
-
-            summary_preview = df_unfulfilled[["晶圆品名", "规格", "品名"]].drop_duplicates().reset_index(drop=True)
-                
-            try:
-                if "赛卓-预测" in additional_sheets:
-                    forecast_df = additional_sheets["赛卓-预测"]
-                    forecast_df = clean_df(forecast_df)
-                    forecast_df, keys_main = apply_mapping_and_merge(forecast_df, mapping_df, FIELD_MAPPINGS["赛卓-预测"])
-                    ## forecast_df, keys_sub = apply_extended_substitute_mapping(forecast_df, mapping_df, FIELD_MAPPINGS["赛卓-预测"], keys_main)
-                    # forecast_df = merge_duplicate_rows_by_key(forecast_df, FIELD_MAPPINGS["赛卓-预测"])
-                    # all_mapped_keys.update(keys_main)
-                    # all_mapped_keys.update(keys_sub)
-                    summary_preview, unmatched_forecast = append_forecast_to_summary(summary_preview, forecast_df)
-                    st.success("✅ 已合并预测数据")
-                    
-                    
-                    # 添加未匹配的预测项
-                    summary_preview = append_forecast_unmatched_to_summary_by_keys(summary_preview, forecast_df)
-                    st.success("✅ 已添加未匹配的预测项至汇总表")
-
-                
-                if "赛卓-安全库存" in additional_sheets:
-                    df_safety = additional_sheets["赛卓-安全库存"]
-                    df_safety = clean_df(df_safety)
-                    df_safety, keys_main = apply_mapping_and_merge(df_safety, mapping_df, FIELD_MAPPINGS["赛卓-安全库存"])
-                    df_safety, keys_sub = apply_extended_substitute_mapping(df_safety, mapping_df, FIELD_MAPPINGS["赛卓-安全库存"], keys_main)
-                    # df_safety = merge_duplicate_rows_by_key(df_safety, FIELD_MAPPINGS["赛卓-安全库存"])
-                    # all_mapped_keys.update(keys_main)
-                    # all_mapped_keys.update(keys_sub)
-                    summary_preview, unmatched_safety = merge_safety_inventory(summary_preview, df_safety)
-                    st.success("✅ 已合并安全库存")
-                    
-                summary_preview, unmatched_unfulfilled = append_unfulfilled_summary_columns(summary_preview, pivot_unfulfilled)
-                st.success("✅ 已合并未交订单")
-                
-                # ✅ 提取最大月份字段
-                month_pattern = re.compile(r"(\d{4})年(\d{1,2})月.*未交订单数量")
-                max_month = None
-                
-                for col in pivot_unfulfilled.columns:
-                    match = month_pattern.match(col)
-                    if match:
-                        year, month = int(match.group(1)), int(match.group(2))
-                        dt = datetime(year, month, 1)
-                        if not max_month or dt > max_month:
-                            max_month = dt
-                
-                if max_month:
-                    end_date = max_month
+            graph.add_input(f"sheet:{name}", df)
+            sheet_nodes[name] = f"sheet:{name}"
+            if self.memory_budget["enabled"] and not df.empty:
+                # 辅助表之后会以空字符串填充缺失值，只做数值降精度，不转 category
+                graph.add_stage(f"optimize:{name}", self._optimize, {"df": f"sheet:{name}"}, {
+                    "name": self._sheet(name), "budget": self.memory_budget, "categorical_columns": [],
+                })
+                sheet_nodes[name] = f"optimize:{name}"
+            if name in written_sheets or name in CLEANED_SHEETS:
+                graph.add_stage(f"clean:{name}", self._clean_sheet, {"df": sheet_nodes[name]}, {
+                    "name": name,
+                    "check_nan": name in written_sheets,
+                    "customer": self.customer,
+                })
+
+        # 新旧料号对照表使用未清洗的原始表
+        if "sheet:新旧料号" not in graph.inputs:
+            graph.add_input("sheet:新旧料号", pd.DataFrame())
+        graph.add_stage("mapping", self._compile_mapping, {"mapping_df": "sheet:新旧料号"},
+                        {"digest": graph.keys["sheet:新旧料号"]})
+
+        # 核心文件：ingest → map →（scope）→ pivot
+        # 报告范围在料号替换、键列规整之后筛选；含全部键列的核心表直接按条件筛选，
+        # 其余的表按这些表筛选后得到的 品名 / 晶圆品名 集合（scope:keys）筛选
+        pivot_nodes = {}
+        keyed_nodes = {}
+        full_key_nodes = {}
+        for filename, file_obj in uploaded_files.items():
+            config = CONFIG["pivot_config"].get(filename)
+            if not config:
+                st.warning(f"⚠️ 跳过未配置的文件：{self._sheet(filename)}")
+                continue
+
+            sheet_name = filename.replace(".xlsx", "")
+            data = self._read_bytes(file_obj)
+            graph.add_input(f"file:{filename}", data, hash_bytes(data))
+            params = {"filename": filename, "customer": self.customer}
+            graph.add_stage(f"ingest:{sheet_name}", self._ingest, {"data": f"file:{filename}"}, {**params, "memory_budget": self.memory_budget})
+            graph.add_stage(f"map:{sheet_name}", self._map, {"df": f"ingest:{sheet_name}", "mapping": "mapping"}, params)
+            keyed_nodes[sheet_name] = f"map:{sheet_name}"
+            if scope.active:
+                field_map = SCOPE_FIELD_MAPPINGS.get(sheet_name, {})
+                scope_deps = {"df": f"map:{sheet_name}", "scope": "config:scope"}
+                if all(field in field_map for field in SCOPE_FIELDS):
+                    full_key_nodes[sheet_name] = f"scope:{sheet_name}"
+                else:
+                    scope_deps["keys"] = "scope:keys"
+                graph.add_stage(f"scope:{sheet_name}", self._scope_frame, scope_deps, {"field_map": field_map})
+                keyed_nodes[sheet_name] = f"scope:{sheet_name}"
+            graph.add_stage(f"pivot:{sheet_name}", self._pivot, {"df": keyed_nodes[sheet_name], "selected_month": "config:selected_month"},
+                            {**params, "config": config})
+            pivot_nodes[sheet_name] = f"pivot:{sheet_name}"
+
+        if scope.active:
+            graph.add_stage("scope:keys", self._scope_keys, {"scope": "config:scope", **full_key_nodes})
+
+        graph.add_stage("collect:pivots", _collect, pivot_nodes)
+        graph.add_stage("collect:sheets", _collect, {name: f"clean:{name}" for name in written_sheets})
+
+        # 辅助数据的映射与清洗
+        if "预测" in additional_sheets:
+            graph.add_stage("forecast", self._prepare_forecast, {"forecast_df": "clean:预测", "mapping": "mapping"})
+            keyed_nodes["预测"] = "forecast"
+        if "安全库存" in additional_sheets:
+            graph.add_stage("safety", self._prepare_safety, {"df_safety": "clean:安全库存", "mapping": "mapping"})
+            keyed_nodes["安全库存"] = "safety"
+        if scope.active:
+            for sheet_name in ["预测", "安全库存"]:
+                if sheet_name in keyed_nodes:
+                    graph.add_stage(f"scope:{sheet_name}", self._scope_frame, {
+                        "df": keyed_nodes[sheet_name], "scope": "config:scope", "keys": "scope:keys"
+                    }, {"field_map": SCOPE_FIELD_MAPPINGS[sheet_name]})
+                    keyed_nodes[sheet_name] = f"scope:{sheet_name}"
+
+        summary_deps = {"mapping": "mapping", "today": "config:today"}
+        for param, node in [
+            ("df_unfulfilled", keyed_nodes.get("未交订单")),
+            ("pivot_unfulfilled", pivot_nodes.get("未交订单")),
+            ("df_finished", pivot_nodes.get("成品库存")),
+            ("product_in_progress", pivot_nodes.get("成品在制")),
+            ("forecast", keyed_nodes.get("预测")),
+            ("safety", keyed_nodes.get("安全库存")),
+        ]:
+            if node in graph.stages:
+                summary_deps[param] = node
+        graph.add_stage("summary", self._join_summary, summary_deps)
+
+        # 明细聚合：到货 / 销货 / 下单
+        for stage_name, sheet_name in self.DETAIL_STAGES.items():
+            spec = CONFIG["detail_config"][sheet_name]
+            if f"sheet:{sheet_name}" not in graph.inputs:
+                graph.add_input(f"sheet:{sheet_name}", pd.DataFrame())
+            sheet_node = sheet_nodes.get(sheet_name, f"sheet:{sheet_name}")
+            if scope.active and scope.details and not graph.inputs[f"sheet:{sheet_name}"].empty:
+                # 草稿报告：明细先按范围筛选再直接汇总，不写入事实库
+                graph.add_stage(f"scope:{sheet_name}", self._scope_frame, {
+                    "df": sheet_node, "scope": "config:scope", "keys": "scope:keys"
+                }, {"field_map": {"品名": spec["name"]}})
+                graph.add_stage(stage_name, self._aggregate_detail, {"df": f"scope:{sheet_name}"}, {"spec": spec})
+                continue
+            version = self._merge_facts(self._sheet(sheet_name), graph.inputs[f"sheet:{sheet_name}"], spec, graph.keys[f"sheet:{sheet_name}"])
+            if version is not None:
+                # 由事实库的各期间汇总得到结果，阶段键随事实库版本变化
+                graph.add_input(f"facts:{sheet_name}", version)
+                graph.add_stage(stage_name, self._detail_totals, {"version": f"facts:{sheet_name}"}, {"kind": self._sheet(sheet_name), "spec": spec})
+            else:
+                graph.add_stage(stage_name, self._aggregate_detail, {"df": sheet_node}, {"spec": spec})
+
+        # 投单计划需要下单明细中的实际投单
+        graph.add_stage("plan", self._plan, {"summary": "summary", "order": "detail:下单"})
+
+        # 汇合点：计划 + 明细聚合写入汇总
+        graph.add_stage("assemble", self._assemble, {
+            "plan": "plan",
+            "summary": "summary",
+            "arrival": "detail:到货",
+            "sales": "detail:销货",
+            "order": "detail:下单",
+        })
+        graph.add_stage("export", self._export, {
+            "pivots": "collect:pivots",
+            "sheets": "collect:sheets",
+            "summary": "summary",
+            "plan": "plan",
+            "summary_preview": "assemble",
+        }, {"profile": self.profile, "customer": self.customer})
+        return graph
+
+    @staticmethod
+    def _read_bytes(file_obj) -> bytes:
+        if hasattr(file_obj, "getvalue"):
+            return file_obj.getvalue()
+        file_obj.seek(0)
+        data = file_obj.read()
+        file_obj.seek(0)
+        return data
+
+    # ---------- ingest / map / pivot ----------
+
+    @staticmethod
+    def _optimize(name, df, budget, categorical_columns=None):
+        """
+        内存预算模式下压缩表格，压缩前后的字节数记入阶段统计（随结果缓存）；未开启时原样返回。
+
+        参数:
+        - budget: 内存预算模式设置，见 CONFIG["memory_budget"]
+        - categorical_columns: 允许转为 category 的列，默认取 budget 中的设置
+        """
+        if not budget.get("enabled", False) or df.empty:
+            return df
+        if categorical_columns is None:
+            categorical_columns = budget.get("categorical_columns", [])
+        df, before, after = optimize_frame(df, categorical_columns, budget.get("max_category_ratio"))
+        record_stat("memory", name, (before, after))
+        return df
+
+    def _clean_sheet(self, name, df, check_nan=True, customer=None):
+        # 清洗 additional_sheets 中的所有 nan 字符串
+        if name in CLEANED_SHEETS:
+            df = df.fillna("")  # 替换真正的 NaN
+            df = df.applymap(lambda x: "" if str(x).strip().lower() == "nan" else str(x).strip() if isinstance(x, str) else x)
+
+        # 写 Excel 之前检查是否有表含有字符串 "nan"
+        if check_nan and (df.astype(str).applymap(lambda x: x.lower() == "nan")).any().any():
+            notify("warning", f"⚠️ 表 `{customer_name(name, customer)}` 中含有字符串 'nan'，请确认是否清洗干净")
+        return df
+
+    def _compile_mapping(self, mapping_df, digest):
+        # 列命名、料号传递闭包、半成品与产品维度：按映射表内容摘要缓存到磁盘，映射表不变时直接读取
+        store = get_mapping_store()
+        if store is None:
+            compiled = CompiledMapping.from_mapping_df(mapping_df)
+        else:
+            compiled, cached = store.get(digest, mapping_df)
+            if cached:
+                notify("info", "♻️ 新旧料号表未变化，使用已编译的映射")
+
+        parts = compiled.parts
+        if parts.conflicts:
+            notify("warning", f"⚠️ 新旧料号表中 {len(parts.conflicts)} 个品名对应多个新品名，按表中第一行替换："
+                       f"{', '.join(list(parts.conflicts)[:5])}")
+        for cycle in parts.cycles:
+            notify("warning", f"⚠️ 新旧料号存在循环替换，已归并为 `{parts.canonical.get(cycle[0], cycle[0])}`："
+                       f"{' → '.join(cycle + cycle[:1])}")
+        return compiled
+
+    def _ingest(self, filename, data, memory_budget, customer=None):
+        try:
+            df = pd.read_excel(io.BytesIO(data))
+            return self._optimize(customer_name(filename.replace(".xlsx", ""), customer), clean_df(df), memory_budget)
+        except Exception as e:
+            notify("error", f"❌ 文件 `{customer_name(filename, customer)}` 处理失败: {e}")
+            return None
+
+    def _map(self, filename, df, mapping, customer=None):
+        if df is None:
+            return None
+
+        sheet_name = filename.replace(".xlsx", "")
+        if sheet_name not in FIELD_MAPPINGS:
+            return df
+
+        try:
+            # 没有新旧料号映射时只跳过替换，键列仍需清洗（清洗会修改列，先复制，不改动缓存中的上游结果）
+            if mapping.parts.canonical:
+                notify("success", f"✅ `{customer_name(sheet_name, customer)}` 正在进行新旧料号替换...")
+                df, mapped_keys = mapping.parts.apply(df, FIELD_MAPPINGS[sheet_name])
+            else:
+                df = df.copy()
+            df = clean_key_fields(df, FIELD_MAPPINGS[sheet_name])
+            #df = merge_duplicate_rows_by_key(df, FIELD_MAPPINGS[sheet_name])
+            return df
+        except Exception as e:
+            notify("error", f"❌ 文件 `{customer_name(filename, customer)}` 处理失败: {e}")
+            return None
+
+    def _pivot(self, filename, df, selected_month, config, customer=None):
+        if df is None:
+            return None
+
+        try:
+            df = df.copy()
+            if "date_format" in config:
+                df = self._process_date_column(df, config["columns"], config["date_format"])
+            return self._create_pivot(df, config, selected_month)
+        except Exception as e:
+            notify("error", f"❌ 文件 `{customer_name(filename, customer)}` 处理失败: {e}")
+            return None
+
+    # ---------- 报告范围 ----------
+
+    @staticmethod
+    def _scope_frame(df, scope, field_map, keys=None):
+        return scope.filter(df, field_map, keys)
+
+    @staticmethod
+    def _scope_keys(scope, **frames):
+        # 范围内的 品名 / 晶圆品名，供缺少部分键列的表筛选
+        return scope.keys((df, SCOPE_FIELD_MAPPINGS[name]) for name, df in frames.items())
+
+    # ---------- 辅助数据 ----------
+
+    def _prepare_forecast(self, forecast_df, mapping):
+        forecast_df = clean_df(forecast_df)
+        # 预测只做新旧料号替换，不替换替代品名
+        forecast_df, keys_main = mapping.parts.apply(forecast_df, FIELD_MAPPINGS["预测"], substitutes=False)
+        # forecast_df = merge_duplicate_rows_by_key(forecast_df, FIELD_MAPPINGS["预测"])
+        return forecast_df
+
+    def _prepare_safety(self, df_safety, mapping):
+        df_safety = clean_df(df_safety)
+        df_safety, keys_main = mapping.parts.apply(df_safety, FIELD_MAPPINGS["安全库存"])
+        # df_safety = merge_duplicate_rows_by_key(df_safety, FIELD_MAPPINGS["安全库存"])
+        return df_safety
+
+    # ---------- 汇总 ----------
+
+    def _join_summary(self, mapping, today, df_unfulfilled=None, pivot_unfulfilled=None,
+                      df_finished=None, product_in_progress=None, forecast=None, safety=None):
+        unmatched = {
+            "安全库存": [],
+            "未交订单": [],
+            "预测": [],
+            "成品库存": [],
+            "成品在制": [],
+        }
+
+        summary_preview = df_unfulfilled[["晶圆品名", "规格", "品名"]].drop_duplicates().reset_index(drop=True)
+
+        if forecast is not None:
+            summary_preview, unmatched["预测"] = append_forecast_to_summary(summary_preview, forecast)
+            notify("success", "✅ 已合并预测数据")
+
+            # 添加未匹配的预测项
+            summary_preview = append_forecast_unmatched_to_summary_by_keys(summary_preview, forecast)
+            notify("success", "✅ 已添加未匹配的预测项至汇总表")
+
+        if safety is not None:
+            summary_preview, unmatched["安全库存"] = merge_safety_inventory(summary_preview, safety)
+            notify("success", "✅ 已合并安全库存")
+
+        summary_preview, unmatched["未交订单"] = append_unfulfilled_summary_columns(summary_preview, pivot_unfulfilled)
+        notify("success", "✅ 已合并未交订单")
+
+        if df_finished is not None and not df_finished.empty:
+            summary_preview, unmatched["成品库存"] = merge_finished_inventory(summary_preview, df_finished.copy())
+            notify("success", "✅ 已合并成品库存")
+
+        if product_in_progress is not None and not product_in_progress.empty:
+            summary_preview, unmatched["成品在制"] = append_product_in_progress(summary_preview, product_in_progress, mapping.semi_finished.copy())
+            notify("success", "✅ 已合并成品在制")
+
+        summary_preview = clean_df(summary_preview)
+        summary_preview = summary_preview.drop_duplicates(subset=["晶圆品名", "规格", "品名"]).reset_index(drop=True)
+        summary_preview = delete_duplicate_product_names(summary_preview)
+        summary_preview = reorder_summary_columns(summary_preview)
+
+        # 预测与未交订单的月度列只在这里识别一次，之后通过立方体按 Period 读取
+        order_columns = period_columns(summary_preview.columns, UNFULFILLED_COLUMN)
+        forecast_columns = period_columns(summary_preview.columns, FORECAST_COLUMN)
+        forecast_months = list(forecast_columns)
+
+        notify("write", forecast_months)
+
+        forecast_periods = resolve_months(forecast_months, self._forecast_year(forecast_months, list(order_columns), today.year))
+        cube = MonthlyCube.from_columns(summary_preview, "品名", {
+            "预测": dict(zip(forecast_periods, forecast_columns.values())),
+            "未交订单": order_columns,
+        })
+
+        # 确定添加月份范围：基准日期所在月至最后一个预测月的前一个月，可跨年
+        start = today
+        end = forecast_periods[-1] - 1 if forecast_periods else start
+        horizon = list(pd.period_range(start, end, freq="M")) if start <= end else []
+
+        # ✅ 在 summary_preview 中添加每月字段列（全部初始化为空或0）
+        for period in horizon:
+            for header in HEADER_TEMPLATE:
+                summary_preview[horizon_column(period, header)] = ""
+
+        return {
+            "summary_preview": summary_preview,
+            "forecast_months": forecast_months,
+            "cube": cube,
+            "horizon": horizon,
+            "unmatched": unmatched,
+        }
+
+    @staticmethod
+    def _forecast_year(forecast_months, order_periods, default_year):
+        """
+        预测列只有月份，取与第一个预测月同月的未交订单年份作为起始年份；
+        没有对应月份时取最早未交订单的年份，再没有则取 default_year（基准日期的年份）
+        """
+        if forecast_months:
+            for period in sorted(order_periods):
+                if period.month == forecast_months[0]:
+                    return period.year
+        if order_periods:
+            return min(order_periods).year
+        return default_year
+
+    def _plan(self, summary, order):
+        summary_preview = summary["summary_preview"].copy()
+        cube = summary["cube"]
+        plan = finished_goods_plan(
+            cube, order.align(cube.products), summary["horizon"],
+            safe_col(summary_preview, "InvPart").to_numpy(),
+            safe_col(summary_preview, "数量_成品仓").to_numpy(),
+            safe_col(summary_preview, "成品在制").to_numpy(),
+        )
+
+        for period, values in plan.items():
+            summary_preview[horizon_column(period, "成品投单计划")] = values
+        if plan:
+            notify("success", "✅ 成品投单计划已写入 summary_preview")
+
+        # 半成品投单计划：第一个月为 成品投单计划 - 半成品在制，后续月份由导出时的公式计算
+        df_semi_plan = pd.DataFrame(index=summary_preview.index)
+        semi_plan = semi_finished_plan(plan, safe_col(summary_preview, "半成品在制").to_numpy(), months=1)
+        for period in plan:
+            df_semi_plan[horizon_column(period, "半成品投单计划")] = semi_plan.get(period, 0)
+
+        return {"summary_preview": summary_preview, "df_semi_plan": df_semi_plan}
+
+    # ---------- 明细聚合 ----------
+
+    def _merge_facts(self, kind, df, spec, digest):
+        """
+        将本次的明细表合并入事实库，返回事实库版本；未启用事实库或入库失败时返回 None。
+        未提供明细表时直接使用库中已有的数据。
+        """
+        if self.fact_store is None:
+            return None
+        try:
+            if df.empty:
+                return self.fact_store.version(kind) or None
+            return self.fact_store.merge(kind, df, spec, digest)
+        except Exception as e:
+            st.warning(f"⚠️ `{kind}` 入库失败，改为直接汇总：{e}")
+            return None
+
+    def _aggregate_detail(self, spec, df):
+        # 到货 / 销货 / 下单：按 品名 × 月份 汇总数值列
+        periods = pd.to_datetime(df[spec["date"]], errors="coerce").dt.to_period("M")
+        return MonthlyCube.from_records(df[spec["name"]], periods, {col: df[col] for col in spec["values"]})
+
+    def _detail_totals(self, kind, spec, version):
+        return self.fact_store.cube(kind, spec["values"])
+
+    def _assemble(self, plan, summary, arrival, sales, order):
+        summary_preview = plan["summary_preview"].copy()
+        cubes = {"arrival": arrival, "sales": sales, "order": order}
+
+        # ✅ 按品名对齐明细立方体，逐月写入 回货实际 / 销售数量 / 销售金额 / 成品实际投单
+        names = summary_preview["品名"].astype(str)
+        aligned = {param: cube.align(names) for param, cube in cubes.items()}
+        for period in summary["horizon"]:
+            for header, param, measure in DETAIL_FIELDS:
+                summary_preview[horizon_column(period, header)] = aligned[param].column(measure, period)
+
+        notify("success", "✅ 回货实际、销售数量与销售金额、成品实际投单已写入 summary_preview")
+        return summary_preview
+
+    # ---------- 导出 ----------
+
+    def _export(self, pivots, sheets, summary, plan, summary_preview, profile="full", customer=None):
+        styling = OUTPUT_PROFILES[profile]["styling"]
+        df_semi_plan = plan["df_semi_plan"]
+        unmatched = summary["unmatched"] if styling else {}
+        buffer = io.BytesIO()
+
+        # 汇总表需要写公式、插入合并表头，使用完整的 openpyxl Worksheet；其余数据表逐行流式写出
+        writer = ReportWriter(default_backend=STREAM, backends={"汇总": OPENPYXL}, styling=styling)
+
+        for sheet_name, pivoted in pivots.items():
+            if pivoted is None:
+                continue
+            writer.write_frame(customer_name(sheet_name, customer), pivoted, highlight=self._highlight(sheet_name, unmatched))
+
+        # 第 1 行预留给分组标题，第 2 行为字段表头，数据从第 3 行开始
+        ws = writer.write_frame("汇总", summary_preview, startrow=SUMMARY_HEADER_ROWS - 1)
+        data_rows = range(SUMMARY_HEADER_ROWS + 1, SUMMARY_HEADER_ROWS + 1 + len(summary_preview))
+
+        # 半成品投单计划
+        semi_plan_cols_in_summary = [col for col in summary_preview.columns if "半成品投单计划" in col]
+
+        for i, col in enumerate(semi_plan_cols_in_summary):
+            col_idx = summary_preview.columns.get_loc(col) + 1  # 1-based Excel column index
+
+            for row in data_rows:
+                cell = ws.cell(row=row, column=col_idx)
+
+                if i == 0:
+                    # 第一个月：填入真实数值
+                    cell.value = df_semi_plan.iloc[row - data_rows.start, 0]
                 else:
-                    end_date = datetime.today() + relativedelta(months=6)  # 默认未来 6 个月
-                
-
-                if not df_finished.empty:
-                    summary_preview, unmatched_finished = merge_finished_inventory(summary_preview, df_finished)
-                    st.success("✅ 已合并成品库存")
-
-                if not product_in_progress.empty:
-                    summary_preview, unmatched_in_progress = append_product_in_progress(summary_preview, product_in_progress, mapping_df)
-                    st.success("✅ 已合并成品在制")
-
-
-                summary_preview = clean_df(summary_preview)
-                summary_preview = summary_preview.drop_duplicates(subset=["晶圆品名", "规格", "品名"]).reset_index(drop=True)
-                summary_preview = delete_duplicate_product_names(summary_preview)
-                summary_preview = reorder_summary_columns(summary_preview)
-
-
-                HEADER_TEMPLATE = [
-                    "销售数量", "销售金额", "成品投单计划", "半成品投单计划", "投单计划调整",
-                    "成品可行投单", "半成品可行投单", "成品实际投单", "半成品实际投单",
-                    "回货计划", "回货计划调整", "PC回货计划", "回货实际"
-                ]
-
-
-                # 在保存 summary_preview 前插入：
-                today_month = datetime.today().month
-                month_pattern = re.compile(r"(\d{1,2})月预测")
-                forecast_months = []
-                
-                for col in summary_preview.columns:
-                    match = month_pattern.match(str(col))
-                    if match:
-                        forecast_months.append(int(match.group(1)))
-
-                st.write(forecast_months)
-                
-                # 确定添加月份范围
-                start_month = today_month
-                end_month = max(forecast_months) - 1 if forecast_months else start_month
-
-                # ✅ 在 summary_preview 中添加每月字段列（全部初始化为空或0）
-                for m in range(start_month, end_month + 1):
-                    for header in HEADER_TEMPLATE:
-                        new_col = f"{m}_{header}"
-                        summary_preview[new_col] = ""
-
-
-
-                def safe_col(df, col):
-                    # 返回确保是 float 的 Series，字符串将被转为 NaN，再用 0 替代
-                    return pd.to_numeric(df[col], errors="coerce").fillna(0) if col in df.columns else pd.Series(0, index=df.index)
-
-
-
-
-                df_plan = pd.DataFrame(index=summary_preview.index)
-
-                for idx, month in enumerate(forecast_months[:-1]):  # 最后一个月不生成
-                    this_month = f"{month}月"
-                    next_month = f"{forecast_months[idx + 1]}月"
-                    prev_month = f"{forecast_months[idx - 1]}月" if idx > 0 else None
-                
-                    # 构造字段名
-                    col_forecast_this = f"{month}月预测"
-                    col_order_this = f"未交订单数量_2025-{month}"
-                    col_forecast_next = f"{forecast_months[idx + 1]}月预测"
-                    col_order_next = f"未交订单数量_2025-{forecast_months[idx + 1]}"
-                    col_target = f"{this_month}_成品投单计划"
-                    col_actual_prod = f"{this_month}_成品实际投单"
-                    col_target_prev = f"{prev_month}_成品投单计划" if prev_month else None
-                
-                    if idx == 0:
-                        # 第一个月：特殊算法
-                        df_plan[col_target] = (
-                            safe_col(summary_preview, "InvPart") +
-                            pd.DataFrame({
-                                "f": safe_col(summary_preview, col_forecast_this),
-                                "o": safe_col(summary_preview, col_order_this)
-                            }).max(axis=1) +
-                            pd.DataFrame({
-                                "f": safe_col(summary_preview, col_forecast_next),
-                                "o": safe_col(summary_preview, col_order_next)
-                            }).max(axis=1) -
-                            safe_col(summary_preview, "数量_成品仓") -
-                            safe_col(summary_preview, "成品在制")
-                        )
-                    else:
-                        df_plan[col_target] = (
-                            pd.DataFrame({
-                                "f": safe_col(summary_preview, col_forecast_next),
-                                "o": safe_col(summary_preview, col_order_next)
-                            }).max(axis=1) +
-                            (safe_col(df_plan, col_target_prev) - safe_col(summary_preview, col_actual_prod))
-                        )
-
-
-
-    
-                
-                # ✅ 只选 summary 中的“成品投单计划”列（排除半成品）
-                plan_cols_in_summary = [col for col in summary_preview.columns if "成品投单计划" in col and "半成品" not in col]
-                
-                # ✅ 数量校验
-                if len(plan_cols_in_summary) != df_plan.shape[1]:
-                    st.error(f"❌ 写入失败：df_plan 有 {df_plan.shape[1]} 列，summary 中有 {len(plan_cols_in_summary)} 个 '成品投单计划' 列")
+                    # 后续月份：填入公式
+                    prev_col_letter = get_column_letter(col_idx - 1)
+                    col_13_back = get_column_letter(col_idx - 13)
+                    col_8_back = get_column_letter(col_idx - 8)
+                    formula = f"={prev_col_letter}{row} + ({col_13_back}{row} - {col_8_back}{row})"
+
+                    cell.value = formula
+
+        # 投单计划调整
+        adjust_plan_cols_in_summary = [col for col in summary_preview.columns if "投单计划调整" in col]
+
+        for i, col in enumerate(adjust_plan_cols_in_summary):
+            col_idx = summary_preview.columns.get_loc(col) + 1  # 1-based Excel column index
+
+            for row in data_rows:
+                cell = ws.cell(row=row, column=col_idx)
+
+                if i == 0:
+                    cell.value = ""
                 else:
-                    # ✅ 将 df_plan 的列按顺序填入 summary_preview
-                    for i, col in enumerate(plan_cols_in_summary):
-                        summary_preview[col] = df_plan.iloc[:, i]
-                
-                    st.success("✅ 成品投单计划已写入 summary_preview")
-
-
-
-
-
-
-                
-
-                df_semi_plan = pd.DataFrame(index=summary_preview.index)
-
-                plan_cols = df_plan.columns.tolist()  # 如 ['5月_成品投单计划', '6月_成品投单计划', ...]
-                
-                for i, col in enumerate(plan_cols):
-                    if i == 0:
-                        # 第一个月：成品投单计划 - 半成品在制
-                        df_semi_plan[col.replace("成品投单计划", "半成品投单计划")] = (
-                            df_plan[col] - safe_col(summary_preview, "半成品在制")
-                        )
-                    else:
-                        df_semi_plan[col.replace("成品投单计划", "半成品投单计划")] = (
-                            0
-                        )
-
-
-
-
-                # 回货实际
-                # ✅ 提取原始数据
-                df_arrival = additional_sheets.get("赛卓-到货明细", pd.DataFrame())
-                df_arrival = df_arrival[["到货日期", "品名", "允收数量"]].copy()
-                
-                # ✅ （可选映射）跳过暂不启用
-                # df_arrival, keys_main = apply_mapping_and_merge(df_arrival, mapping_df, FIELD_MAPPINGS["赛卓-到货明细"])
-                # df_arrival, _ = apply_extended_substitute_mapping(df_arrival, mapping_df, FIELD_MAPPINGS["赛卓-到货明细"], keys_main)
-                
-    
-                
-                # ✅ 清理：只保留汇总中存在的品名
-                valid_names = set(summary_preview["品名"].astype(str))
-                df_arrival["品名"] = df_arrival["品名"].astype(str)
-                df_arrival = df_arrival[df_arrival["品名"].isin(valid_names)]
-                
-                # ✅ 初始化结果表，第一列来自 summary_preview 的品名（跳过第一行 header）
-                arrival_by_month = pd.DataFrame()
-                arrival_by_month["品名"] = summary_preview.loc[1:, "品名"].astype(str).reset_index(drop=True)
-                
-                for m in forecast_months:
-                    col_name = f"{m}月到货数量"
-                    arrival_by_month[col_name] = 0  # 初始化为 0
-                
-                # ✅ 计算每条记录的到货月份
-                df_arrival["到货月份"] = pd.to_datetime(df_arrival["到货日期"], errors="coerce").dt.month
-                
-                # ✅ 遍历并累加到目标月份列中
-                for idx, row in df_arrival.iterrows():
-                    part = row["品名"]
-                    qty = row["允收数量"]
-                    month = row["到货月份"]
-                    if month in forecast_months:
-                        col = f"{month}月到货数量"
-                        match_idx = arrival_by_month[arrival_by_month["品名"] == part].index
-                        if not match_idx.empty:
-                            arrival_by_month.loc[match_idx[0], col] += qty
-
-
-                back_cols_in_summary = [col for col in summary_preview.columns if "回货实际" in col]
-                
-
-                # ✅ 按顺序填入 summary_preview
-                for i, col in enumerate(back_cols_in_summary):
-                    summary_preview[col] = arrival_by_month.iloc[:, i+1]
-            
-                st.success("✅ 回货实际已写入 summary_preview")
-
-
-
-                # 销货数量和销货金额
-                # ✅ 提取销货明细原始数据
-                df_sales = additional_sheets.get("赛卓-销货明细", pd.DataFrame())
-                df_sales = df_sales[["交易日期", "品名", "数量", "原币金额"]].copy()
-                
-                # ✅ 清理：只保留出现在 summary_preview 中的品名
-                valid_names = set(summary_preview["品名"].astype(str))
-                df_sales["品名"] = df_sales["品名"].astype(str)
-                df_sales = df_sales[df_sales["品名"].isin(valid_names)]
-                
-                # ✅ 初始化两个结果表（以 summary_preview 的品名为基准，跳过 header 行）
-                sales_qty_by_month = pd.DataFrame()
-                sales_amt_by_month = pd.DataFrame()
-                sales_qty_by_month["品名"] = summary_preview.loc[1:, "品名"].astype(str).reset_index(drop=True)
-                sales_amt_by_month["品名"] = summary_preview.loc[1:, "品名"].astype(str).reset_index(drop=True)
-                
-                for m in forecast_months:
-                    col_qty = f"{m}月销售数量"
-                    col_amt = f"{m}月销售金额"
-                    sales_qty_by_month[col_qty] = 0
-                    sales_amt_by_month[col_amt] = 0
-                
-                # ✅ 提取月份
-                df_sales["销售月份"] = pd.to_datetime(df_sales["交易日期"], errors="coerce").dt.month
-                
-                # ✅ 累加销售数据
-                for idx, row in df_sales.iterrows():
-                    part = row["品名"]
-                    qty = row["数量"]
-                    amt = row["原币金额"]
-                    month = row["销售月份"]
-                    if month in forecast_months:
-                        col_qty = f"{month}月销售数量"
-                        col_amt = f"{month}月销售金额"
-                        match_idx = sales_qty_by_month[sales_qty_by_month["品名"] == part].index
-                        if not match_idx.empty:
-                            sales_qty_by_month.loc[match_idx[0], col_qty] += qty
-                            sales_amt_by_month.loc[match_idx[0], col_amt] += amt
-                
-                # ✅ 写入汇总表 summary_preview（跳过 header）
-                sales_qty_cols_in_summary = [col for col in summary_preview.columns if "销售数量" in col]
-                sales_amt_cols_in_summary = [col for col in summary_preview.columns if "销售金额" in col]
-                
-                for i, col in enumerate(sales_qty_cols_in_summary):
-                    if i + 1 < sales_qty_by_month.shape[1]:
-                        summary_preview.loc[1:, col] = sales_qty_by_month.iloc[:, i + 1].values
-                
-                for i, col in enumerate(sales_amt_cols_in_summary):
-                    if i + 1 < sales_amt_by_month.shape[1]:
-                        summary_preview.loc[1:, col] = sales_amt_by_month.iloc[:, i + 1].values
-                
-                st.success("✅ 销售数量与销售金额已写入 summary_preview")
-
-
-
-
-
-
-                # 成品实际投单
-                # ✅ 提取下单明细原始数据
-                df_order = additional_sheets.get("赛卓-下单明细", pd.DataFrame())
-                df_order = df_order[["下单日期", "回货明细_回货品名", "回货明细_回货数量"]].copy()
-                
-                # ✅ 清理：只保留 summary 中有的品名
-                valid_names = set(summary_preview["品名"].astype(str))
-                df_order["回货明细_回货品名"] = df_order["回货明细_回货品名"].astype(str)
-                df_order = df_order[df_order["回货明细_回货品名"].isin(valid_names)]
-                
-                # ✅ 初始化结果表
-                order_plan_by_month = pd.DataFrame()
-                order_plan_by_month["品名"] = summary_preview.loc[1:, "品名"].astype(str).reset_index(drop=True)
-                
-                for m in forecast_months:
-                    col_name = f"{m}月成品实际投单"
-                    order_plan_by_month[col_name] = 0
-                
-                # ✅ 提取月份
-                df_order["下单月份"] = pd.to_datetime(df_order["下单日期"], errors="coerce").dt.month
-                
-                # ✅ 累加每条记录的数量到对应月份
-                for idx, row in df_order.iterrows():
-                    part = row["回货明细_回货品名"]
-                    qty = row["回货明细_回货数量"]
-                    month = row["下单月份"]
-                    if month in forecast_months:
-                        col = f"{month}月成品实际投单"
-                        match_idx = order_plan_by_month[order_plan_by_month["品名"] == part].index
-                        if not match_idx.empty:
-                            order_plan_by_month.loc[match_idx[0], col] += qty
-                
-                # ✅ 找出 summary 中对应的列并填入
-                order_cols_in_summary = [col for col in summary_preview.columns if "成品实际投单" in col and "半成品" not in col]
-                
-                for i, col in enumerate(order_cols_in_summary):
-                    if i + 1 < order_plan_by_month.shape[1]:
-                        summary_preview.loc[1:, col] = order_plan_by_month.iloc[:, i + 1].values
-                
-                st.success("✅ 成品实际投单已写入 summary_preview")
-
-
-
-                
-               
-     
+                    # 后续月份：填入公式
+                    prev_col_letter = get_column_letter(col_idx - 2)
+                    col_13_back = get_column_letter(col_idx - 15)
+                    col_8_back = get_column_letter(col_idx - 12)
+                    formula = f"={prev_col_letter}{row} + ({col_13_back}{row} - {col_8_back}{row})"
+                    cell.value = formula
 
+        # 回货计划
+        return_plan_cols_in_summary = [col for col in summary_preview.columns if "回货计划" in col and "调整" not in col]
 
+        for i, col in enumerate(return_plan_cols_in_summary):
+            col_idx = summary_preview.columns.get_loc(col) + 1  # 1-based Excel column index
 
-            except Exception as e:
-                st.error(f"❌ 汇总数据合并失败: {e}")
-                return
-
-            summary_preview.to_excel(writer, sheet_name="汇总", index=False)
-            adjust_column_width(writer, "汇总", summary_preview)
-
-
-
-            ws = writer.sheets["汇总"]
-
-            
-            # 半成品投单计划
-            semi_plan_cols_in_summary = [col for col in summary_preview.columns if "半成品投单计划" in col]
-
-            
-            for i, col in enumerate(semi_plan_cols_in_summary):
-                col_idx = summary_preview.columns.get_loc(col) + 1  # 1-based Excel column index
-                col_letter = get_column_letter(col_idx)
-                
-            
-                for row in range(3, len(summary_preview) + 3):  # 数据从第3行开始
-                    cell = ws.cell(row=row, column=col_idx)
-            
-                    if i == 0:
-                        # 第一个月：填入真实数值
-                        cell.value = df_semi_plan.iloc[row - 3, 0]
-                    else:
-                        # 后续月份：填入公式
-                        prev_col_letter = get_column_letter(col_idx - 1)
-                        col_13_back = get_column_letter(col_idx - 13)
-                        col_8_back = get_column_letter(col_idx - 8)
-                        formula = f"={prev_col_letter}{row} + ({col_13_back}{row} - {col_8_back}{row})"
-                        
-                        cell.value = formula
-
-
-            # 投单计划调整
-            adjust_plan_cols_in_summary = [col for col in summary_preview.columns if "投单计划调整" in col]
-            
-            for i, col in enumerate(adjust_plan_cols_in_summary):
-                col_idx = summary_preview.columns.get_loc(col) + 1  # 1-based Excel column index
-                col_letter = get_column_letter(col_idx)
-                
-            
-                for row in range(3, len(summary_preview) + 3):  # 数据从第3行开始
-                    cell = ws.cell(row=row, column=col_idx)
-            
-                    if i == 0:
-                        cell.value = ""
-                    else:
-                        # 后续月份：填入公式
-                        prev_col_letter = get_column_letter(col_idx - 2)
-                        col_13_back = get_column_letter(col_idx - 15)
-                        col_8_back = get_column_letter(col_idx - 12)
-                        formula = f"={prev_col_letter}{row} + ({col_13_back}{row} - {col_8_back}{row})"
-                        cell.value = formula
-
-
-
-            # 回货计划
-            return_plan_cols_in_summary = [col for col in summary_preview.columns if "回货计划" in col and "调整" not in col]
-            
-            for i, col in enumerate(return_plan_cols_in_summary):
-                col_idx = summary_preview.columns.get_loc(col) + 1  # 1-based Excel column index
-                col_letter = get_column_letter(col_idx)
-                
-            
-                for row in range(3, len(summary_preview) + 3):  # 数据从第3行开始
-                    cell = ws.cell(row=row, column=col_idx)
-            
-                    if i == 0:
-                        cell.value = ""
-                    else:
-                        # 后续月份：填入公式
-                        prev_col_letter = get_column_letter(col_idx - 18)
-                        formula = f"={prev_col_letter}{row}"
-                        cell.value = formula
-
-
-            # 回货计划调整
-            adjust_return_plan_cols_in_summary = [col for col in summary_preview.columns if "回货计划调整" in col]
-            
-            for i, col in enumerate(adjust_return_plan_cols_in_summary):
-                col_idx = summary_preview.columns.get_loc(col) + 1  # 1-based Excel column index
-                col_letter = get_column_letter(col_idx)
-                
-            
-                for row in range(3, len(summary_preview) + 3):  # 数据从第3行开始
-                    cell = ws.cell(row=row, column=col_idx)
-            
-                    if i == 0:
-                        cell.value = ""
-                    else:
-                        # 后续月份：填入公式
-                        prev_col_letter = get_column_letter(col_idx - 1)
-                        col_13_back = get_column_letter(col_idx - 16)
-                        col_8_back = get_column_letter(col_idx - 19)
-                        formula = f"={prev_col_letter}{row} + ({col_13_back}{row} - {col_8_back}{row})"
-                        
-                        cell.value = formula
-            
-            
-
-
-
-            header_row = list(summary_preview.columns)
-            unfulfilled_cols = [col for col in header_row if "未交订单数量" in col or col in ("总未交订单", "历史未交订单数量")]
-            forecast_cols = [col for col in header_row if "预测" in col]
-            finished_cols = [col for col in header_row if col in ("数量_HOLD仓", "数量_成品仓", "数量_半成品仓")]
-
-
-
-            
-
-            merge_header_for_summary(
-                ws, summary_preview,
-                {
-                    "安全库存": (" InvWaf", " InvPart"),
-                    "未交订单": (unfulfilled_cols[0], unfulfilled_cols[-1]),
-                    "预测": (forecast_cols[0], forecast_cols[-1]) if forecast_cols else ("", ""),
-                    "成品库存": (finished_cols[0], finished_cols[-1]) if finished_cols else ("", ""),
-                    "成品在制": ("成品在制", "半成品在制")
-                }
-            )
-
-            for key, df in additional_sheets.items():
-                df.to_excel(writer, sheet_name=key, index=False)
-                adjust_column_width(writer, key, df)
-
-            # 每个 sheet 中用于标记的字段名（目标列）及表头所在行（从 1 开始）
-            sheet_field_config = {
-                "赛卓-安全库存": {"field_name": "ProductionNO.", "header_row": 1},
-                "赛卓-未交订单": {"field_name": "品名", "header_row": 1},
-                "赛卓-预测": {"field_name": "生产料号", "header_row": 1},
-                "汇总": {"field_name": "品名", "header_row": 2},  # 汇总表通常从第2行起才是字段行
-                "赛卓-成品库存": {"field_name": "品名", "header_row": 1},
-                "赛卓-成品在制": {"field_name": "产品品名", "header_row": 1},
-            }
+            for row in data_rows:
+                cell = ws.cell(row=row, column=col_idx)
 
-            sheet_key_mapping = {
-                    "赛卓-安全库存": unmatched_safety,
-                    "赛卓-未交订单": unmatched_unfulfilled,
-                    "赛卓-预测": unmatched_forecast,
-                    "赛卓-成品库存": unmatched_finished,
-                    "赛卓-成品在制": unmatched_in_progress,
-                }
-                
+                if i == 0:
+                    cell.value = ""
+                else:
+                    # 后续月份：填入公式
+                    prev_col_letter = get_column_letter(col_idx - 18)
+                    formula = f"={prev_col_letter}{row}"
+                    cell.value = formula
 
-            try:
-                # 标红未匹配行
-                for sheet_name, unmatched_keys in sheet_key_mapping.items():
-                    if sheet_name in writer.sheets and sheet_name in sheet_field_config:
-                        ws = writer.sheets[sheet_name]
-                        config = sheet_field_config[sheet_name]
-                        field_name = config["field_name"]
-                        header_row = config["header_row"]
-                        col_idx = get_column_index_by_name(ws, field_name, header_row)
-                
-                        if col_idx:
-                            mark_unmatched_keys_on_name(ws, unmatched_keys, name_col=col_idx)
-                        else:
-                            st.warning(f"⚠️ `{sheet_name}` 中未找到字段 `{field_name}`，跳过未匹配标记")
-
-                mark_unmatched_keys_on_name(writer.sheets["汇总"], unmatched_forecast, name_col=3)
-
-
-                """
-                标黄
-                mark_keys_on_sheet(writer.sheets["汇总"], all_mapped_keys, (2, 3, 1))
-                mark_keys_on_sheet(writer.sheets["赛卓-安全库存"], all_mapped_keys, (3, 5, 1))
-                mark_keys_on_sheet(writer.sheets["赛卓-未交订单"], all_mapped_keys, (2, 3, 1))
-                mark_keys_on_sheet(writer.sheets["赛卓-预测"], all_mapped_keys, (1, 2, 3))
-                mark_keys_on_sheet(writer.sheets["赛卓-成品库存"], all_mapped_keys, (2, 3, 1))
-                mark_keys_on_sheet(writer.sheets["赛卓-成品在制"], all_mapped_keys, (4, 5, 3))
-                """
-
-                st.success("✅ 已完成未匹配项标记")
-            except Exception as e:
-                st.warning(f"⚠️ 未匹配标记失败：{e}")
+        # 回货计划调整
+        adjust_return_plan_cols_in_summary = [col for col in summary_preview.columns if "回货计划调整" in col]
 
+        for i, col in enumerate(adjust_return_plan_cols_in_summary):
+            col_idx = summary_preview.columns.get_loc(col) + 1  # 1-based Excel column index
 
+            for row in data_rows:
+                cell = ws.cell(row=row, column=col_idx)
 
-        # ✅ 替换这些指定表的 nan 值为空
-        for sheet_name in ["赛卓-安全库存", "赛卓-预测", "赛卓-新旧料号", "汇总"]:
-            if sheet_name in writer.sheets:
-                clear_nan_cells(writer.sheets[sheet_name])
+                if i == 0:
+                    cell.value = ""
+                else:
+                    # 后续月份：填入公式
+                    prev_col_letter = get_column_letter(col_idx - 1)
+                    col_13_back = get_column_letter(col_idx - 16)
+                    col_8_back = get_column_letter(col_idx - 19)
+                    formula = f"={prev_col_letter}{row} + ({col_13_back}{row} - {col_8_back}{row})"
+
+                    cell.value = formula
+
+        header_row = list(summary_preview.columns)
+        unfulfilled_cols = [col for col in header_row if "未交订单数量" in col or col in ("总未交订单", "历史未交订单数量")]
+        forecast_cols = [col for col in header_row if "预测" in col]
+        finished_cols = [col for col in header_row if col in ("数量_HOLD仓", "数量_成品仓", "数量_半成品仓")]
+
+        merge_header_for_summary(
+            ws, summary_preview,
+            {
+                "安全库存": (" InvWaf", " InvPart"),
+                "未交订单": (unfulfilled_cols[0], unfulfilled_cols[-1]),
+                "预测": (forecast_cols[0], forecast_cols[-1]) if forecast_cols else ("", ""),
+                "成品库存": (finished_cols[0], finished_cols[-1]) if finished_cols else ("", ""),
+                "成品在制": ("成品在制", "半成品在制")
+            }
+        )
+
+        for key, df in sheets.items():
+            writer.write_frame(customer_name(key, customer), df, highlight=self._highlight(key, unmatched))
 
+        if styling:
+            try:
+                # 标红汇总中未匹配的预测行；其余 sheet 已在写入时标红
+                mark_unmatched_keys_on_name(ws, unmatched["预测"], name_col=3)
+
+                notify("success", "✅ 已完成未匹配项标记")
+            except Exception as e:
+                notify("warning", f"⚠️ 未匹配标记失败：{e}")
 
-            output_buffer.seek(0)
-        
+        writer.save(buffer)
+        return buffer.getvalue()
 
+    @staticmethod
+    def _highlight(sheet_name, unmatched):
+        """返回 sheet 的未匹配标红配置 (字段名, 品名列表)，无需标记时返回 None"""
+        if sheet_name not in unmatched or sheet_name not in UNMATCHED_MARK_FIELDS:
+            return None
+        return UNMATCHED_MARK_FIELDS[sheet_name], unmatched[sheet_name]
 
     def _process_date_column(self, df, date_col, date_format):
         if pd.api.types.is_numeric_dtype(df[date_col]):
@@ -702,18 +782,20 @@ class PivotProcessor:
         except:
             return pd.NaT
 
-    def _create_pivot(self, df, config):
+    def _create_pivot(self, df, config, selected_month=None):
         config = config.copy()
         if "date_format" in config:
             config["columns"] = f"{config['columns']}_年月"
 
+        # 降精度的数值列恢复为 64 位后再求和；category 列只保留出现过的取值
         pivoted = pd.pivot_table(
-            df,
+            widen_numeric(df, config["values"]),
             index=config["index"],
             columns=config["columns"],
             values=config["values"],
             aggfunc=config["aggfunc"],
-            fill_value=0
+            fill_value=0,
+            observed=True
         )
 
         pivoted.columns = [f"{col[0]}_{col[1]}" if isinstance(col, tuple) else str(col) for col in pivoted.columns]
@@ -726,7 +808,7 @@ class PivotProcessor:
 
         pivoted = pivoted.reset_index()
 
-        if CONFIG.get("selected_month") and config.get("values") and "未交订单数量" in config.get("values"):
-            st.info(f"📅 合并历史数据至：{CONFIG['selected_month']}")
-            pivoted = process_history_columns(pivoted, config, CONFIG["selected_month"])
+        if selected_month and config.get("values") and "未交订单数量" in config.get("values"):
+            notify("info", f"📅 合并历史数据至：{selected_month}")
+            pivoted = process_history_columns(pivoted, config, selected_month)
         return pivoted
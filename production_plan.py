@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from openpyxl.utils import get_column_letter
@@ -139,6 +140,52 @@ def add_colored_monthly_plan_headers(ws, start_col: int, start_date: datetime, p
 
 
 
+def finished_goods_plan(cube, actual, horizon, inv_part, finished_stock, in_progress) -> dict:
+    """
+    成品投单计划的逐月递推。
+
+    参数:
+    - cube: 含“预测”“未交订单”的 MonthlyCube（品名 × 月份）
+    - actual: 与 cube 品名对齐的下单明细立方体（成品实际投单）
+    - horizon: 计划月份（Period 列表）
+    - inv_part / finished_stock / in_progress: 各品名的安全库存、成品仓库存、成品在制（数组）
+
+    返回:
+    - {Period: 各品名的成品投单计划}
+
+    第一个月 = 安全库存 + 本月需求 + 下月需求 - 成品仓 - 成品在制；
+    之后每月 = 下月需求 + 上月计划 - 本月实际投单（下单明细中当月的回货数量）。需求取 预测 与 未交订单 的较大值。
+    """
+    def demand(period):
+        return np.maximum(cube.get("预测", period), cube.get("未交订单", period))
+
+    plan = {}
+    for idx, period in enumerate(horizon):
+        if idx == 0:
+            plan[period] = inv_part + demand(period) + demand(period + 1) - finished_stock - in_progress
+        else:
+            plan[period] = demand(period + 1) + (plan[period - 1] - actual.get("回货明细_回货数量", period))
+    return plan
+
+
+def semi_finished_plan(plan: dict, semi_in_progress, months: int = None) -> dict:
+    """
+    半成品投单计划：第一个月 = 成品投单计划 - 半成品在制；
+    之后每月 = 本月成品投单计划 + 上月半成品投单计划 - 上月半成品实际投单（与汇总表中的公式一致，实际投单为空按 0 计）。
+
+    参数:
+    - plan: finished_goods_plan 的结果
+    - semi_in_progress: 各品名的半成品在制
+    - months: 只计算前几个月，默认全部
+    """
+    semi = {}
+    previous = None
+    for idx, (period, values) in enumerate(list(plan.items())[:months]):
+        semi[period] = values - semi_in_progress if idx == 0 else values + previous
+        previous = semi[period]
+    return semi
+
+
 def calculate_first_month_plan(df_plan: pd.DataFrame, summary_df: pd.DataFrame, first_month: datetime) -> pd.DataFrame:
     """
     计算第一个月的“成品投单计划”列，考虑安全库存 + max(预测, 订单) + ... - 库存 - 在制
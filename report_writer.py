@@ -0,0 +1,189 @@
+from copy import copy
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import MergedCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from excel_utils import column_widths, standardize, mark_unmatched_keys_on_name
+from pipeline import notify
+
+
+# 写入后端
+OPENPYXL = "openpyxl"  # 内存中完整的 Worksheet，可随意编辑单元格（公式、合并表头、标红）
+STREAM = "stream"      # openpyxl write_only 逐行写出，内存占用与行数无关
+
+# 与 pandas to_excel 的表头样式保持一致
+_THIN = Side(style="thin")
+HEADER_FONT = Font(bold=True)
+HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
+RED_FILL = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
+
+
+def _cell_value(val):
+    """按 pandas to_excel 的规则转换单元格值：缺失值留空，inf 写为字符串"""
+    if pd.api.types.is_scalar(val) and pd.isna(val):
+        return None
+    if isinstance(val, float) and val in (float("inf"), float("-inf")):
+        return "inf" if val > 0 else "-inf"
+    return val
+
+
+def frame_rows(df: pd.DataFrame):
+    """逐行生成 DataFrame 的表头与数据（不含索引）"""
+    yield list(df.columns)
+    for row in df.itertuples(index=False, name=None):
+        yield [_cell_value(val) for val in row]
+
+
+def _style_header(cell):
+    cell.font = HEADER_FONT
+    cell.border = HEADER_BORDER
+    cell.alignment = HEADER_ALIGNMENT
+
+
+def _find_column(df: pd.DataFrame, field_name: str):
+    """在表头中查找字段所在列号（1-based），与 get_column_index_by_name 规则一致"""
+    for idx, col in enumerate(df.columns, 1):
+        if str(col).strip() == field_name:
+            return idx
+    return None
+
+
+class ReportWriter:
+    """
+    报告导出层：按 sheet 选择写入后端。
+
+    - openpyxl：在内存中构建完整 Worksheet，write_frame 返回该 Worksheet 供后续编辑，
+      save 时连同样式、列宽、合并单元格一起写入输出
+    - stream：write_frame 时直接逐行写出，列宽、表头样式、标红在写入时一并处理
+
+    输出工作簿本身是 write_only 模式，只有选择 openpyxl 后端的 sheet 会完整驻留内存。
+    styling=False 时跳过表头样式、列宽计算与标红，只写数据。
+    """
+
+    def __init__(self, default_backend: str = STREAM, backends: dict = None, styling: bool = True):
+        self.default_backend = default_backend
+        self.backends = backends or {}
+        self.styling = styling
+        self.book = Workbook(write_only=True)
+        self.sheets = {}
+        self._scratch_book = None
+        self._styled = []
+
+    def backend_for(self, sheet_name: str) -> str:
+        return self.backends.get(sheet_name, self.default_backend)
+
+    def write_frame(self, sheet_name: str, df: pd.DataFrame, highlight: tuple = None, autofit: bool = True,
+                    startrow: int = 0):
+        """
+        写入 DataFrame（含表头，不含索引）。
+
+        参数:
+        - sheet_name: 工作表名
+        - df: 要写入的数据
+        - highlight: (字段名, 品名列表)，该字段值在列表中的行整行标红
+        - autofit: 是否按内容设置列宽
+        - startrow: 表头之前预留的空行数（同 pandas to_excel），如汇总表的分组标题行
+
+        返回:
+        - openpyxl 后端返回可继续编辑的 Worksheet；stream 后端返回 None
+        """
+        target = self.book.create_sheet(sheet_name)
+        widths = column_widths(df) if autofit and self.styling else []
+
+        name_col, keys = None, set()
+        if highlight and self.styling:
+            field_name, unmatched_keys = highlight
+            name_col = _find_column(df, field_name)
+            keys = set(standardize(key) for key in unmatched_keys)
+            if not name_col:
+                notify("warning", f"⚠️ `{sheet_name}` 中未找到字段 `{field_name}`，跳过未匹配标记")
+
+        if self.backend_for(sheet_name) == OPENPYXL:
+            ws = self._scratch().create_sheet(sheet_name)
+            for _ in range(startrow):
+                ws.append([])
+            for row in frame_rows(df):
+                ws.append(row)
+            if self.styling:
+                for cell in ws[startrow + 1]:
+                    _style_header(cell)
+            for idx, width in enumerate(widths, 1):
+                ws.column_dimensions[get_column_letter(idx)].width = width
+            if name_col:
+                mark_unmatched_keys_on_name(ws, keys, name_col=name_col)
+
+            self._styled.append((target, ws))
+            self.sheets[sheet_name] = ws
+            return ws
+
+        # 列宽必须在写入第一行之前设置
+        for idx, width in enumerate(widths, 1):
+            target.column_dimensions[get_column_letter(idx)].width = width
+
+        for _ in range(startrow):
+            target.append([])
+
+        n_cols = len(df.columns)
+        for row_idx, row in enumerate(frame_rows(df), 1):
+            if row_idx == 1 and self.styling:
+                cells = []
+                for val in row:
+                    cell = WriteOnlyCell(target, value=val)
+                    _style_header(cell)
+                    cells.append(cell)
+                target.append(cells)
+            elif name_col and standardize(row[name_col - 1]) in keys:
+                cells = []
+                for val in row + [None] * (n_cols - len(row)):
+                    cell = WriteOnlyCell(target, value=val)
+                    cell.fill = RED_FILL
+                    cells.append(cell)
+                target.append(cells)
+            else:
+                target.append(row)
+
+        self.sheets[sheet_name] = None
+        return None
+
+    def save(self, buffer):
+        """把 openpyxl 后端的 sheet 复制到输出工作簿并保存"""
+        for target, ws in self._styled:
+            _copy_worksheet(ws, target)
+        self.book.save(buffer)
+
+    def _scratch(self) -> Workbook:
+        if self._scratch_book is None:
+            self._scratch_book = Workbook()
+            self._scratch_book.remove(self._scratch_book.active)
+        return self._scratch_book
+
+
+def _copy_worksheet(ws, target):
+    """将内存中的 Worksheet 逐行写入 write_only Worksheet，保留样式、列宽与合并单元格"""
+    for key, dim in ws.column_dimensions.items():
+        if dim.width:
+            target.column_dimensions[key].width = dim.width
+    for merged_range in ws.merged_cells.ranges:
+        target.merged_cells.add(str(merged_range))
+
+    for row in ws.iter_rows(min_row=1, min_col=1, max_row=ws.max_row, max_col=ws.max_column):
+        cells = []
+        for cell in row:
+            value = None if isinstance(cell, MergedCell) else cell.value
+            if not cell.has_style:
+                cells.append(value)
+                continue
+            out = WriteOnlyCell(target, value=value)
+            out.font = copy(cell.font)
+            out.fill = copy(cell.fill)
+            out.border = copy(cell.border)
+            out.alignment = copy(cell.alignment)
+            out.number_format = cell.number_format
+            out.protection = copy(cell.protection)
+            cells.append(out)
+        target.append(cells)
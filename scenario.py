@@ -0,0 +1,140 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from cube import MonthlyCube
+from pivot_processor import horizon_column, safe_col
+from production_plan import finished_goods_plan, semi_finished_plan
+from report_writer import ReportWriter, STREAM
+
+
+# 可按月调整的字段（对应汇总立方体中的指标）与按品名调整的库存 / 在制字段（对应汇总表列）
+MONTHLY_FIELDS = ["预测", "未交订单"]
+STOCK_FIELDS = ["InvPart", "数量_成品仓", "成品在制", "半成品在制"]
+OVERRIDE_COLUMNS = ["品名", "字段", "月份", "数值"]
+
+KEY_COLUMNS = ["晶圆品名", "规格", "品名"]
+SCENARIO_SHEET = "投单计划模拟"
+OVERRIDES_SHEET = "模拟调整"
+
+
+class PlanScenario:
+    """
+    投单计划模拟（What-if）：保留汇总阶段的计算输入，只重算 成品 / 半成品投单计划。
+
+    - 输入取自 PivotProcessor.plan_inputs（汇总结果与下单明细立方体），构建后不再修改
+    - run 接受对单个品名的调整：预测 / 未交订单按月，库存 / 在制不分月份，数值为调整后的值
+    - 不重新解析、映射、透视或导出工作簿，单次计算为毫秒级
+
+    参数:
+    - summary: summary 阶段的结果
+    - order: 下单明细立方体（detail:下单 阶段的结果）
+    """
+
+    def __init__(self, summary: dict, order: MonthlyCube):
+        preview = summary["summary_preview"]
+        self.keys = preview[KEY_COLUMNS].reset_index(drop=True)
+        self.cube = summary["cube"]
+        self.horizon = list(summary["horizon"])
+        self.actual = order.align(self.cube.products)
+        self.stock = {field: safe_col(preview, field).to_numpy(dtype=float) for field in STOCK_FIELDS}
+        self._rows = {}
+        for pos, name in enumerate(self.keys["品名"].astype(str)):
+            self._rows.setdefault(name, []).append(pos)
+        self.baseline = self.run()
+
+    def products(self) -> list:
+        return list(self._rows)
+
+    def months(self) -> list:
+        """可调整的月份：计划区间及其后一个月（计划读取下月需求），格式 YYYY-MM"""
+        if not self.horizon:
+            return []
+        return [str(period) for period in self.horizon + [self.horizon[-1] + 1]]
+
+    def _parse_overrides(self, overrides) -> list:
+        """校验调整项，返回 [(行号列表, 字段, Period 或 None, 数值)]"""
+        if overrides is None:
+            return []
+        if isinstance(overrides, pd.DataFrame):
+            overrides = overrides.to_dict("records")
+
+        parsed = []
+        for item in overrides:
+            name, field, month, value = (item.get(col) for col in OVERRIDE_COLUMNS)
+            if all(pd.isna(val) or val == "" for val in (name, field, value)):
+                continue  # 编辑表中的空行
+            if str(name) not in self._rows:
+                raise ValueError(f"汇总表中没有品名：{name}")
+            if field not in MONTHLY_FIELDS + STOCK_FIELDS:
+                raise ValueError(f"不支持调整的字段：{field}")
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"`{name}` 的 {field} 数值无效：{value}")
+
+            period = None
+            if field in MONTHLY_FIELDS:
+                try:
+                    period = pd.Period(month, freq="M")
+                except (TypeError, ValueError):
+                    raise ValueError(f"`{name}` 的 {field} 需要指定月份（YYYY-MM）：{month}")
+            parsed.append((self._rows[str(name)], field, period, value))
+        return parsed
+
+    def run(self, overrides=None) -> pd.DataFrame:
+        """
+        按调整项重算投单计划。
+
+        参数:
+        - overrides: 调整项，DataFrame 或 dict 列表，列为 品名 / 字段 / 月份 / 数值
+
+        返回:
+        - 晶圆品名、规格、品名 + 各月 成品投单计划、半成品投单计划 的 DataFrame
+        """
+        cube, stock = self.cube, self.stock
+        parsed = self._parse_overrides(overrides)
+        if parsed:
+            cube = MonthlyCube(self.cube.products, self.cube.periods, list(self.cube.measures),
+                               self.cube.values.copy(), self.cube.dtypes)
+            stock = {field: values.copy() for field, values in self.stock.items()}
+        for rows, field, period, value in parsed:
+            if period is None:
+                stock[field][rows] = value
+            else:
+                values = cube.get(field, period).copy()
+                values[rows] = value
+                cube.set(field, period, values)
+
+        plan = finished_goods_plan(cube, self.actual, self.horizon,
+                                   stock["InvPart"], stock["数量_成品仓"], stock["成品在制"])
+        semi_plan = semi_finished_plan(plan, stock["半成品在制"])
+
+        result = self.keys.copy()
+        for period in self.horizon:
+            result[horizon_column(period, "成品投单计划")] = plan[period]
+            result[horizon_column(period, "半成品投单计划")] = semi_plan[period]
+        return result
+
+    def changes(self, result: pd.DataFrame) -> pd.DataFrame:
+        """与未调整时相比发生变化的品名，附各计划列的变化量"""
+        plan_cols = [col for col in result.columns if col not in KEY_COLUMNS]
+        delta = result[plan_cols].to_numpy() - self.baseline[plan_cols].to_numpy()
+        changed = np.abs(delta).max(axis=1) > 1e-9 if plan_cols else np.zeros(len(result), dtype=bool)
+
+        table = result.loc[changed].copy()
+        for i, col in enumerate(plan_cols):
+            table[f"{col}_变化"] = delta[changed, i]
+        return table.reset_index(drop=True)
+
+    def to_excel(self, result: pd.DataFrame, overrides=None) -> bytes:
+        """导出模拟结果：投单计划模拟 sheet，以及记录调整项的 模拟调整 sheet"""
+        writer = ReportWriter(default_backend=STREAM)
+        writer.write_frame(SCENARIO_SHEET, result)
+        if overrides is not None:
+            overrides = pd.DataFrame(overrides, columns=OVERRIDE_COLUMNS).dropna(how="all")
+            writer.write_frame(OVERRIDES_SHEET, overrides)
+        buffer = io.BytesIO()
+        writer.save(buffer)
+        return buffer.getvalue()
@@ -0,0 +1,146 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from config import CONFIG
+
+
+# 可按其筛选的键字段（与 FIELD_MAPPINGS 中的标准字段名一致）
+SCOPE_FIELDS = ["晶圆品名", "规格", "品名"]
+# 多个取值之间的分隔符：逗号（含全角）、分号、换行
+LIST_SEPARATORS = r"[,，;；\n]+"
+INVISIBLE_CHARS = r"[\s\u200b\u200e\u200f]+"
+
+
+def parse_list(text: str) -> list:
+    """将输入框中的多个取值拆分为列表，忽略空项"""
+    return [item.strip() for item in re.split(LIST_SEPARATORS, text or "") if item.strip()]
+
+
+def normalize_keys(values) -> pd.Series:
+    """与 clean_key_fields 相同的规整：转为字符串并去掉所有空白与不可见字符"""
+    return pd.Series(values, dtype=object).astype(str).str.replace(INVISIBLE_CHARS, "", regex=True)
+
+
+class ProductScope:
+    """
+    报告范围：只保留指定 晶圆品名 / 规格 / 品名，或品名匹配正则表达式的产品，用于快速生成部分产品的草稿报告。
+    各条件之间为“且”，同一字段的多个取值之间为“或”；取值与表中的键列均去掉空白后比较。
+
+    - 含全部键列的核心表（未交订单、成品库存、成品在制）直接按条件筛选
+    - 其余的表（预测、安全库存、明细、CP在制、晶圆库存）的键列命名与核心表不一定一致，
+      按核心表筛选后得到的 品名 / 晶圆品名 集合筛选
+
+    参数:
+    - wafers / specs / products: 晶圆品名 / 规格 / 品名 的取值列表
+    - pattern: 品名需匹配的正则表达式（re.search）
+    - details: 明细表是否同样按范围筛选后直接汇总（草稿不写入明细事实库）
+    """
+
+    def __init__(self, wafers=None, specs=None, products=None, pattern: str = None, details: bool = True):
+        self.details = details
+        self.values = {}
+        for field, items in zip(SCOPE_FIELDS, (wafers, specs, products)):
+            items = set(normalize_keys(list(items or [])))
+            if items:
+                self.values[field] = items
+        self.pattern = pattern or ""
+        try:
+            self._regex = re.compile(self.pattern) if self.pattern else None
+        except re.error as e:
+            raise ValueError(f"品名正则表达式无效：{self.pattern}（{e}）")
+
+    @classmethod
+    def from_config(cls, config: dict = None) -> "ProductScope":
+        """由与 CONFIG["scope"] 结构相同的 dict 构建（如会话中输入的范围），默认取 CONFIG["scope"]"""
+        config = CONFIG.get("scope", {}) if config is None else config
+        return cls(config.get("晶圆品名"), config.get("规格"), config.get("品名"), config.get("pattern"),
+                   config.get("details", True))
+
+    @property
+    def active(self) -> bool:
+        return bool(self.values) or self._regex is not None
+
+    def to_dict(self) -> dict:
+        """条件的确定性表示，用作阶段缓存键"""
+        return {
+            "values": {field: sorted(items) for field, items in self.values.items()},
+            "pattern": self.pattern,
+        }
+
+    def describe(self) -> str:
+        parts = [f"{field}：{'、'.join(sorted(items))}" for field, items in self.values.items()]
+        if self.pattern:
+            parts.append(f"品名匹配：{self.pattern}")
+        return "；".join(parts)
+
+    def _fields(self) -> set:
+        """条件涉及的字段"""
+        fields = set(self.values)
+        if self._regex is not None:
+            fields.add("品名")
+        return fields
+
+    def covers(self, field_map: dict) -> bool:
+        """field_map 是否含有全部条件字段，即可直接按条件筛选"""
+        return self._fields().issubset(field_map)
+
+    def mask(self, df: pd.DataFrame, field_map: dict) -> np.ndarray:
+        """
+        按条件筛选的布尔数组。
+
+        参数:
+        - field_map: {标准字段名: 表中的列名}，只使用其中存在的字段
+        """
+        keep = np.ones(len(df), dtype=bool)
+        for field, items in self.values.items():
+            if field in field_map:
+                keep &= normalize_keys(df[field_map[field]]).isin(items).to_numpy()
+        if self._regex is not None and "品名" in field_map:
+            names = normalize_keys(df[field_map["品名"]])
+            keep &= names.map(lambda name: self._regex.search(name) is not None).to_numpy(dtype=bool)
+        return keep
+
+    def keys(self, frames) -> dict:
+        """
+        范围内的 品名 与 晶圆品名 集合。
+
+        参数:
+        - frames: [(已按条件筛选的 DataFrame, field_map)]，通常为三个核心表
+        """
+        keys = {"品名": set(), "晶圆品名": set()}
+        for df, field_map in frames:
+            if df is None:
+                continue
+            for field in keys:
+                if field in field_map:
+                    keys[field].update(normalize_keys(df[field_map[field]]))
+        return {field: frozenset(items) for field, items in keys.items()}
+
+    def filter(self, df: pd.DataFrame, field_map: dict, keys: dict = None) -> pd.DataFrame:
+        """
+        筛选范围内的行（不修改 df）。
+
+        参数:
+        - field_map: {标准字段名: 表中的列名}
+        - keys: 由 keys() 得到的集合；未提供时直接按条件筛选（只使用表中存在的字段）
+
+        提供 keys 时：有品名列则按品名集合筛选（只按品名 / 正则筛选时，直接匹配条件的品名同样保留），
+        否则有晶圆品名列则按晶圆品名集合筛选，都没有时原样返回。
+        """
+        if df is None or not self.active:
+            return df
+        field_map = {field: col for field, col in field_map.items() if col in df.columns}
+
+        if keys is None:
+            keep = self.mask(df, field_map)
+        elif "品名" in field_map:
+            keep = normalize_keys(df[field_map["品名"]]).isin(keys["品名"]).to_numpy()
+            if self.covers({"品名": field_map["品名"]}):
+                keep |= self.mask(df, {"品名": field_map["品名"]})
+        elif "晶圆品名" in field_map:
+            keep = normalize_keys(df[field_map["晶圆品名"]]).isin(keys["晶圆品名"]).to_numpy()
+        else:
+            return df
+        return df if keep.all() else df[keep].reset_index(drop=True)
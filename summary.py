@@ -1,6 +1,6 @@
 import pandas as pd
 import re
-import streamlit as st
+from pipeline import notify
 from openpyxl.styles import PatternFill
 
 
@@ -95,7 +95,7 @@ def append_forecast_to_summary(summary_df, forecast_df):
     # 提取预测月份列
     month_cols = [col for col in forecast_df.columns if isinstance(col, str) and "预测" in col]
     if not month_cols:
-        st.warning("⚠️ 没有识别到任何预测列，请检查列名是否包含'预测'")
+        notify("warning", "⚠️ 没有识别到任何预测列，请检查列名是否包含'预测'")
         return summary_df, []
 
     # ⚠️ 仅保留 品名 和预测列，避免将多余字段合并到 summary
@@ -135,7 +135,7 @@ def merge_finished_inventory(summary_df, finished_df):
 
     for col in [key_col] + value_cols:
         if col not in finished_df.columns:
-            st.error(f"❌ 缺失列：{col}")
+            notify("error", f"❌ 缺失列：{col}")
             return summary_df, []
 
     # 去重，避免爆炸式合并
@@ -160,7 +160,7 @@ def append_product_in_progress(summary_df, product_in_progress_df, mapping_df):
     参数：
     - summary_df: 汇总表（含“品名”）
     - product_in_progress_df: 透视后的成品在制表，含“产品品名”及数值列
-    - mapping_df: 新旧料号映射表，含“半成品”列
+    - mapping_df: 新旧料号映射表（或其中含半成品的行），含“新品名”“旧品名”“半成品”列
 
     返回：
     - summary_df: 合并了“成品在制”和“半成品在制”的 DataFrame
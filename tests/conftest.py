@@ -0,0 +1,74 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from config import CONFIG  # noqa: E402
+import golden_check  # noqa: E402
+
+
+DATA_DIR = os.path.join(ROOT, "tests", "data")
+INPUT_DIR = os.path.join(DATA_DIR, "inputs")
+GOLDEN_DIR = os.path.join(DATA_DIR, "golden")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_caches(tmp_path_factory):
+    """磁盘缓存（新旧料号编译结果、列宽、上传队列）写到临时目录，明细事实库关闭，测试不改动工作目录"""
+    cache_dir = tmp_path_factory.mktemp("caches")
+    saved = {key: dict(CONFIG[key]) for key in ("mapping_cache", "column_widths", "upload_queue", "fact_store")}
+    CONFIG["mapping_cache"]["dir"] = str(cache_dir / "mapping_cache")
+    CONFIG["column_widths"]["cache"] = str(cache_dir / "column_widths.json")
+    CONFIG["upload_queue"]["dir"] = str(cache_dir / "upload_queue")
+    CONFIG["fact_store"].update(enabled=False, path=str(cache_dir / "facts.sqlite"))
+    yield cache_dir
+    for key, value in saved.items():
+        CONFIG[key].clear()
+        CONFIG[key].update(value)
+
+
+@pytest.fixture(scope="session")
+def golden_meta():
+    return golden_check.load_meta(GOLDEN_DIR)
+
+
+@pytest.fixture(scope="session")
+def golden_inputs(golden_meta):
+    """(core, aux)：随仓库提交的小规模输入"""
+    return golden_check.read_inputs(INPUT_DIR, golden_meta["customer"])
+
+
+@pytest.fixture(scope="session")
+def golden_budgets():
+    return golden_check.load_budgets(GOLDEN_DIR)
+
+
+@pytest.fixture(scope="session")
+def golden_run(golden_meta, golden_inputs):
+    """按基准日期生成两次（第二次的耗时不含首次导入等开销），返回 (报告 bytes, {阶段名: 耗时})"""
+    core, aux = golden_inputs
+    today = datetime.strptime(golden_meta["today"], "%Y-%m-%d")
+    return golden_check.generate(core, aux, golden_meta["customer"], today, repeat=2)
+
+
+@pytest.fixture
+def fake_github():
+    from fake_github import FakeGitHub
+
+    fake = FakeGitHub({"mapping_file.xlsx": b"old mapping", "safety_file.xlsx": b"safety"})
+    fake.api_url = fake.start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def github_client(fake_github):
+    """指向 fake_github 的客户端，不使用下载缓存，重试不等待"""
+    from github_utils import GitHubClient
+
+    return GitHubClient(token="test", api_url=fake_github.api_url, cache_dir=None, backoff_factor=0)
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from fact_store import FactStore
+
+SPEC = {"date": "下单日期", "name": "品名", "values": ["数量"]}
+KEYED_SPEC = dict(SPEC, key=["单号", "序号"])
+
+
+def orders(rows):
+    return pd.DataFrame(rows, columns=["单号", "序号", "下单日期", "品名", "数量", "审核码"])
+
+
+def totals(store, kind="下单明细", spec=SPEC) -> dict:
+    frame = store.cube(kind, spec["values"]).to_frame("数量")
+    return {(name, period): value for (name, period), value in frame.stack().items() if value}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FactStore(str(tmp_path / "facts.sqlite"))
+
+
+BASE = [
+    ["A1", 1, "2025-04-03", "SC1134", 100, "Y"],
+    ["A1", 2, "2025-04-20", "SC2402", 50, "Y"],
+    ["A2", 1, "2025-05-02", "SC1134", 30, "Y"],
+]
+
+
+def test_changed_non_value_field_is_not_counted_twice(store):
+    store.merge("下单明细", orders(BASE), SPEC)
+    changed = [row[:5] + ["N"] for row in BASE]
+    store.merge("下单明细", orders(changed), SPEC)
+
+    assert totals(store) == {("SC1134", "2025-04"): 100, ("SC2402", "2025-04"): 50, ("SC1134", "2025-05"): 30}
+
+
+def test_rows_removed_from_covered_periods_are_deleted(store):
+    store.merge("下单明细", orders(BASE), SPEC)
+    # 新导出只覆盖 2025-05：该月的行被替换，2025-04 保留
+    store.merge("下单明细", orders([["A3", 1, "2025-05-09", "SC2402", 7, "Y"]]), SPEC)
+
+    assert totals(store) == {("SC1134", "2025-04"): 100, ("SC2402", "2025-04"): 50, ("SC2402", "2025-05"): 7}
+
+
+def test_business_key_moves_row_between_periods(store):
+    store.merge("下单明细", orders(BASE), KEYED_SPEC)
+    # A1-2 的日期改到 5 月，本次导出只含 5 月
+    moved = [["A1", 2, "2025-05-11", "SC2402", 50, "Y"], BASE[2]]
+    store.merge("下单明细", orders(moved), KEYED_SPEC)
+
+    assert totals(store, spec=KEYED_SPEC) == {
+        ("SC1134", "2025-04"): 100, ("SC2402", "2025-05"): 50, ("SC1134", "2025-05"): 30,
+    }
+
+
+def test_repeated_merge_is_skipped(store):
+    version = store.merge("下单明细", orders(BASE), SPEC)
+    assert store.merge("下单明细", orders(BASE), SPEC) == version
+    assert totals(store)[("SC1134", "2025-04")] == 100
+
+
+def test_returning_to_an_earlier_file_is_merged_again(store):
+    corrected = [row[:4] + [row[4] + 1, "Y"] for row in BASE]
+    store.merge("下单明细", orders(BASE), SPEC)
+    store.merge("下单明细", orders(corrected), SPEC)
+    store.merge("下单明细", orders(BASE), SPEC)
+
+    assert totals(store) == {("SC1134", "2025-04"): 100, ("SC2402", "2025-04"): 50, ("SC1134", "2025-05"): 30}
@@ -0,0 +1,109 @@
+import pytest
+
+from github_utils import UNCHANGED, UPLOADED, git_blob_sha
+
+
+def test_sync_files_commits_changed_files_once(fake_github, github_client):
+    head = fake_github.head
+    result = github_client.sync_files({
+        "mapping_file.xlsx": b"new mapping",
+        "safety_file.xlsx": b"safety",
+        "pred_file.xlsx": b"forecast",
+    })
+
+    assert result == {"mapping_file.xlsx": UPLOADED, "safety_file.xlsx": UNCHANGED, "pred_file.xlsx": UPLOADED}
+    # 两个 blob + 一个 tree + 一个提交，分支只更新一次
+    assert fake_github.calls["POST"] == 4
+    assert fake_github.calls["PATCH"] == 1
+    assert fake_github.head != head
+    assert fake_github.files == {
+        "mapping_file.xlsx": b"new mapping",
+        "safety_file.xlsx": b"safety",
+        "pred_file.xlsx": b"forecast",
+    }
+
+
+def test_sync_files_skips_unchanged_blobs(fake_github, github_client):
+    head = fake_github.head
+    result = github_client.sync_files({"mapping_file.xlsx": b"old mapping", "safety_file.xlsx": b"safety"})
+
+    assert result == {"mapping_file.xlsx": UNCHANGED, "safety_file.xlsx": UNCHANGED}
+    assert fake_github.calls["POST"] == 0
+    assert fake_github.calls["PATCH"] == 0
+    assert fake_github.head == head
+
+
+def test_upload_skips_unchanged_blob(fake_github, github_client):
+    from io import BytesIO
+
+    assert github_client.upload(BytesIO(b"safety"), "safety_file.xlsx") == UNCHANGED
+    assert fake_github.calls["PUT"] == 0
+    assert github_client.upload(BytesIO(b"new safety"), "safety_file.xlsx") == UPLOADED
+    assert git_blob_sha(fake_github.files["safety_file.xlsx"]) == git_blob_sha(b"new safety")
+
+
+def test_commit_creation_is_not_retried(fake_github, github_client):
+    head = fake_github.head
+    fake_github.fail_next("POST", status=502)
+
+    with pytest.raises(Exception, match="502"):
+        github_client.sync_files({"mapping_file.xlsx": b"new mapping"})
+    assert fake_github.calls["POST"] == 1
+    assert fake_github.calls["PATCH"] == 0
+    assert fake_github.head == head
+
+
+def test_reads_are_retried(fake_github, github_client):
+    fake_github.fail_next("GET", count=2, status=503)
+
+    assert github_client.download("mapping_file.xlsx") == b"old mapping"
+    assert fake_github.statuses[503] == 2
+
+
+def test_unchanged_file_is_served_from_disk_cache(fake_github, tmp_path):
+    from github_utils import GitHubClient
+
+    def client():
+        # 每次新建客户端，确认命中的是磁盘缓存而不是进程内状态
+        return GitHubClient(token="test", api_url=fake_github.api_url, cache_dir=str(tmp_path), backoff_factor=0)
+
+    assert client().download("mapping_file.xlsx") == b"old mapping"
+    assert fake_github.statuses[200] == 1
+
+    assert client().download("mapping_file.xlsx") == b"old mapping"
+    assert fake_github.statuses[304] == 1
+    assert fake_github.statuses[200] == 1
+
+    # 内容变化后 ETag 不再匹配，重新下载并更新缓存
+    fake_github.files["mapping_file.xlsx"] = b"new mapping"
+    assert client().download("mapping_file.xlsx") == b"new mapping"
+    assert fake_github.statuses[200] == 2
+
+
+def test_offline_client_uses_cache_without_requests(fake_github, tmp_path):
+    from github_utils import GitHubClient
+
+    GitHubClient(token="test", api_url=fake_github.api_url, cache_dir=str(tmp_path)).download("safety_file.xlsx")
+    requests_before = sum(fake_github.calls.values())
+
+    offline = GitHubClient(token="test", api_url=fake_github.api_url, cache_dir=str(tmp_path), offline=True)
+    assert offline.download("safety_file.xlsx") == b"safety"
+    assert sum(fake_github.calls.values()) == requests_before
+    with pytest.raises(FileNotFoundError):
+        offline.download("pred_file.xlsx")
+
+
+def test_corrupt_download_does_not_discard_batch(fake_github):
+    from github_utils import GitHubClient, GitHubError
+
+    client = GitHubClient(token="test", api_url=fake_github.api_url, cache_dir=None, backoff_factor=0,
+                          large_file_size=1)
+    fake_github.truncated.add("mapping_file.xlsx")
+
+    with pytest.raises(GitHubError, match="校验失败"):
+        client.download("mapping_file.xlsx")
+
+    files = client.open_many(["mapping_file.xlsx", "safety_file.xlsx", "missing.xlsx"])
+    assert files["mapping_file.xlsx"] is None
+    assert files["missing.xlsx"] is None
+    assert files["safety_file.xlsx"].read() == b"safety"
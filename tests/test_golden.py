@@ -0,0 +1,59 @@
+import os
+
+from conftest import GOLDEN_DIR
+import golden_check
+
+
+def test_inputs_match_recording(golden_meta, golden_inputs):
+    assert golden_check.input_digests(*golden_inputs) == golden_meta["inputs"]
+
+
+def test_report_matches_golden(golden_meta, golden_run):
+    report, _ = golden_run
+    expected = golden_check.golden_report_path(GOLDEN_DIR, golden_meta["customer"])
+    assert os.path.exists(expected)
+    assert golden_check.compare_workbooks(expected, report) == []
+
+
+def test_every_stage_has_budget(golden_run, golden_budgets):
+    _, timings = golden_run
+    missing = [stage for stage in timings if golden_check.stage_budget(stage, golden_budgets) is None]
+    assert missing == []
+
+
+def test_stages_within_budget(golden_run, golden_budgets):
+    _, timings = golden_run
+    table = golden_check.check_budgets(timings, golden_budgets)
+    over = table[table["超出"]]
+    assert over.empty, over.to_string(index=False)
+
+
+def test_compare_workbooks_reports_changed_cell(golden_meta, golden_run, tmp_path):
+    from openpyxl import load_workbook
+
+    report, _ = golden_run
+    path = tmp_path / "changed.xlsx"
+    path.write_bytes(report)
+    book = load_workbook(path)
+    book["汇总"]["D3"] = "changed"
+    book.save(path)
+    diffs = golden_check.compare_workbooks(golden_check.golden_report_path(GOLDEN_DIR, golden_meta["customer"]),
+                                           str(path))
+    assert len(diffs) == 1 and diffs[0].startswith("汇总!D3")
+
+
+def test_horizon_starts_at_current_month_before_forecast(golden_meta, golden_inputs):
+    """基准日期早于第一个预测月（4 月底上传、预测从 5 月开始）时，计划区间仍从当月开始"""
+    import re
+    from datetime import datetime
+    from io import BytesIO
+
+    from openpyxl import load_workbook
+
+    core, aux = golden_inputs
+    report, _ = golden_check.generate(core, aux, golden_meta["customer"], datetime(2025, 4, 28))
+    book = load_workbook(BytesIO(report), read_only=True)
+    header = next(book["汇总"].iter_rows(min_row=2, max_row=2, values_only=True))
+    months = [int(match.group(1)) for match in (re.fullmatch(r"(\d+)_成品投单计划", str(cell)) for cell in header)
+              if match]
+    assert months == list(range(4, 12))
@@ -0,0 +1,92 @@
+import threading
+from io import BytesIO
+from urllib.parse import quote
+
+import pandas as pd
+import pytest
+
+from fake_github import FakeGitHub
+from github_utils import GitHubClient
+from history_loader import HistoryLoader
+
+NAME = "赛卓-预测.xlsx"
+
+
+def workbook(value) -> bytes:
+    buffer = BytesIO()
+    pd.DataFrame({"生产料号": ["SC1134"], "数量": [value]}).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def history_github():
+    fake = FakeGitHub({quote(NAME): workbook(1)})
+    api_url = fake.start()
+    yield fake, GitHubClient(token="test", api_url=api_url, cache_dir=None, backoff_factor=0)
+    fake.stop()
+
+
+def test_finished_prefetch_is_not_resubmitted(history_github):
+    fake, client = history_github
+    loader = HistoryLoader(client)
+
+    loader.prefetch([NAME])
+    first = loader.load(NAME)
+    loader.prefetch([NAME])
+    second = loader.load(NAME)
+
+    assert second is first
+    assert fake.downloads[quote(NAME)] == 1
+
+
+def test_sessions_share_one_prefetch(history_github):
+    fake, client = history_github
+    loader = HistoryLoader(client)
+    loader.prefetch([NAME])
+
+    results = []
+    sessions = [threading.Thread(target=lambda: results.append(loader.load(NAME))) for _ in range(4)]
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join()
+
+    assert len(results) == 4
+    assert all(df is results[0] for df in results)
+    assert results[0]["数量"].tolist() == [1]
+    assert fake.downloads[quote(NAME)] == 1
+
+
+def test_expired_result_is_revalidated(history_github):
+    fake, client = history_github
+    loader = HistoryLoader(client, max_age=0)
+
+    first = loader.load(NAME)
+    # 内容未变化：重新下载但复用按 SHA 缓存的解析结果
+    assert loader.load(NAME) is first
+
+    fake.files[quote(NAME)] = workbook(2)
+    assert loader.load(NAME)["数量"].tolist() == [2]
+    assert fake.downloads[quote(NAME)] == 3
+
+
+def test_failed_prefetch_is_retried(history_github, monkeypatch):
+    fake, client = history_github
+    loader = HistoryLoader(client)
+    fetch = loader._fetch
+    calls = []
+
+    def flaky_fetch(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ConnectionError("network down")
+        return fetch(*args)
+
+    monkeypatch.setattr(loader, "_fetch", flaky_fetch)
+    loader.prefetch([NAME])
+
+    # 失败的预取不再复用，load 重新提交；成功后的结果继续复用
+    assert loader.load(NAME)["数量"].tolist() == [1]
+    loader.prefetch([NAME])
+    assert loader.load(NAME)["数量"].tolist() == [1]
+    assert len(calls) == 2
@@ -0,0 +1,97 @@
+import json
+from datetime import datetime
+from io import BytesIO
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from fake_github import FakeGitHub
+from github_utils import GitHubClient
+from history_loader import HistoryLoader
+from history_store import (COLUMNS_KEY, MANIFEST_PATH, build_history_files, frame_to_parquet, parquet_path,
+                           parquet_to_frame, verified_manifest)
+
+NAME = "赛卓-安全库存.xlsx"
+
+
+def mixed_frame() -> pd.DataFrame:
+    df = pd.DataFrame({
+        "品名": ["SC1134", "SC2402", "SC4643"],
+        "数量": [1.5, np.nan, 3.0],
+        "备注": [1, "文本", None],
+        "日期": [datetime(2025, 5, 1), "待定", np.nan],
+    })
+    df[datetime(2025, 6, 1)] = [True, 2, "x"]
+    df.columns = ["品名", "数量", "备注", "备注", datetime(2025, 6, 1)]
+    return df
+
+
+def xlsx(df: pd.DataFrame) -> bytes:
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def test_mixed_frame_round_trip():
+    df = mixed_frame()
+    restored = parquet_to_frame(BytesIO(frame_to_parquet(df)))
+
+    assert list(restored.columns) == list(df.columns)
+    pd.testing.assert_frame_equal(restored, df)
+    assert [type(val) for val in restored.iloc[:, 2]] == [int, str, type(None)]
+    assert isinstance(restored.iloc[0, 3], datetime)
+
+
+def test_metadata_is_plain_json():
+    table = pq.read_table(BytesIO(frame_to_parquet(mixed_frame())))
+    columns = json.loads(table.schema.metadata[COLUMNS_KEY])
+    assert columns[0] == ["str", "品名"]
+    assert columns[-1] == ["datetime", "2025-06-01T00:00:00"]
+
+
+def test_unknown_type_tag_is_rejected():
+    table = pa.table({"0": ["payload"], "0:type": ["pickle"]}).replace_schema_metadata({
+        COLUMNS_KEY: json.dumps([["str", "a"]]).encode("utf-8"),
+        b"semiexcel:tagged_columns": b'["0"]',
+    })
+    buffer = BytesIO()
+    pq.write_table(table, buffer)
+    buffer.seek(0)
+    with pytest.raises(ValueError):
+        parquet_to_frame(buffer)
+
+
+def test_manifest_entries_must_match_current_source():
+    df = pd.DataFrame({"品名": ["SC1134"]})
+    files = build_history_files({NAME: (df, xlsx(df), 0)})
+    manifest = json.loads(files[MANIFEST_PATH])
+    entry = manifest["files"][NAME]
+
+    assert verified_manifest(manifest, {entry["source"]: entry["source_sha"]})["files"] == {NAME: entry}
+    assert verified_manifest(manifest, {entry["source"]: "0" * 40})["files"] == {}
+    assert verified_manifest(manifest, {})["files"] == {}
+    assert verified_manifest(dict(manifest, version=1), {entry["source"]: entry["source_sha"]}) == {}
+
+
+def test_loader_ignores_parquet_copy_of_replaced_xlsx():
+    old, new = pd.DataFrame({"品名": ["SC1134"]}), pd.DataFrame({"品名": ["SC2402"]})
+    files = {quote(NAME): xlsx(old)}
+    files.update(build_history_files({NAME: (old, files[quote(NAME)], 0)}))
+    fake = FakeGitHub(files)
+    api_url = fake.start()
+    try:
+        client = GitHubClient(token="test", api_url=api_url, cache_dir=None, backoff_factor=0)
+        assert HistoryLoader(client).load(NAME)["品名"].tolist() == ["SC1134"]
+        assert fake.downloads[parquet_path(NAME)] == 1
+        assert fake.downloads[quote(NAME)] == 0
+
+        # 应用之外直接更新了 xlsx：副本的 source_sha 不再匹配，改读 xlsx
+        fake.files[quote(NAME)] = xlsx(new)
+        assert HistoryLoader(client).load(NAME)["品名"].tolist() == ["SC2402"]
+        assert fake.downloads[parquet_path(NAME)] == 1
+    finally:
+        fake.stop()
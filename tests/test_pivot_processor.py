@@ -0,0 +1,16 @@
+from types import SimpleNamespace
+
+import pandas as pd
+
+from pivot_processor import PivotProcessor
+
+
+def test_map_cleans_key_fields_without_mapping():
+    df = pd.DataFrame({"晶圆品名": ["W SC11"], "规格": ["S1134\u200b"], "品名": [" SC1134UA "], "订单数量": [10]})
+    no_mapping = SimpleNamespace(parts=SimpleNamespace(canonical={}))
+
+    mapped = PivotProcessor(fact_store=None)._map("未交订单.xlsx", df, no_mapping)
+
+    assert mapped[["晶圆品名", "规格", "品名"]].iloc[0].tolist() == ["WSC11", "S1134", "SC1134UA"]
+    # 上游阶段的结果在缓存中共享，不能被原地修改
+    assert df["品名"].iloc[0] == " SC1134UA "
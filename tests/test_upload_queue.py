@@ -0,0 +1,34 @@
+import os
+
+from upload_queue import DONE, FAILED, UploadQueue
+
+
+def test_transient_failure_is_retried(fake_github, github_client, tmp_path):
+    fake_github.fail_next("POST", status=502)
+    queue = UploadQueue(queue_dir=str(tmp_path), client=github_client, retry_interval=0)
+
+    queue.enqueue({"pred_file.xlsx": b"forecast"})
+    assert queue.wait(timeout=10)
+
+    job = queue.status()[0]
+    assert job["status"] == DONE
+    assert job["attempts"] == 2
+    assert fake_github.files["pred_file.xlsx"] == b"forecast"
+    assert os.listdir(tmp_path) == []
+
+
+def test_permanent_failure_is_dropped(fake_github, github_client, tmp_path):
+    fake_github.fail_next("GET", status=404)
+    queue = UploadQueue(queue_dir=str(tmp_path), client=github_client, retry_interval=0)
+
+    queue.enqueue({"pred_file.xlsx": b"forecast"})
+    assert queue.wait(timeout=10)
+
+    job = queue.status()[0]
+    assert job["status"] == FAILED
+    assert job["attempts"] == 1
+    assert "404" in job["error"]
+    assert "pred_file.xlsx" not in fake_github.files
+    # 放弃的任务不留在磁盘上，重启后不会再次尝试
+    assert os.listdir(tmp_path) == []
+    assert UploadQueue(queue_dir=str(tmp_path), client=github_client).jobs == {}
@@ -1,8 +1,16 @@
 import streamlit as st
 import pandas as pd
-from config import CONFIG
+from config import CONFIG, OUTPUT_PROFILES, DEFAULT_CUSTOMER
 from dateutil.relativedelta import relativedelta
-from datetime import date
+from datetime import date, datetime
+from urllib.parse import unquote
+from upload_queue import STATUS_LABELS, DONE, FAILED
+from github_utils import UNCHANGED
+from scenario import MONTHLY_FIELDS, STOCK_FIELDS, OVERRIDE_COLUMNS
+from scope import parse_list
+
+
+PREVIEW_PAGE_SIZE = 200
 
 
 def setup_sidebar():
@@ -14,13 +22,71 @@ def setup_sidebar():
         st.markdown("- 上传辅助数据（预测、安全库存、新旧料号）")
         st.markdown("- 自动生成汇总 Excel 文件")
 
+
+def render_upload_status(queue):
+    """
+    在侧边栏显示后台上传队列的状态，每隔几秒自动刷新。
+
+    参数:
+    - queue: UploadQueue
+    """
+    @st.fragment(run_every="5s")
+    def upload_status():
+        jobs = queue.status()
+        st.markdown("### ☁️ GitHub 上传")
+        if not jobs:
+            st.caption("暂无上传任务")
+            return
+        for job in jobs:
+            created = datetime.fromtimestamp(job["created_at"]).strftime("%H:%M:%S")
+            st.markdown(f"**{STATUS_LABELS[job['status']]}**（{created}）")
+            for path in job["paths"]:
+                if job["status"] == DONE:
+                    mark = "⏭️ 未变化" if job["results"].get(path) == UNCHANGED else "✅ 已上传"
+                    st.caption(f"{mark}：{unquote(path)}")
+                else:
+                    st.caption(unquote(path))
+            if job["status"] == FAILED:
+                st.error(f"❌ 上传失败，已放弃该任务：{job['error'][:200]}")
+            elif job["error"]:
+                st.caption(f"⚠️ 第 {job['attempts']} 次上传失败，稍后自动重试：{job['error'][:200]}")
+
+    with st.sidebar:
+        st.markdown("---")
+        upload_status()
+
 def get_uploaded_files():
     st.header("📤 Excel 数据处理与汇总")
 
+    # 🏷️ 客户前缀：上传文件与 GitHub 历史文件均按 "<客户>-<表名>.xlsx" 命名
+    st.text_input("🏷️ 客户前缀", value=DEFAULT_CUSTOMER, key="customer")
+
     # 📅 手动输入历史截止月份
-    manual_month = st.text_input("📅 输入历史数据截止月份（格式: YYYY-MM，可留空表示不筛选）")
-    CONFIG["selected_month"] = manual_month.strip() if manual_month.strip() else None
-    
+    st.text_input("📅 输入历史数据截止月份（格式: YYYY-MM，可留空表示不筛选）", key="selected_month")
+
+    # 📄 输出内容：日常快速核对可跳过原始表和格式化
+    st.selectbox(
+        "📄 输出内容",
+        list(OUTPUT_PROFILES.keys()),
+        format_func=lambda key: OUTPUT_PROFILES[key]["label"],
+        key="output_profile"
+    )
+
+    # 🧮 内存预算模式：大客户数据量大时压缩数值列与低基数文本列
+    st.checkbox(
+        "🧮 内存预算模式（数值降精度、低基数文本转分类）",
+        value=CONFIG["memory_budget"]["enabled"],
+        key="memory_budget"
+    )
+
+    # 🔎 报告范围：只生成部分产品的草稿报告，全部留空表示不筛选
+    with st.expander("🔎 报告范围（草稿报告，可留空）"):
+        st.text_input("晶圆品名（多个用逗号分隔）", key="scope_wafers")
+        st.text_input("规格（多个用逗号分隔）", key="scope_specs")
+        st.text_input("品名（多个用逗号分隔）", key="scope_products")
+        st.text_input("品名正则表达式（如 ^SC24）", key="scope_pattern")
+        st.checkbox("明细表同样按范围筛选（不写入明细事实库）", value=CONFIG["scope"]["details"], key="scope_details")
+
     # 📂 上传主要文件
     uploaded_files = st.file_uploader(
         "📂 上传 5 个核心 Excel 文件（未交订单/成品在制/成品库存/晶圆库存/CP在制）",
@@ -47,3 +113,109 @@ def get_uploaded_files():
     start = st.button("🚀 生成汇总 Excel")
 
     return uploaded_dict, forecast_file, safety_file, mapping_file, arrival_file, order_file, sales_file, start
+
+
+def report_options() -> dict:
+    """
+    本会话的报告选项，取自各控件保存在 st.session_state 中的值；
+    不写入全局 CONFIG，多个会话同时生成报告时互不影响。
+
+    返回:
+    - {"customer": 客户前缀, "selected_month": 历史数据截止月份（YYYY-MM）或 None,
+       "profile": 输出内容（OUTPUT_PROFILES 的键）, "memory_budget": 是否开启内存预算模式,
+       "scope": 报告范围（与 CONFIG["scope"] 结构相同）}
+    """
+    selected_month = (st.session_state.get("selected_month") or "").strip()
+    return {
+        "customer": (st.session_state.get("customer") or "").strip() or DEFAULT_CUSTOMER,
+        "selected_month": selected_month or None,
+        "profile": st.session_state.get("output_profile") or CONFIG["output_profile"],
+        "memory_budget": bool(st.session_state.get("memory_budget", CONFIG["memory_budget"]["enabled"])),
+        "scope": {
+            "晶圆品名": parse_list(st.session_state.get("scope_wafers")),
+            "规格": parse_list(st.session_state.get("scope_specs")),
+            "品名": parse_list(st.session_state.get("scope_products")),
+            "pattern": (st.session_state.get("scope_pattern") or "").strip(),
+            "details": st.session_state.get("scope_details", CONFIG["scope"]["details"]),
+        },
+    }
+
+
+def render_report_preview(frames: dict, page_size: int = PREVIEW_PAGE_SIZE):
+    """
+    预览报告中的各个 sheet：只渲染当前选中的 sheet，并按页显示，
+    避免一次性把所有 sheet 全部渲染到页面上。
+
+    参数:
+    - frames: {sheet 名: DataFrame}，顺序与工作簿一致
+    - page_size: 每页显示的行数
+    """
+    if not frames:
+        return
+
+    sheet_names = list(frames.keys())
+    sheet_name = st.radio("🧾 预览工作表", sheet_names, horizontal=True, key="preview_sheet")
+    df = frames[sheet_name]
+
+    total_pages = max(1, -(-len(df) // page_size))
+    page = st.number_input(
+        f"页码（共 {total_pages} 页，{len(df)} 行）",
+        min_value=1, max_value=total_pages, value=1, step=1,
+        key=f"preview_page_{sheet_name}"
+    )
+    start_row = (page - 1) * page_size
+    page_df = df.iloc[start_row:start_row + page_size]
+
+    st.subheader(f"📄 {sheet_name}")
+    try:
+        st.dataframe(page_df, use_container_width=True)
+    except Exception:
+        # 混合类型列无法直接转换时按字符串显示
+        st.dataframe(page_df.astype(str), use_container_width=True)
+
+
+def render_scenario(scenario):
+    """
+    投单计划模拟：按品名调整预测 / 未交订单（按月）或库存 / 在制，只重算投单计划。
+
+    参数:
+    - scenario: scenario.PlanScenario
+    """
+    with st.expander("🧪 投单计划模拟（What-if）"):
+        st.caption("预测、未交订单需选择月份；InvPart、成品仓、在制不分月份。数值为调整后的值。")
+        overrides = st.data_editor(
+            pd.DataFrame({"品名": pd.Series(dtype=str), "字段": pd.Series(dtype=str),
+                          "月份": pd.Series(dtype=str), "数值": pd.Series(dtype=float)}),
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "品名": st.column_config.SelectboxColumn("品名", options=scenario.products(), required=True),
+                "字段": st.column_config.SelectboxColumn("字段", options=MONTHLY_FIELDS + STOCK_FIELDS, required=True),
+                "月份": st.column_config.SelectboxColumn("月份", options=scenario.months()),
+                "数值": st.column_config.NumberColumn("数值", required=True),
+            },
+            key="scenario_overrides"
+        )[OVERRIDE_COLUMNS]
+
+        if st.button("▶️ 运行模拟"):
+            start = datetime.now()
+            try:
+                result = scenario.run(overrides)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+                return
+            elapsed = (datetime.now() - start).total_seconds()
+            st.session_state["scenario_result"] = {"result": result, "overrides": overrides, "elapsed": elapsed}
+
+        stored = st.session_state.get("scenario_result")
+        if not stored:
+            return
+        changes = scenario.changes(stored["result"])
+        st.success(f"✅ 模拟完成（{stored['elapsed'] * 1000:.0f} ms），投单计划变化的品名：{len(changes)} 个")
+        st.dataframe(changes, use_container_width=True)
+        st.download_button(
+            label="📥 下载模拟结果",
+            data=scenario.to_excel(stored["result"], stored["overrides"]),
+            file_name=f"投单计划模拟_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
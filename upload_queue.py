@@ -0,0 +1,224 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+
+from config import CONFIG
+from github_utils import get_github_client
+
+
+# 任务状态
+PENDING = "pending"        # 等待上传（含失败后等待重试）
+UPLOADING = "uploading"    # 正在上传
+DONE = "done"              # 已提交到 GitHub
+FAILED = "failed"          # 不会自行恢复的错误（如 401 / 404 / 422），已放弃
+STATUS_LABELS = {PENDING: "⏳ 等待上传", UPLOADING: "☁️ 上传中", DONE: "✅ 已完成", FAILED: "❌ 上传失败"}
+
+# 4xx 中可重试的状态码（超时、限流），其余 4xx 重试也不会成功
+RETRY_STATUS = {408, 429}
+
+
+def is_permanent(error: Exception) -> bool:
+    """GitHub 返回除 408 / 429 以外的 4xx：令牌无效、仓库或分支不存在、请求被拒绝等，重试没有意义"""
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and 400 <= status_code < 500 and status_code not in RETRY_STATUS
+
+
+class UploadQueue:
+    """
+    后台上传队列：上传文件先落盘，由后台线程提交到 GitHub，报告生成不再等待上传。
+
+    - 每个任务对应一次 sync_files（多个文件一次提交），保存在 queue_dir/<任务 id>/ 下
+    - 上传失败按指数退避重试；进程重启后从磁盘恢复未完成的任务
+    - 永久错误（见 is_permanent）不重试，任务标记为 FAILED 后丢弃
+    - 已完成或放弃的任务删除磁盘文件，只在内存中保留最近的记录供侧边栏显示
+
+    参数:
+    - queue_dir: 队列目录，默认取 CONFIG["upload_queue"]["dir"]
+    - client: 默认使用共享的 GitHubClient
+    - retry_interval / max_retry_interval: 重试间隔的初始值与上限（秒）
+    """
+
+    def __init__(self, queue_dir: str = None, client=None, retry_interval: float = None,
+                 max_retry_interval: float = None, history_size: int = 20):
+        queue_config = CONFIG.get("upload_queue", {})
+        self.queue_dir = queue_dir or queue_config.get("dir", ".upload_queue")
+        self.retry_interval = retry_interval if retry_interval is not None else queue_config.get("retry_interval", 30)
+        self.max_retry_interval = (max_retry_interval if max_retry_interval is not None
+                                   else queue_config.get("max_retry_interval", 600))
+        self.client = client
+        self.jobs = {}
+        self.finished = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._load()
+
+    # ---------- 持久化 ----------
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.queue_dir, job_id)
+
+    def _save(self, job):
+        path = os.path.join(self._job_dir(job["id"]), "job.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _load(self):
+        """从磁盘恢复未完成的任务；上传中被中断的任务重新置为等待"""
+        if not os.path.isdir(self.queue_dir):
+            return
+        for job_id in sorted(os.listdir(self.queue_dir)):
+            try:
+                with open(os.path.join(self._job_dir(job_id), "job.json"), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            job["status"] = PENDING
+            job["next_try"] = 0
+            self.jobs[job["id"]] = job
+
+    def _read_files(self, job):
+        files = {}
+        for idx, path in enumerate(job["paths"]):
+            with open(os.path.join(self._job_dir(job["id"]), f"{idx}.bin"), "rb") as f:
+                files[path] = f.read()
+        return files
+
+    # ---------- 对外接口 ----------
+
+    def enqueue(self, files: dict, message: str = None) -> str:
+        """
+        将文件加入上传队列并立即返回。
+
+        参数:
+        - files: {仓库中的路径: bytes 内容}
+        - message: 提交说明
+
+        返回:
+        - 任务 id；files 为空时返回 None
+        """
+        if not files:
+            return None
+
+        job_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        job = {
+            "id": job_id,
+            "paths": list(files),
+            "message": message,
+            "status": PENDING,
+            "attempts": 0,
+            "error": None,
+            "results": None,
+            "created_at": time.time(),
+            "next_try": 0,
+        }
+        os.makedirs(self._job_dir(job_id), exist_ok=True)
+        for idx, content in enumerate(files.values()):
+            with open(os.path.join(self._job_dir(job_id), f"{idx}.bin"), "wb") as f:
+                f.write(content)
+        self._save(job)
+
+        with self._lock:
+            self.jobs[job_id] = job
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def status(self) -> list:
+        """返回所有任务的状态（未完成的在前，按创建时间排序）"""
+        with self._lock:
+            active = sorted(self.jobs.values(), key=lambda job: job["created_at"])
+            return [dict(job) for job in active] + [dict(job) for job in reversed(self.finished)]
+
+    def start(self):
+        """启动后台线程（已启动时不重复启动）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="github-upload", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待队列清空，超时返回 False"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._lock:
+                if not self.jobs:
+                    return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    # ---------- 后台线程 ----------
+
+    def _next_job(self):
+        with self._lock:
+            pending = [job for job in self.jobs.values() if job["status"] == PENDING]
+        if not pending:
+            return None, None
+        job = min(pending, key=lambda job: job["created_at"])
+        return job, job["next_try"] - time.time()
+
+    def _run(self):
+        while True:
+            job, delay = self._next_job()
+            if job is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            if delay > 0:
+                # 按创建顺序提交：最早的任务未到重试时间时整体等待
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+            self._process(job)
+
+    def _process(self, job):
+        with self._lock:
+            job["status"] = UPLOADING
+            job["attempts"] += 1
+        try:
+            client = self.client or get_github_client()
+            results = client.sync_files(self._read_files(job), job.get("message"))
+        except Exception as e:
+            if is_permanent(e):
+                self._finish(job, status=FAILED, error=str(e))
+                print(f"❌ 上传失败，不再重试：{job['id']} - {e}")
+                return
+            delay = min(self.retry_interval * 2 ** (job["attempts"] - 1), self.max_retry_interval)
+            with self._lock:
+                job.update(status=PENDING, error=str(e), next_try=time.time() + delay)
+            self._save(job)
+            print(f"⚠️ 上传失败，{delay:.0f} 秒后重试：{job['id']} - {e}")
+            return
+
+        self._finish(job, status=DONE, error=None, results=results)
+
+    def _finish(self, job, **updates):
+        """删除任务的磁盘文件，移入最近完成的记录"""
+        shutil.rmtree(self._job_dir(job["id"]), ignore_errors=True)
+        with self._lock:
+            job.update(updates, finished_at=time.time())
+            self.jobs.pop(job["id"], None)
+            self.finished.append(job)
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_upload_queue() -> UploadQueue:
+    """返回进程内共享的上传队列；首次调用时恢复磁盘上未完成的任务并启动后台线程"""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = UploadQueue()
+            if _default_queue.jobs:
+                _default_queue.start()
+        return _default_queue